@@ -0,0 +1,93 @@
+"""
+Async Runtime Module
+A process-wide event loop running on a background thread, shared by the async
+services and views, with one pooled httpx.AsyncClient bound to it
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import httpx
+from config import Config
+
+
+class EventLoopThread:
+    """Event loop running forever on a daemon thread"""
+
+    def __init__(self, max_connections, timeout):
+        """
+        Start the loop and create its HTTP client
+
+        Args:
+            max_connections: Connections the shared HTTP client opens at most
+            timeout: Seconds before an HTTP request times out
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='event-loop',
+                                        daemon=True)
+        self._thread.start()
+        # The client's connection pool belongs to the loop it is used on
+        self.http = self.run(self._build_http(max_connections, timeout))
+
+    @staticmethod
+    async def _build_http(max_connections, timeout):
+        """Create the shared HTTP client on the loop"""
+        return httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            timeout=timeout
+        )
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the loop from any other thread
+
+        The coroutine runs in a copy of the caller's context, so it reports
+        into the caller's metrics breakdown.
+
+        Returns:
+            concurrent.futures.Future of the coroutine's result
+        """
+        future = concurrent.futures.Future()
+        context = contextvars.copy_context()
+
+        def done(task):
+            if task.cancelled():
+                # The future is already running, so cancel() would be ignored
+                # and leave callers of result() waiting forever
+                future.set_exception(concurrent.futures.CancelledError())
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def start():
+            if future.set_running_or_notify_cancel():
+                self.loop.create_task(coro, context=context).add_done_callback(done)
+            else:
+                coro.close()
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+    def run(self, coro):
+        """Run a coroutine on the loop and block until it finishes"""
+        return self.submit(coro).result()
+
+    async def wait(self, coro):
+        """Await a coroutine on the loop from a different event loop"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+
+_default_loop = None
+_default_loop_lock = threading.Lock()
+
+
+def get_default_loop():
+    """Get the process-wide event loop, started on first use"""
+    global _default_loop
+    with _default_loop_lock:
+        if _default_loop is None:
+            _default_loop = EventLoopThread(Config.ASYNC_HTTP_MAX_CONNECTIONS,
+                                            Config.HTTP_TIMEOUT)
+        return _default_loop
@@ -1,27 +1,294 @@
 """
 Flask Application for Spotify to YouTube Playlist Converter
 """
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import (Flask, Response, render_template, request, redirect, url_for, session,
+                   jsonify, stream_with_context)
 from config import Config
 from spotify_service import SpotifyService
-from youtube_service import YouTubeService
+from youtube_service import YouTubeService, credentials_to_token, get_discovery_document
+from jobs import AdmissionError, JobManager
+from client_pool import ClientPool
+from playlist_sync import get_default_store, sync_playlist
+import bulk
+import checkpoints
+import fair
+import metrics
+import playlist_cache
+import tokens
+import asyncio
+import json
 import os
+import queue
+import uuid
 
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = Config.SECRET_KEY
 
-# Initialize services
+# Services used only for the OAuth flows; API calls go through per-user clients
 spotify_service = SpotifyService()
 youtube_service = YouTubeService()
+token_store = tokens.get_default_store()
+client_pool = ClientPool(Config.CLIENT_POOL_SIZE, Config.CLIENT_POOL_IDLE_TTL, token_store)
+job_manager = JobManager(Config.CONVERSION_WORKERS, Config.JOB_RETENTION,
+                         max_active=Config.MAX_ACTIVE_CONVERSIONS,
+                         max_per_owner=Config.MAX_CONVERSIONS_PER_USER,
+                         retry_after=Config.ADMISSION_RETRY_AFTER)
+# Song searches of every threaded conversion, taking turns by user
+song_executor = fair.get_default_executor()
+
+metrics.Gauge('converter_youtube_quota_remaining_units',
+              'YouTube Data API quota units left today in this process',
+              youtube_service.scheduler.remaining)
+metrics.Gauge('converter_search_singleflight',
+              'Search coalescing counters: calls, executions, coalesced and remote',
+              youtube_service.flights.stats, label='kind')
+metrics.Gauge('converter_client_pool_size', 'Per-user API clients currently pooled',
+              client_pool.size)
+metrics.Gauge('converter_youtube_http_idle', 'Idle keep-alive YouTube transports pooled',
+              youtube_service.http_pool.idle_count)
+metrics.Gauge('converter_active_jobs', 'Conversion jobs queued or running',
+              job_manager.active_count)
+metrics.Gauge('converter_song_queue', 'Song searches waiting for a worker',
+              song_executor.queued)
+
+
+def warmup():
+    """
+    Load everything requests need ahead of the first one
+    
+    Importing the app only loads what it needs to start serving. gunicorn.conf.py
+    calls this in the master process before forking workers, so they share the
+    loaded modules and parsed discovery document copy-on-write instead of each
+    loading them on its first requests. Threads don't survive fork(), so the
+    event loop is still started by each worker on first use.
+    """
+    import async_services
+    import google_auth_oauthlib.flow
+    
+    get_discovery_document()
+    spotify_service.sp_oauth
+    playlist_cache.get_default_cache()
+
+
+def get_session_id():
+    """Get a stable identifier for the current browser session"""
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return session['sid']
+
+
+def is_connected(provider):
+    """Check whether the current session has a stored token for a provider"""
+    sid = session.get('sid')
+    return sid is not None and token_store.load(sid, provider) is not None
+
+
+def too_busy(error):
+    """Respond to a conversion turned away by admission control"""
+    response = jsonify({'error': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def run_conversion(job, spotify, youtube, playlist_id, checkpoint=None):
+    """
+    Convert a Spotify playlist to YouTube inside a background job
+    
+    Args:
+        job: ConversionJob receiving progress updates
+        spotify: SpotifyService authenticated for the job's user
+        youtube: YouTubeService authenticated for the job's user
+        playlist_id: The Spotify playlist ID
+        checkpoint: Claimed Checkpoint of an interrupted conversion to resume,
+            or None to start a new one
+    
+    Returns:
+        Dict describing the converted playlist
+    """
+    # Get playlist details; tracks stream in while YouTube work starts
+    playlist_details = spotify.get_playlist_details(playlist_id)
+    job.set_total(playlist_details['total_tracks'])
+    resumed = checkpoint is not None
+    
+    try:
+        if checkpoint is None:
+            checkpoint = checkpoints.get_default_store().create(
+                youtube.get_channel_id(),
+                playlist_id,
+                f"{playlist_details['name']} (from Spotify)",
+                f"Converted from Spotify playlist. Original had {playlist_details['total_tracks']} tracks."
+            )
+        remaining = max(playlist_details['total_tracks'] - checkpoint.added_count(), 0)
+        job.set_quota(youtube.predict_quota(remaining))
+        tracks = spotify.iter_playlist_track_records(playlist_id)
+        
+        result = youtube.create_playlist_from_songs(
+            checkpoint.name,
+            tracks,
+            checkpoint.description,
+            progress_callback=job.record,
+            checkpoint=checkpoint,
+            executor=song_executor.for_owner(job.owner)
+        )
+        checkpoint.finish(completed=not result['quota_exceeded'])
+    finally:
+        if checkpoint is not None:
+            checkpoint.release()
+    # Unavailable tracks are skipped, so the final count can be lower
+    job.set_total(result['total_songs'])
+    
+    return conversion_result(checkpoint, result, resumed)
+
+
+async def run_conversion_async(job, spotify, youtube, playlist_id):
+    """
+    Convert a Spotify playlist to YouTube on the shared event loop
+    
+    Args:
+        job: ConversionJob receiving progress updates
+        spotify: AsyncSpotifyService for the job's user
+        youtube: AsyncYouTubeService for the job's user
+        playlist_id: The Spotify playlist ID
+    
+    Returns:
+        Dict describing the converted playlist
+    """
+    playlist_details = await spotify.get_playlist_details(playlist_id)
+    job.set_total(playlist_details['total_tracks'])
+    owner = await youtube.get_channel_id()
+    checkpoint = await asyncio.to_thread(
+        checkpoints.get_default_store().create,
+        owner,
+        playlist_id,
+        f"{playlist_details['name']} (from Spotify)",
+        f"Converted from Spotify playlist. Original had {playlist_details['total_tracks']} tracks."
+    )
+    
+    try:
+        job.set_quota(youtube.predict_quota(playlist_details['total_tracks']))
+        tracks = await spotify.get_playlist_track_records(playlist_id)
+        result = await youtube.create_playlist_from_songs(
+            checkpoint.name,
+            tracks,
+            checkpoint.description,
+            progress_callback=job.record,
+            checkpoint=checkpoint
+        )
+        await asyncio.to_thread(checkpoint.finish, not result['quota_exceeded'])
+    finally:
+        checkpoint.release()
+    job.set_total(result['total_songs'])
+    
+    return conversion_result(checkpoint, result, resumed=False)
+
+
+def conversion_result(checkpoint, result, resumed):
+    """Describe a finished conversion of one playlist for its job result"""
+    return {
+        'success': True,
+        'mode': 'convert',
+        'conversion_id': checkpoint.id,
+        'resumed': resumed,
+        'playlist_id': result['playlist_id'],
+        'playlist_url': f"https://www.youtube.com/playlist?list={result['playlist_id']}",
+        'total_songs': result['total_songs'],
+        'added_count': result['added_count'],
+        'failed_songs': result['failed_songs'],
+        'cache_hits': result['cache_hits'],
+        'cache_misses': result['cache_misses'],
+        'quota_exceeded': result['quota_exceeded'],
+        'results': result['results']
+    }
+
+
+def run_resume(job, spotify, youtube, checkpoint):
+    """
+    Continue an interrupted conversion inside a background job
+    
+    Returns:
+        Dict describing the converted playlist
+    """
+    return run_conversion(job, spotify, youtube, checkpoint.spotify_playlist_id, checkpoint)
+
+
+def run_sync(job, spotify, youtube, playlist_id):
+    """
+    Sync a previously converted Spotify playlist inside a background job
+    
+    Returns:
+        Dict describing the synced playlist
+    """
+    # Show the playlist's size while the sync runs, not only once it's done
+    playlist_details = spotify.get_playlist_details(playlist_id)
+    job.set_total(playlist_details['total_tracks'])
+    
+    result = sync_playlist(spotify, youtube, get_default_store(), playlist_id,
+                           progress_callback=job.record,
+                           executor=song_executor.for_owner(job.owner),
+                           details=playlist_details,
+                           checkpoint_store=checkpoints.get_default_store())
+    job.set_total(result['total_songs'])
+    
+    return {
+        'success': True,
+        'mode': 'sync',
+        'unchanged': result['unchanged'],
+        'playlist_id': result['playlist_id'],
+        'playlist_url': f"https://www.youtube.com/playlist?list={result['playlist_id']}",
+        'total_songs': result['total_songs'],
+        'added_count': result['added_count'],
+        'removed_count': result['removed_count'],
+        'failed_songs': result['failed_songs'],
+        'cache_hits': result['cache_hits'],
+        'cache_misses': result['cache_misses'],
+        'quota_exceeded': result['quota_exceeded'],
+        'results': result['results']
+    }
+
+
+def run_bulk_conversion(job, spotify, youtube, playlist_ids):
+    """
+    Convert several Spotify playlists to YouTube inside a background job
+    
+    Args:
+        job: ConversionJob receiving progress updates
+        spotify: SpotifyService authenticated for the job's user
+        youtube: YouTubeService authenticated for the job's user
+        playlist_ids: Spotify playlist IDs, or None for all of the user's playlists
+    
+    Returns:
+        Dict describing the converted playlists
+    """
+    playlists = bulk.load_playlists(spotify, playlist_ids)
+    total_songs = sum(len(playlist['tracks']) for playlist in playlists)
+    job.set_total(total_songs)
+    job.set_quota(youtube.predict_quota(total_songs, bulk.count_unique(playlists),
+                                        playlist_count=len(playlists)))
+    
+    result = bulk.convert_playlists(youtube, checkpoints.get_default_store(), playlists,
+                                    progress_callback=job.record,
+                                    executor=song_executor.for_owner(job.owner))
+    
+    return {
+        'success': True,
+        'mode': 'bulk',
+        'playlists': result['playlists'],
+        'total_songs': result['total_songs'],
+        'unique_songs': result['unique_songs'],
+        'added_count': result['added_count'],
+        'failed_count': result['failed_count'],
+        'quota_exceeded': result['quota_exceeded']
+    }
 
 
 @app.route('/')
 def index():
     """Home page"""
     return render_template('index.html',
-                         spotify_connected=session.get('spotify_token') is not None,
-                         youtube_connected=session.get('youtube_credentials') is not None)
+                         spotify_connected=is_connected(tokens.SPOTIFY),
+                         youtube_connected=is_connected(tokens.YOUTUBE))
 
 
 @app.route('/connect/spotify')
@@ -42,9 +309,11 @@ def spotify_callback():
     
     if code:
         try:
-            token = spotify_service.get_access_token(code)
-            session['spotify_token'] = token
-            spotify_service.set_access_token(token)
+            sid = get_session_id()
+            token_store.save(sid, tokens.SPOTIFY, spotify_service.get_token_info(code))
+            # The session may have switched Spotify accounts
+            client_pool.discard_spotify(sid)
+            playlist_cache.get_default_cache().invalidate(sid)
             return redirect(url_for('index'))
         except Exception as e:
             return f"Error: {str(e)}", 500
@@ -77,16 +346,13 @@ def youtube_callback():
                 return "State mismatch error", 400
             
             credentials = youtube_service.get_credentials(code, state)
-            # Store credentials in session (in production, use a proper storage)
-            session['youtube_credentials'] = {
-                'token': credentials.token,
-                'refresh_token': credentials.refresh_token,
-                'token_uri': credentials.token_uri,
-                'client_id': credentials.client_id,
-                'client_secret': credentials.client_secret,
-                'scopes': credentials.scopes
-            }
-            youtube_service.set_credentials(credentials)
+            # Tokens stay on the server, the cookie only carries the session ID
+            sid = get_session_id()
+            token_store.save(sid, tokens.YOUTUBE, credentials_to_token(credentials))
+            session.pop('youtube_state', None)
+            # Prebuild the user's client so the first conversion doesn't pay for it
+            client_pool.discard_youtube(sid)
+            client_pool.youtube(sid)
             return redirect(url_for('index'))
         except Exception as e:
             return f"Error: {str(e)}", 500
@@ -95,38 +361,62 @@ def youtube_callback():
 
 
 @app.route('/playlists')
-def get_playlists():
-    """Get user's Spotify playlists"""
-    if 'spotify_token' not in session:
+async def get_playlists():
+    """
+    Get user's Spotify playlists
+    
+    The list is cached per user for Config.PLAYLIST_CACHE_TTL seconds. The
+    optional limit and offset query parameters select a page, and the total
+    is sent in the X-Total-Count header. The ETag changes with the playlists'
+    snapshot IDs, so a matching If-None-Match gets a 304.
+    """
+    if not is_connected(tokens.SPOTIFY):
         return jsonify({'error': 'Not connected to Spotify'}), 401
     
     try:
-        spotify_service.set_access_token(session['spotify_token'])
-        playlists = spotify_service.get_user_playlists()
-        
-        # Format playlists for display
-        formatted_playlists = [
-            {
-                'id': pl['id'],
-                'name': pl['name'],
-                'tracks': pl['tracks']['total'],
-                'image': pl['images'][0]['url'] if pl['images'] else None
-            }
-            for pl in playlists
-        ]
-        
-        return jsonify(formatted_playlists)
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or offset'}), 400
+    if offset < 0 or (limit is not None and limit < 1):
+        return jsonify({'error': 'Invalid limit or offset'}), 400
+    
+    sid = get_session_id()
+    cache = playlist_cache.get_default_cache()
+    try:
+        playlists = cache.peek(sid)
+        if playlists is None:
+            from async_services import AsyncSpotifyService
+            import aio
+            
+            spotify = AsyncSpotifyService(token_store, sid)
+            fetched = await aio.get_default_loop().wait(spotify.get_user_playlists())
+            playlists = cache.put(sid, fetched)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    response = jsonify(playlists.page(offset, limit))
+    response.headers['X-Total-Count'] = str(len(playlists.playlists))
+    # Browsers revalidate every load, which the cache answers without Spotify
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(f"{playlists.version}-{offset}-{limit or ''}")
+    return response.make_conditional(request)
 
 
 @app.route('/convert', methods=['POST'])
-def convert_playlist():
-    """Convert a Spotify playlist to YouTube"""
-    if 'spotify_token' not in session:
+async def convert_playlist():
+    """
+    Queue conversion of a Spotify playlist to YouTube
+    
+    With "sync": true in the body, a previous conversion of the playlist is
+    updated in place instead of creating a new YouTube playlist. Otherwise,
+    with Config.ASYNC_CONVERSIONS set, the conversion runs on the shared
+    event loop rather than a conversion worker thread.
+    """
+    if not is_connected(tokens.SPOTIFY):
         return jsonify({'error': 'Not connected to Spotify'}), 401
     
-    if 'youtube_credentials' not in session:
+    if not is_connected(tokens.YOUTUBE):
         return jsonify({'error': 'Not connected to YouTube'}), 401
     
     data = request.json
@@ -135,61 +425,194 @@ def convert_playlist():
     if not playlist_id:
         return jsonify({'error': 'No playlist_id provided'}), 400
     
+    sid = get_session_id()
+    run_async = Config.ASYNC_CONVERSIONS and not data.get('sync')
     try:
-        # Set up services
-        spotify_service.set_access_token(session['spotify_token'])
-        
-        # Reconstruct YouTube credentials from session
-        from google.oauth2.credentials import Credentials
-        creds_data = session['youtube_credentials']
-        credentials = Credentials(
-            token=creds_data['token'],
-            refresh_token=creds_data.get('refresh_token'),
-            token_uri=creds_data['token_uri'],
-            client_id=creds_data['client_id'],
-            client_secret=creds_data['client_secret'],
-            scopes=creds_data['scopes']
-        )
-        youtube_service.set_credentials(credentials)
-        
-        # Get playlist details and tracks
-        playlist_details = spotify_service.get_playlist_details(playlist_id)
-        tracks = spotify_service.get_playlist_tracks(playlist_id)
-        
-        # Create YouTube playlist
-        youtube_playlist_name = f"{playlist_details['name']} (from Spotify)"
-        description = f"Converted from Spotify playlist. Original had {len(tracks)} tracks."
-        
-        result = youtube_service.create_playlist_from_songs(
-            youtube_playlist_name,
-            tracks,
-            description
-        )
-        
-        return jsonify({
-            'success': True,
-            'playlist_id': result['playlist_id'],
-            'playlist_url': f"https://www.youtube.com/playlist?list={result['playlist_id']}",
-            'total_songs': result['total_songs'],
-            'added_count': result['added_count'],
-            'failed_songs': result['failed_songs']
-        })
+        if run_async:
+            from async_services import AsyncSpotifyService, AsyncYouTubeService
+            
+            spotify = AsyncSpotifyService(token_store, sid)
+            youtube = AsyncYouTubeService(token_store, sid)
+        else:
+            spotify = client_pool.spotify(sid)
+            youtube = client_pool.youtube(sid)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    try:
+        if run_async:
+            job = job_manager.submit_async(sid, run_conversion_async, spotify, youtube,
+                                           playlist_id)
+        else:
+            run = run_sync if data.get('sync') else run_conversion
+            job = job_manager.submit(sid, run, spotify, youtube, playlist_id)
+    except AdmissionError as e:
+        return too_busy(e)
+    
+    return jsonify({
+        'job_id': job.id,
+        'status_url': url_for('get_job', job_id=job.id),
+        'stream_url': url_for('stream_conversion', job_id=job.id)
+    }), 202
+
+
+@app.route('/convert/bulk', methods=['POST'])
+def convert_playlists():
+    """
+    Queue conversion of several Spotify playlists to YouTube
+    
+    The body holds either playlist_ids, a list of Spotify playlist IDs, or
+    "all": true to convert every playlist of the user. Songs shared between
+    the playlists are only searched once.
+    """
+    if not is_connected(tokens.SPOTIFY):
+        return jsonify({'error': 'Not connected to Spotify'}), 401
+    
+    if not is_connected(tokens.YOUTUBE):
+        return jsonify({'error': 'Not connected to YouTube'}), 401
+    
+    data = request.json
+    if data.get('all'):
+        playlist_ids = None
+    else:
+        playlist_ids = data.get('playlist_ids')
+        if not playlist_ids or not isinstance(playlist_ids, list):
+            return jsonify({'error': 'No playlist_ids provided'}), 400
+    
+    try:
+        spotify = client_pool.spotify(get_session_id())
+        youtube = client_pool.youtube(get_session_id())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    try:
+        job = job_manager.submit(get_session_id(), run_bulk_conversion, spotify, youtube,
+                                 playlist_ids)
+    except AdmissionError as e:
+        return too_busy(e)
     
+    return jsonify({
+        'job_id': job.id,
+        'status_url': url_for('get_job', job_id=job.id),
+        'stream_url': url_for('stream_conversion', job_id=job.id)
+    }), 202
+
+
+@app.route('/convert/resume', methods=['POST'])
+def resume_conversion():
+    """
+    Queue the continuation of an interrupted conversion
+    
+    The body names either a conversion_id from an earlier result or a
+    playlist_id, which resumes the latest unfinished conversion of that
+    playlist. Songs already resolved are not searched again and songs
+    already inserted are not inserted again.
+    """
+    if not is_connected(tokens.SPOTIFY):
+        return jsonify({'error': 'Not connected to Spotify'}), 401
+    
+    if not is_connected(tokens.YOUTUBE):
+        return jsonify({'error': 'Not connected to YouTube'}), 401
+    
+    data = request.json
+    conversion_id = data.get('conversion_id')
+    playlist_id = data.get('playlist_id')
+    
+    if not conversion_id and not playlist_id:
+        return jsonify({'error': 'No conversion_id or playlist_id provided'}), 400
+    
+    try:
+        spotify = client_pool.spotify(get_session_id())
+        youtube = client_pool.youtube(get_session_id())
+        checkpoint = checkpoints.get_default_store().resume(
+            youtube.get_channel_id(),
+            conversion_id=conversion_id,
+            spotify_playlist_id=playlist_id
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    if checkpoint is None:
+        return jsonify({'error': 'No interrupted conversion found'}), 404
+    
+    try:
+        job = job_manager.submit(get_session_id(), run_resume, spotify, youtube, checkpoint)
+    except AdmissionError as e:
+        # Leave the conversion free to be resumed by the retry
+        checkpoint.release()
+        return too_busy(e)
+    
+    return jsonify({
+        'job_id': job.id,
+        'conversion_id': checkpoint.id,
+        'status_url': url_for('get_job', job_id=job.id),
+        'stream_url': url_for('stream_conversion', job_id=job.id)
+    }), 202
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Report progress of a conversion job"""
+    job = job_manager.get(job_id, session.get('sid'))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.to_dict())
+
+
+@app.route('/convert/stream')
+def stream_conversion():
+    """Stream per-song progress of a conversion job as Server-Sent Events"""
+    job = job_manager.get(request.args.get('job_id'), session.get('sid'))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        events = job.subscribe()
+        try:
+            while True:
+                try:
+                    event, data = events.get(timeout=Config.SSE_KEEPALIVE)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event in ('complete', 'error'):
+                    break
+        finally:
+            job.unsubscribe(events)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Expose per-stage latency, call, error and quota metrics for Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/disconnect/spotify')
 def disconnect_spotify():
     """Disconnect Spotify"""
-    session.pop('spotify_token', None)
+    sid = get_session_id()
+    token_store.delete(sid, tokens.SPOTIFY)
+    client_pool.discard_spotify(sid)
+    playlist_cache.get_default_cache().invalidate(sid)
     return redirect(url_for('index'))
 
 
 @app.route('/disconnect/youtube')
 def disconnect_youtube():
     """Disconnect YouTube"""
-    session.pop('youtube_credentials', None)
+    sid = get_session_id()
+    token_store.delete(sid, tokens.YOUTUBE)
+    client_pool.discard_youtube(sid)
     session.pop('youtube_state', None)
     return redirect(url_for('index'))
 
@@ -197,4 +620,5 @@ def disconnect_youtube():
 if __name__ == '__main__':
     # Only enable debug mode if explicitly set in environment
     debug_mode = os.environ.get('FLASK_ENV') == 'development'
+    warmup()
     app.run(debug=debug_mode, port=5000)
@@ -0,0 +1,456 @@
+"""
+Async Services Module
+asyncio counterparts of SpotifyService and YouTubeService, built on the shared
+httpx client so a conversion waiting on the network holds no thread
+"""
+import asyncio
+from collections import deque
+import httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+from spotipy.exceptions import SpotifyException
+import aio
+from config import Config
+import metrics
+from quota import INSERT_COST, LIST_COST, SEARCH_COST, QuotaExceededError, get_default_scheduler
+from singleflight import get_default_async_group
+from spotify_service import (PLAYLIST_PAGE_SIZE, TRACK_FIELDS, TRACK_PAGE_SIZE,
+                             StoredTokenManager, track_record)
+from tokens import YOUTUBE
+from video_cache import get_default_cache
+from video_index import get_default_index
+from youtube_service import (SongResults, StoredCredentials, duration_params, first_video,
+                             match_cache_key, match_flight_key, pick_match, search_candidates,
+                             search_params, set_durations, video_flight_key)
+
+
+SPOTIFY_API_URL = 'https://api.spotify.com/v1/'
+YOUTUBE_API_URL = 'https://www.googleapis.com/youtube/v3/'
+
+# Retries of rate-limited and failed Spotify requests, as spotipy does them
+SPOTIFY_RETRY_STATUSES = (429, 500, 502, 503, 504)
+SPOTIFY_MAX_RETRIES = 3
+SPOTIFY_BACKOFF_BASE = 0.3
+
+
+class AsyncSpotifyService:
+    """Async Spotify Web API client for one session"""
+
+    def __init__(self, store, sid):
+        """
+        Initialize the client
+
+        Args:
+            store: TokenStore holding the session's token
+            sid: Session ID the token belongs to
+        """
+        self.http = aio.get_default_loop().http
+        self.tokens = StoredTokenManager(store, sid)
+
+    async def _get(self, path, params=None, stage='spotify_page'):
+        """GET an API path, retrying 429s and server errors"""
+        # The token store is SQLite and may refresh over HTTP, keep it off the loop
+        token = await asyncio.to_thread(self.tokens.get_access_token)
+        attempt = 0
+        while True:
+            with metrics.timed(stage):
+                response = await self.http.get(SPOTIFY_API_URL + path, params=params,
+                                               headers={'Authorization': f'Bearer {token}'})
+            if (response.status_code not in SPOTIFY_RETRY_STATUSES
+                    or attempt >= SPOTIFY_MAX_RETRIES):
+                break
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after else SPOTIFY_BACKOFF_BASE * 2 ** attempt
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        if response.status_code >= 400:
+            raise SpotifyException(response.status_code, -1,
+                                   f"{response.url}:\n {response.text}",
+                                   headers=dict(response.headers))
+        return response.json()
+
+    async def _get_pages(self, path, params, page_size):
+        """
+        Fetch every page of a paginated endpoint
+
+        The first page reports the total, the remaining pages are then
+        fetched concurrently, Config.SPOTIFY_PAGE_WORKERS at a time.
+
+        Returns:
+            Pages in offset order
+        """
+        first_page = await self._get(path, dict(params, limit=page_size, offset=0))
+        slots = asyncio.Semaphore(max(1, Config.SPOTIFY_PAGE_WORKERS))
+
+        async def fetch(offset):
+            async with slots:
+                return await self._get(path, dict(params, limit=page_size, offset=offset))
+
+        pages = await asyncio.gather(*(fetch(offset) for offset in
+                                       range(page_size, first_page['total'], page_size)))
+        return [first_page] + list(pages)
+
+    async def get_user_playlists(self):
+        """Fetch all playlists for the authenticated user"""
+        pages = await self._get_pages('me/playlists', {}, PLAYLIST_PAGE_SIZE)
+        return [playlist for page in pages for playlist in page['items']]
+
+    async def get_playlist_track_records(self, playlist_id):
+        """
+        Fetch the tracks of a playlist as structured records
+
+        Returns:
+            List of records, see spotify_service.track_record
+        """
+        pages = await self._get_pages(
+            f'playlists/{playlist_id}/tracks',
+            {'fields': TRACK_FIELDS, 'additional_types': 'track'},
+            TRACK_PAGE_SIZE
+        )
+        return [track_record(item['track'])
+                for page in pages for item in page['items'] if item['track']]
+
+    async def get_playlist_tracks(self, playlist_id):
+        """
+        Fetch all tracks from a specific playlist
+
+        Returns:
+            List of song strings in format "Artist - Track Name"
+        """
+        return [record['query'] for record in await self.get_playlist_track_records(playlist_id)]
+
+    async def get_playlist_details(self, playlist_id):
+        """Get playlist details including name and description"""
+        playlist = await self._get(f'playlists/{playlist_id}',
+                                   {'fields': 'name,description,snapshot_id,tracks.total'},
+                                   stage='spotify_playlist')
+        return {
+            'name': playlist['name'],
+            'description': playlist.get('description', ''),
+            'snapshot_id': playlist.get('snapshot_id'),
+            'total_tracks': playlist['tracks']['total']
+        }
+
+
+class AsyncYouTubeService:
+    """
+    Async YouTube Data API client for one session
+
+    Calls go through the same quota scheduler and video cache as
+    YouTubeService, so both count against one budget and share results, and
+    lookups build and read their requests with the same helpers.
+    """
+
+    def __init__(self, store, sid):
+        """
+        Initialize the client
+
+        Args:
+            store: TokenStore holding the session's token
+            sid: Session ID the token belongs to
+        """
+        data = store.load(sid, YOUTUBE)
+        if data is None:
+            raise Exception("Not authenticated with YouTube")
+        self.credentials = StoredCredentials(store, sid, data)
+        self.http = aio.get_default_loop().http
+        self.cache = get_default_cache()
+        self.index = get_default_index()
+        self.scheduler = get_default_scheduler()
+        self.flights = get_default_async_group()
+        self._channel_id = None
+
+    def predict_quota(self, song_count):
+        """Predict whether converting song_count songs fits in today's quota"""
+        return self.scheduler.predict(
+            song_count, song_count, other_units=INSERT_COST + song_count * LIST_COST
+        )
+
+    async def _refresh(self):
+        """Refresh the credentials through the token store, off the loop"""
+        await asyncio.to_thread(self.credentials.refresh, Request())
+
+    async def _request(self, method, path, cost, params, body=None, stage='youtube_request'):
+        """
+        Make an API call through the quota scheduler
+
+        Errors are raised as googleapiclient HttpErrors, so the scheduler
+        and callers treat them exactly like YouTubeService's.
+        """
+        async def attempt():
+            if not self.credentials.valid:
+                await self._refresh()
+            for refreshed in (False, True):
+                response = await self.http.request(
+                    method, YOUTUBE_API_URL + path, params=params, json=body,
+                    headers={'Authorization': f'Bearer {self.credentials.token}'}
+                )
+                if response.status_code != 401 or refreshed:
+                    break
+                await self._refresh()
+            if response.status_code >= 400:
+                headers = dict(response.headers, status=str(response.status_code))
+                raise HttpError(httplib2.Response(headers), response.content,
+                                uri=str(response.url))
+            return response.json()
+
+        with metrics.timed(stage):
+            return await self.scheduler.call_async(cost, attempt)
+
+    async def _cache_get(self, key):
+        """Read the video cache off the loop"""
+        if not self.cache:
+            return False, None
+        return await asyncio.to_thread(self.cache.get, key)
+
+    async def _cache_set(self, key, video_id):
+        """Write the video cache off the loop"""
+        if self.cache:
+            await asyncio.to_thread(self.cache.set, key, video_id)
+
+    async def lookup_video(self, query, max_results=1):
+        """
+        Resolve a query to a video, reading the video index and cache first
+
+        Concurrent lookups of the same query on the loop share a single
+        upstream search.
+
+        Returns:
+            Tuple of (video_id, cache_hit). video_id is None if not found.
+        """
+        video_id = self.index.lookup(query) if self.index else None
+        if video_id:
+            return video_id, True
+
+        hit, video_id = await self._cache_get(query)
+        if hit:
+            return video_id, True
+
+        lookup, _ = await self.flights.do(video_flight_key(query, max_results),
+                                          lambda: self._search(query, max_results))
+        return lookup
+
+    async def _search(self, query, max_results):
+        """Run search.list for a query and cache the result"""
+        try:
+            response = await self._request('GET', 'search', SEARCH_COST,
+                                           search_params(query, max_results),
+                                           stage='youtube_search')
+            video_id = first_video(response)
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            # Errors are not cached, the song is searched again next time
+            print(f"Error searching for '{query}': {str(e)}")
+            return None, False
+
+        await self._cache_set(query, video_id)
+        return video_id, False
+
+    async def lookup_track(self, track):
+        """
+        Resolve a Spotify track record to its best-matching video
+
+        Returns:
+            Tuple of (video_id, cache_hit). video_id is None if nothing matched.
+        """
+        video_id = self.index.lookup_track(track) if self.index else None
+        if video_id:
+            return video_id, True
+
+        # Same key as YouTubeService.lookup_track, so both reuse each other's matches
+        cache_key = match_cache_key(track)
+        hit, video_id = await self._cache_get(cache_key)
+        if hit:
+            return video_id, True
+
+        lookup, _ = await self.flights.do(match_flight_key(track),
+                                          lambda: self._match(track, cache_key))
+        return lookup
+
+    async def _match(self, track, cache_key):
+        """Search candidates for a track, rank them and cache the winner"""
+        try:
+            response = await self._request(
+                'GET', 'search', SEARCH_COST,
+                search_params(track['query'], Config.MATCH_CANDIDATES),
+                stage='youtube_search'
+            )
+            candidates = search_candidates(response)
+
+            if len(candidates) > 1:
+                details = await self._request('GET', 'videos', LIST_COST,
+                                              duration_params(candidates),
+                                              stage='youtube_videos')
+                set_durations(candidates, details)
+
+            video_id = pick_match(track, candidates)
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            print(f"Error matching '{track['query']}': {str(e)}")
+            return None, False
+
+        await self._cache_set(cache_key, video_id)
+        return video_id, False
+
+    async def search_video(self, query, max_results=1):
+        """
+        Search for a video on YouTube
+
+        Returns:
+            Video ID of the first result, or None if not found
+        """
+        video_id, _ = await self.lookup_video(query, max_results)
+        return video_id
+
+    async def create_playlist(self, title, description="", privacy_status="private"):
+        """
+        Create a new YouTube playlist
+
+        Returns:
+            Playlist ID of the newly created playlist
+        """
+        response = await self._request(
+            'POST', 'playlists', INSERT_COST, {'part': 'snippet,status'},
+            body={
+                'snippet': {'title': title, 'description': description},
+                'status': {'privacyStatus': privacy_status}
+            },
+            stage='playlist_create'
+        )
+        return response['id']
+
+    async def insert_playlist_item(self, playlist_id, video_id):
+        """
+        Append a video to a playlist
+
+        Returns:
+            ID of the new playlist item, or None if the insert failed
+        """
+        try:
+            response = await self._request(
+                'POST', 'playlistItems', INSERT_COST, {'part': 'snippet'},
+                body={'snippet': {
+                    'playlistId': playlist_id,
+                    'resourceId': {'kind': 'youtube#video', 'videoId': video_id}
+                }},
+                stage='playlist_insert'
+            )
+            return response['id']
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            print(f"Error adding video {video_id} to playlist: {str(e)}")
+            return None
+
+    async def add_video_to_playlist(self, playlist_id, video_id):
+        """
+        Add a video to a playlist
+
+        Returns:
+            True if successful, False otherwise
+        """
+        return await self.insert_playlist_item(playlist_id, video_id) is not None
+
+    async def get_channel_id(self):
+        """Get the ID of the authenticated user's channel, fetched once per client"""
+        if self._channel_id is None:
+            response = await self._request('GET', 'channels', LIST_COST,
+                                           {'part': 'id', 'mine': 'true'},
+                                           stage='channel_lookup')
+            if not response['items']:
+                raise Exception("No YouTube channel found for this account")
+            self._channel_id = response['items'][0]['id']
+        return self._channel_id
+
+    async def create_playlist_from_songs(self, playlist_name, songs, description="",
+                                         progress_callback=None, checkpoint=None):
+        """
+        Create a YouTube playlist and populate it with songs
+
+        Searches run concurrently, Config.YOUTUBE_SEARCH_WORKERS at a time,
+        while the found videos are appended in song order. Unlike
+        YouTubeService.create_playlist_from_songs, inserts are not batched
+        and a checkpoint is only written to; resuming goes through the
+        threaded service.
+
+        Args:
+            playlist_name: Name for the new playlist
+            songs: Iterable of song strings or Spotify track records
+            description: Playlist description
+            progress_callback: Optional callable(event, song, video_id) invoked
+                with 'resolved', 'added' or 'failed' as each song progresses
+            checkpoint: Optional new Checkpoint recording progress
+
+        Returns:
+            Dict with playlist_id, added_count, failed_songs, total_songs,
+            cache_hits, cache_misses, quota_exceeded and a per-song results list
+        """
+        playlist_id = await self.create_playlist(playlist_name, description)
+        if checkpoint:
+            await asyncio.to_thread(checkpoint.set_playlist_id, playlist_id)
+
+        outcome = SongResults(progress_callback)
+        workers = max(1, Config.YOUTUBE_SEARCH_WORKERS)
+        slots = asyncio.Semaphore(workers)
+        # Only keep a bounded window of searches in flight ahead of the writer
+        window = workers * 2
+        pending = deque()
+
+        async def resolve(index, song, track):
+            async with slots:
+                if track is None:
+                    lookup = await self.lookup_video(song)
+                else:
+                    lookup = await self.lookup_track(track)
+            if checkpoint:
+                await asyncio.to_thread(checkpoint.record_resolved, index, song, lookup[0])
+            outcome.notify('resolved', song, lookup[0])
+            return lookup
+
+        async def write():
+            # A song leaves pending only once written, so a quota error midway
+            # leaves it to be reported with the rest
+            index, song, task = pending[0]
+            video_id, cache_hit = await task
+            item_id = None
+            if video_id:
+                item_id = await self.insert_playlist_item(playlist_id, video_id)
+                status = 'added' if item_id else 'insert_failed'
+            else:
+                status = 'not_found'
+            if checkpoint:
+                await asyncio.to_thread(checkpoint.record_written, index, status, item_id)
+            pending.popleft()
+            outcome.record(song, video_id, cache_hit, status, item_id)
+
+        songs = iter(songs)
+        try:
+            for index, song in enumerate(songs):
+                outcome.total_songs += 1
+                if isinstance(song, dict):
+                    track, song = song, song['query']
+                else:
+                    track = None
+                pending.append((index, song, asyncio.create_task(resolve(index, song, track))))
+                if len(pending) >= window:
+                    await write()
+
+            while pending:
+                await write()
+        except QuotaExceededError as e:
+            outcome.quota_exceeded = True
+            print(f"Stopping conversion: {str(e)}")
+            tasks = [task for _, _, task in pending]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if outcome.quota_exceeded:
+            for _, song, _ in pending:
+                outcome.record(song, None, False, 'quota_exceeded')
+            outcome.skip_remaining(songs)
+
+        return dict(outcome.to_dict(), playlist_id=playlist_id)
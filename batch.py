@@ -0,0 +1,286 @@
+"""
+Batch Conversion Module
+Command-line converter for back-office migrations: converts a file of Spotify
+playlist IDs for one account across a pool of worker processes, writing one
+JSON result per playlist. Each playlist is checkpointed, so running a batch
+again resumes the playlists it left unfinished and skips the converted ones.
+
+Usage:
+    python batch.py --tokens tokens.json --playlists playlist_ids.txt \\
+        [--output batch_results.jsonl] [--processes N]
+
+The tokens file holds the account's Spotify and YouTube token dicts as the
+app stores them, or at least their refresh tokens:
+
+    {"spotify": {"refresh_token": "..."}, "youtube": {"refresh_token": "..."}}
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import checkpoints
+from config import Config
+import metrics
+from quota import QuotaExceededError
+from spotify_service import SpotifyService, StoredTokenManager
+from tokens import SPOTIFY, YOUTUBE, TokenStore
+from youtube_service import YouTubeService
+
+
+# Session ID the batch account's tokens are stored under
+SID = 'batch'
+# Conversions wait on the APIs and the quota rather than the CPU
+DEFAULT_PROCESSES = 4
+
+_spotify = None
+_youtube = None
+_owner = None
+
+
+def load_tokens(path):
+    """
+    Read a tokens file
+
+    Tokens without an access token or expiry are refreshed before first use.
+
+    Returns:
+        Dict of SPOTIFY and YOUTUBE to the token dict stored for each
+    """
+    with open(path, encoding='utf-8') as tokens_file:
+        data = json.load(tokens_file)
+
+    tokens = {}
+    for provider in (SPOTIFY, YOUTUBE):
+        token = data.get(provider) or {}
+        if not token.get('refresh_token'):
+            raise ValueError(f"{path} has no {provider} refresh_token")
+        tokens[provider] = dict({'access_token': None, 'expires_at': 0}, **token)
+    tokens[YOUTUBE].setdefault('scopes', Config.YOUTUBE_SCOPES)
+    return tokens
+
+
+def read_playlist_ids(path):
+    """Read playlist IDs, one per line, skipping blank lines and # comments"""
+    with open(path, encoding='utf-8') as ids_file:
+        lines = (line.split('#', 1)[0].strip() for line in ids_file)
+        return [line for line in lines if line]
+
+
+def refresh_tokens(store):
+    """
+    Check the account's tokens, refreshing them once for all the workers
+
+    Returns:
+        The account's YouTube channel ID
+
+    Raises:
+        Exception if either token is rejected
+    """
+    StoredTokenManager(store, SID).get_access_token()
+    youtube = YouTubeService()
+    youtube.set_token_store(store, SID)
+    return youtube.get_channel_id()
+
+
+def init_worker(token_db_path, quota_db_path, owner, processes):
+    """
+    Set up a worker process's clients
+
+    The workers draw on one daily quota through a shared ledger; the request
+    rate is limited per process, so each worker gets its share of it.
+
+    Args:
+        token_db_path: TokenStore database shared by the workers
+        quota_db_path: Quota ledger database shared by the workers
+        owner: The account's YouTube channel ID
+        processes: Number of worker processes
+    """
+    global _spotify, _youtube, _owner
+    Config.YOUTUBE_QUOTA_DB_PATH = quota_db_path
+    Config.YOUTUBE_REQUESTS_PER_SECOND /= processes
+    Config.YOUTUBE_REQUEST_BURST = max(1, Config.YOUTUBE_REQUEST_BURST // processes)
+
+    store = TokenStore(token_db_path, Config.TOKEN_REFRESH_MARGIN, Config.TOKEN_RETENTION)
+    _spotify = SpotifyService()
+    _spotify.set_token_store(store, SID)
+    _youtube = YouTubeService()
+    _youtube.set_token_store(store, SID)
+    _owner = owner
+
+
+def convert(playlist_id):
+    """
+    Convert one Spotify playlist to YouTube in a worker process
+
+    The latest unfinished conversion of the playlist is resumed, and a
+    playlist that was already converted is skipped.
+
+    Returns:
+        Dict describing the converted playlist, or the error that stopped it
+    """
+    checkpoint = None
+    try:
+        with metrics.breakdown() as timings:
+            details = _spotify.get_playlist_details(playlist_id)
+            checkpoint, converted_playlist_id = checkpoints.get_default_store().claim(
+                _owner,
+                playlist_id,
+                f"{details['name']} (from Spotify)",
+                f"Converted from Spotify playlist. Original had {details['total_tracks']} tracks."
+            )
+            if converted_playlist_id:
+                return {
+                    'spotify_playlist_id': playlist_id,
+                    'success': True,
+                    'already_converted': True,
+                    'playlist_id': converted_playlist_id,
+                    'playlist_url': f"https://www.youtube.com/playlist?list={converted_playlist_id}"
+                }
+            if checkpoint is None:
+                raise Exception("Already being converted")
+
+            result = _youtube.create_playlist_from_songs(
+                checkpoint.name,
+                _spotify.iter_playlist_track_records(playlist_id),
+                checkpoint.description,
+                checkpoint=checkpoint
+            )
+            checkpoint.finish(completed=not result['quota_exceeded'])
+    except Exception as e:
+        return {'spotify_playlist_id': playlist_id, 'success': False, 'error': str(e),
+                'conversion_id': checkpoint.id if checkpoint else None,
+                'quota_exceeded': isinstance(e, QuotaExceededError)}
+    finally:
+        if checkpoint is not None:
+            checkpoint.release()
+
+    return {
+        'spotify_playlist_id': playlist_id,
+        'success': True,
+        'already_converted': False,
+        'conversion_id': checkpoint.id,
+        'playlist_id': result['playlist_id'],
+        'playlist_url': f"https://www.youtube.com/playlist?list={result['playlist_id']}",
+        'total_songs': result['total_songs'],
+        'added_count': result['added_count'],
+        'failed_songs': result['failed_songs'],
+        'cache_hits': result['cache_hits'],
+        'cache_misses': result['cache_misses'],
+        'quota_exceeded': result['quota_exceeded'],
+        'timings': timings.to_dict()
+    }
+
+
+def run_batch(tokens, playlist_ids, output, processes):
+    """
+    Convert playlists across a process pool
+
+    Results are written as they finish. Once the YouTube quota the workers
+    share runs out, the playlists that haven't started are skipped rather
+    than each creating an empty playlist; running the batch again converts
+    them and resumes the interrupted ones.
+
+    Args:
+        tokens: Token dicts, see load_tokens
+        playlist_ids: Spotify playlist IDs to convert
+        output: Writable text file receiving one JSON result per line
+        processes: Number of worker processes
+
+    Returns:
+        Dict of aggregate counts and throughput
+    """
+    # The same playlist listed twice would be converted twice
+    playlist_ids = list(dict.fromkeys(playlist_ids))
+    totals = {'playlists': len(playlist_ids), 'converted': 0, 'already_converted': 0,
+              'failed': 0, 'skipped': 0, 'songs': 0, 'added_songs': 0, 'cache_hits': 0}
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        token_db_path = os.path.join(workdir, 'tokens.db')
+        store = TokenStore(token_db_path, Config.TOKEN_REFRESH_MARGIN, Config.TOKEN_RETENTION)
+        for provider, token in tokens.items():
+            store.save(SID, provider, token)
+        owner = refresh_tokens(store)
+        quota_db_path = Config.YOUTUBE_QUOTA_DB_PATH or os.path.join(workdir, 'quota.db')
+
+        # Spawned workers inherit no open connections, and start without
+        # sharing the setup process's state
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker,
+                                 initargs=(token_db_path, quota_db_path, owner,
+                                           processes)) as executor:
+            futures = {executor.submit(convert, playlist_id): playlist_id
+                       for playlist_id in playlist_ids}
+            for future in as_completed(futures):
+                if future.cancelled():
+                    result = {'spotify_playlist_id': futures[future], 'success': False,
+                              'error': 'Skipped: YouTube quota exceeded'}
+                    totals['skipped'] += 1
+                else:
+                    result = future.result()
+                    if not result['success']:
+                        totals['failed'] += 1
+                    elif result['already_converted']:
+                        totals['already_converted'] += 1
+                    else:
+                        totals['converted'] += 1
+                        totals['songs'] += result['total_songs']
+                        totals['added_songs'] += result['added_count']
+                        totals['cache_hits'] += result['cache_hits']
+
+                # The quota is shared, so once one worker runs out every
+                # playlist not yet started would fail the same way
+                if result.get('quota_exceeded'):
+                    for pending in futures:
+                        pending.cancel()
+
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+                print(f"{result['spotify_playlist_id']}: "
+                      f"{result.get('playlist_url') or result['error']}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    totals['seconds'] = round(elapsed, 3)
+    totals['playlists_per_second'] = round(totals['converted'] / elapsed, 3)
+    totals['songs_per_second'] = round(totals['added_songs'] / elapsed, 3)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert Spotify playlists to YouTube in batch')
+    parser.add_argument('--tokens', required=True, help='JSON file of the account tokens')
+    parser.add_argument('--playlists', required=True, help='File of Spotify playlist IDs')
+    parser.add_argument('--output', default='batch_results.jsonl')
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES)
+    args = parser.parse_args()
+
+    try:
+        tokens = load_tokens(args.tokens)
+        playlist_ids = read_playlist_ids(args.playlists)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    processes = max(1, min(args.processes, len(playlist_ids) or 1))
+
+    with open(args.output, 'w', encoding='utf-8') as output:
+        try:
+            totals = run_batch(tokens, playlist_ids, output, processes)
+        except Exception as e:
+            print(f"Batch conversion failed: {str(e)}", file=sys.stderr)
+            return 2
+
+    print(f"\n{totals['converted']}/{totals['playlists']} playlists converted "
+          f"({totals['already_converted']} already converted, {totals['failed']} failed, "
+          f"{totals['skipped']} skipped) in {totals['seconds']} s")
+    print(f"{totals['added_songs']}/{totals['songs']} songs added, "
+          f"{totals['cache_hits']} without a search")
+    print(f"{totals['playlists_per_second']} playlists/s, "
+          f"{totals['songs_per_second']} songs/s across {processes} processes")
+    return 0 if totals['failed'] == 0 and totals['skipped'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Spotify to YouTube Playlist Converter
+
+Run from the repository root, e.g. `python -m benchmarks.bench_set_credentials`
+"""
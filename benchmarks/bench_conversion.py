@@ -0,0 +1,294 @@
+"""
+Benchmark playlist conversion against fake Spotify and YouTube APIs
+
+Drives SpotifyService (fetching a playlist's tracks),
+YouTubeService.create_playlist_from_songs and the /convert route for
+playlists of several sizes, using the in-process fakes from
+benchmarks.fakes. Reports throughput, p50/p99 latency and API call counts,
+and writes them as JSON so runs can be compared.
+
+The daily quota and rate limit are lifted by default so the benchmark
+measures the converter itself; set YOUTUBE_DAILY_QUOTA,
+YOUTUBE_REQUESTS_PER_SECOND etc. in the environment to apply real limits.
+
+Usage:
+    python -m benchmarks.bench_conversion [--sizes 10,100,1000,10000]
+        [--scenarios spotify,youtube,route] [--latency SECONDS]
+        [--throttle-rate RATE] [--error-rate RATE] [--output FILE]
+        [--baseline FILE]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from benchmarks.fakes import (PLAYLIST_PREFIX, CallLog, FakeSpotifyAdapter, FakeYouTubeHttp,
+                              FaultProfile)
+
+SCENARIOS = ('spotify', 'youtube', 'route')
+
+
+def configure_environment(args, workdir):
+    """Point the app at throwaway state and lift limits, before it is imported"""
+    defaults = {
+        'SPOTIFY_CLIENT_ID': 'benchmark',
+        'SPOTIFY_CLIENT_SECRET': 'benchmark',
+        'YOUTUBE_CLIENT_ID': 'benchmark',
+        'YOUTUBE_CLIENT_SECRET': 'benchmark',
+        'YOUTUBE_DAILY_QUOTA': str(10 ** 12),
+        'YOUTUBE_REQUESTS_PER_SECOND': str(10 ** 6),
+        'YOUTUBE_REQUEST_BURST': str(10 ** 6),
+        'YOUTUBE_BACKOFF_BASE': '0.01',
+        'CHECKPOINT_DB_PATH': os.path.join(workdir, 'checkpoints.db'),
+        'TOKEN_DB_PATH': os.path.join(workdir, 'tokens.db'),
+        'SYNC_DB_PATH': os.path.join(workdir, 'sync_state.db'),
+        'YOUTUBE_QUOTA_DB_PATH': os.path.join(workdir, 'youtube_quota.db'),
+        # Without the cache every run repeats the same searches
+        'VIDEO_CACHE_PATH': os.path.join(workdir, 'video_cache.db') if args.cache else '',
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(seconds):
+    """Summarize latency samples in milliseconds"""
+    if not seconds:
+        return {'count': 0, 'p50_ms': None, 'p99_ms': None}
+    return {
+        'count': len(seconds),
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 3),
+    }
+
+
+class Harness:
+    """Fake APIs plus factories for services wired to them"""
+
+    def __init__(self, args):
+        self.spotify_log = CallLog()
+        self.youtube_log = CallLog()
+        self.spotify_profile = FaultProfile(args.latency, args.jitter, args.error_rate,
+                                            args.throttle_rate, seed=args.seed)
+        self.youtube_profile = FaultProfile(args.latency, args.jitter, args.error_rate,
+                                            args.throttle_rate, seed=args.seed)
+        self.spotify_adapter = FakeSpotifyAdapter(self.spotify_profile, self.spotify_log)
+        self.youtube_http = FakeYouTubeHttp(self.youtube_profile, self.youtube_log)
+        self.last_timings = None
+
+    def spotify(self, sid=None):
+        """Build a SpotifyService talking to the fake Spotify API"""
+        from spotify_service import SpotifyService
+        service = SpotifyService()
+        service.set_access_token('benchmark')
+        # The session is shared by every client, so this reroutes all of them
+        service.sp._session.mount('https://api.spotify.com/', self.spotify_adapter)
+        return service
+
+    def youtube(self, sid=None):
+        """Build a YouTubeService talking to the fake YouTube API"""
+        from google.oauth2.credentials import Credentials
+        from transport import HttpPool
+        from youtube_service import YouTubeService
+        service = YouTubeService()
+        service.set_credentials(Credentials(token='benchmark'))
+        # Every request shares the fake, which is thread-safe
+        service.http_pool = HttpPool(1, factory=lambda: self.youtube_http)
+        return service
+
+    def reset(self):
+        """Clear the call logs before a timed section"""
+        self.spotify_log.reset()
+        self.youtube_log.reset()
+        self.last_timings = None
+
+
+def run_spotify(harness, playlist_id, client):
+    """Fetch a playlist's details and every track record"""
+    spotify = harness.spotify()
+    harness.reset()
+    start = time.perf_counter()
+    spotify.get_playlist_details(playlist_id)
+    count = len(list(spotify.iter_playlist_track_records(playlist_id)))
+    return count, time.perf_counter() - start
+
+
+def run_youtube(harness, playlist_id, client):
+    """Convert pre-fetched track records with create_playlist_from_songs"""
+    tracks = list(harness.spotify().iter_playlist_track_records(playlist_id))
+    youtube = harness.youtube()
+    harness.reset()
+    start = time.perf_counter()
+    result = youtube.create_playlist_from_songs(f"Benchmark {playlist_id}", tracks)
+    return result['added_count'], time.perf_counter() - start
+
+
+def run_route(harness, playlist_id, client):
+    """POST /convert and poll the job until it finishes"""
+    harness.reset()
+    start = time.perf_counter()
+    response = client.post('/convert', json={'playlist_id': playlist_id, 'sync': False})
+    if response.status_code != 202:
+        raise RuntimeError(f"/convert answered {response.status_code}: {response.get_data(True)}")
+    status_url = response.get_json()['status_url']
+    while True:
+        job = client.get(status_url).get_json()
+        if job['status'] == 'completed':
+            elapsed = time.perf_counter() - start
+            harness.last_timings = job['result'].get('timings')
+            return job['result']['added_count'], elapsed
+        if job['status'] == 'failed':
+            raise RuntimeError(job['error'])
+        time.sleep(0.005)
+
+
+RUNNERS = {'spotify': run_spotify, 'youtube': run_youtube, 'route': run_route}
+
+
+def route_client(harness):
+    """Flask test client with both services connected to the fakes"""
+    import app
+    import tokens
+    app.client_pool._build_spotify = harness.spotify
+    app.client_pool._build_youtube = harness.youtube
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['sid'] = 'benchmark'
+    token = {'access_token': 'benchmark', 'refresh_token': 'benchmark', 'scopes': [],
+             'expires_at': time.time() + 10 ** 6}
+    app.token_store.save('benchmark', tokens.SPOTIFY, token)
+    app.token_store.save('benchmark', tokens.YOUTUBE, token)
+    return client
+
+
+def bench(harness, scenario, size, repeat, client=None):
+    """Run one scenario at one playlist size and summarize it"""
+    playlist_id = f"{PLAYLIST_PREFIX}{size}"
+    durations = []
+    processed = 0
+    spotify_latencies, youtube_latencies = [], []
+
+    for _ in range(repeat):
+        # The services print a line per song, keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed, elapsed = RUNNERS[scenario](harness, playlist_id, client)
+        durations.append(elapsed)
+        spotify_latencies.extend(harness.spotify_log.latencies())
+        youtube_latencies.extend(harness.youtube_log.latencies())
+
+    median = statistics.median(durations)
+    result = {
+        'scenario': scenario,
+        'tracks': size,
+        'processed': processed,
+        'repeat': repeat,
+        'seconds_p50': round(median, 4),
+        'seconds_p99': round(percentile(durations, 0.99), 4),
+        'tracks_per_second': round(size / median, 2) if median else None,
+        # Call counts are from the last repetition
+        'spotify': dict(latency_summary(spotify_latencies), calls=harness.spotify_log.calls()),
+        'youtube': dict(latency_summary(youtube_latencies), calls=harness.youtube_log.calls()),
+    }
+    if harness.last_timings:
+        result['timings'] = harness.last_timings
+    return result
+
+
+def git_revision():
+    """Current commit of the checkout, if it is one"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the throughput change of each result against a baseline file"""
+    with open(baseline_path) as f:
+        baseline = {(item['scenario'], item['tracks']): item for item in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path}:")
+    for item in results:
+        before = baseline.get((item['scenario'], item['tracks']))
+        if not before or not before['tracks_per_second'] or not item['tracks_per_second']:
+            continue
+        change = item['tracks_per_second'] / before['tracks_per_second'] - 1
+        print(f"{item['scenario']:<8} {item['tracks']:>6} tracks   "
+              f"{before['tracks_per_second']:>10.1f} -> {item['tracks_per_second']:>10.1f} "
+              f"tracks/s   ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', default='10,100,1000,10000',
+                        help='Comma-separated playlist sizes')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='Comma-separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per scenario and size')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='Seconds every fake API call takes')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Random extra seconds per fake API call')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of calls answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Fraction of calls answered with a 429')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for injected faults')
+    parser.add_argument('--cache', action='store_true',
+                        help='Enable the video cache (later runs hit it)')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='Where to write the JSON results')
+    parser.add_argument('--baseline', help='Earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    scenarios = [scenario for scenario in args.scenarios.split(',') if scenario]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+        harness = Harness(args)
+        client = route_client(harness) if 'route' in scenarios else None
+
+        results = []
+        for scenario in scenarios:
+            for size in sizes:
+                result = bench(harness, scenario, size, args.repeat, client)
+                results.append(result)
+                api = 'spotify' if scenario == 'spotify' else 'youtube'
+                print(f"{scenario:<8} {size:>6} tracks   {result['seconds_p50']:>9.3f} s   "
+                      f"{result['tracks_per_second']:>10.1f} tracks/s   "
+                      f"{api} calls p50 {result[api]['p50_ms']} ms "
+                      f"p99 {result[api]['p99_ms']} ms")
+
+    report = {
+        'benchmark': 'conversion',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'settings': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark app cold start
+
+Times `import app` and app.warmup() in fresh interpreters, the work a new
+container or worker does before it can serve, and lists the modules whose
+imports cost the most according to `python -X importtime`. Runs fully offline.
+
+Usage:
+    python -m benchmarks.bench_import [--runs N] [--top N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.warmup()
+warm = time.perf_counter()
+print(json.dumps({'import': (imported - start) * 1000, 'warmup': (warm - imported) * 1000}))
+"""
+
+
+def probe_env(workdir):
+    """Environment for a child interpreter, with databases kept out of the repo"""
+    env = dict(os.environ)
+    env.setdefault('SPOTIFY_CLIENT_ID', 'benchmark')
+    env.setdefault('SPOTIFY_CLIENT_SECRET', 'benchmark')
+    env.setdefault('YOUTUBE_CLIENT_ID', 'benchmark')
+    env.setdefault('YOUTUBE_CLIENT_SECRET', 'benchmark')
+    for name in ('TOKEN_DB_PATH', 'VIDEO_CACHE_PATH', 'CHECKPOINT_DB_PATH', 'SYNC_DB_PATH',
+                 'YOUTUBE_QUOTA_DB_PATH'):
+        env[name] = os.path.join(workdir, name.lower() + '.db')
+    return env
+
+
+def run_probe(env):
+    """Import and warm up the app in a new interpreter, returning timings in ms"""
+    output = subprocess.run([sys.executable, '-c', PROBE], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def slowest_imports(env, top):
+    """
+    Get the top-level imports of app by cumulative import time
+
+    Returns:
+        List of (module, milliseconds), slowest first
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            env=env, check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            name = fields[2][1:]
+            depth = (len(name) - len(name.lstrip())) // 2
+            rows.append((depth, name.strip(), int(fields[1]) / 1000))
+
+    # A module is listed after everything it imports, so app's own imports
+    # are the top-level rows right before it
+    modules = []
+    end = max(index for index, row in enumerate(rows) if row[:2] == (0, 'app'))
+    for depth, name, elapsed in reversed(rows[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            modules.append((name, elapsed))
+    return sorted(modules, key=lambda item: item[1], reverse=True)[:top]
+
+
+def report(name, samples):
+    """Print a one-line summary of latency samples"""
+    print(f"{name:<16} median {statistics.median(samples):8.1f} ms"
+          f"   max {max(samples):8.1f} ms   (n={len(samples)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = probe_env(workdir)
+        # The first run fills the bytecode and OS file caches
+        run_probe(env)
+        samples = [run_probe(env) for _ in range(args.runs)]
+        modules = slowest_imports(env, args.top)
+
+    report('import app', [sample['import'] for sample in samples])
+    report('warmup()', [sample['warmup'] for sample in samples])
+    report('total', [sample['import'] + sample['warmup'] for sample in samples])
+    print('\nSlowest imports of app (cumulative):')
+    for module, elapsed in modules:
+        print(f"  {module:<28} {elapsed:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
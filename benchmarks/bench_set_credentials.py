@@ -0,0 +1,62 @@
+"""
+Benchmark YouTubeService.set_credentials latency
+
+Compares building the client the old way (build(), which reads and parses the
+discovery document on every call) against the cached discovery document.
+Runs fully offline.
+
+Usage:
+    python -m benchmarks.bench_set_credentials [--iterations N]
+"""
+import argparse
+import statistics
+import time
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+import youtube_service
+from config import Config
+from youtube_service import YouTubeService
+
+
+def measure(fn, iterations):
+    """Return per-call latencies of fn in milliseconds"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    """Print a one-line summary of latency samples"""
+    print(f"{name:<28} median {statistics.median(samples):8.3f} ms"
+          f"   max {max(samples):8.3f} ms   (n={len(samples)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    credentials = Credentials(token='benchmark-token')
+    service = YouTubeService()
+
+    def uncached_build():
+        build(Config.YOUTUBE_API_SERVICE_NAME, Config.YOUTUBE_API_VERSION,
+              credentials=credentials, static_discovery=True)
+
+    def cold_set_credentials():
+        youtube_service._discovery_document = None
+        service.set_credentials(credentials)
+
+    def warm_set_credentials():
+        service.set_credentials(credentials)
+
+    report('build() per call', measure(uncached_build, args.iterations))
+    report('cold set_credentials', measure(cold_set_credentials, args.iterations))
+    report('warm set_credentials', measure(warm_set_credentials, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,458 @@
+"""
+In-process stand-ins for the Spotify Web API and the YouTube Data API
+
+The fakes plug in at the transport layer, below spotipy and
+google-api-python-client, so the services under benchmark run their real
+request building, parsing, retry and scheduling code. Each fake has a
+FaultProfile with configurable latency, error rate and 429 rate, and records
+every call in a CallLog.
+"""
+import email.parser
+import hashlib
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import httplib2
+import requests
+from requests.adapters import BaseAdapter
+
+# Duration every fake video and track has, so ranked matching accepts them
+TRACK_DURATION_MS = 210000
+VIDEO_DURATION = 'PT3M30S'
+
+# Playlist IDs of the form "bench<N>" have N tracks
+PLAYLIST_PREFIX = 'bench'
+
+
+class FaultProfile:
+    """Latency and failure behaviour of a fake API"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=0, seed=None):
+        """
+        Args:
+            latency: Seconds every call takes at least
+            jitter: Extra seconds added uniformly at random per call
+            error_rate: Fraction of calls answered with a 503
+            throttle_rate: Fraction of calls answered with a 429
+            retry_after: Retry-After seconds sent with a 429
+            seed: Seed for the fault decisions, for repeatable runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Sleep for one call's latency"""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def outcome(self):
+        """
+        Decide how a call is answered
+
+        Returns:
+            200, 429 or 503
+        """
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 503
+        return 200
+
+
+class CallLog:
+    """Thread-safe record of the calls a fake API answered"""
+
+    def __init__(self):
+        self._calls = {}
+        self._latencies = []
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, seconds=None):
+        """Record one call, with its latency unless it was part of a batch"""
+        with self._lock:
+            counts = self._calls.setdefault(endpoint, {'calls': 0, 'errors': 0, 'throttled': 0})
+            counts['calls'] += 1
+            if status == 429:
+                counts['throttled'] += 1
+            elif status >= 400:
+                counts['errors'] += 1
+            if seconds is not None:
+                self._latencies.append(seconds)
+
+    def reset(self):
+        """Forget every recorded call"""
+        with self._lock:
+            self._calls = {}
+            self._latencies = []
+
+    def calls(self):
+        """Get the per-endpoint counts"""
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in sorted(self._calls.items())}
+
+    def latencies(self):
+        """Get the latency in seconds of every recorded call"""
+        with self._lock:
+            return list(self._latencies)
+
+
+def fake_track(index):
+    """Build the Spotify track object at a playlist index"""
+    return {
+        'id': f"track{index}",
+        'name': f"Song {index}",
+        'artists': [{'name': f"Artist {index % 500}"}],
+        'album': {'name': f"Album {index // 10}"},
+        'external_ids': {'isrc': f"BENCH{index:07d}"},
+        'duration_ms': TRACK_DURATION_MS
+    }
+
+
+def playlist_size(playlist_id):
+    """Number of tracks of a fake playlist ID"""
+    return int(playlist_id[len(PLAYLIST_PREFIX):])
+
+
+class FakeSpotifyAdapter(BaseAdapter):
+    """
+    requests transport adapter answering Spotify Web API calls
+
+    Mount it on a spotipy client's session for https://api.spotify.com/.
+    Mounting replaces the HTTPAdapter that carries spotipy's urllib3 retry
+    policy, so the adapter repeats that policy itself: 429 and 5xx answers
+    are retried up to max_retries times, honouring Retry-After.
+    """
+
+    def __init__(self, profile, log, playlist_ids=(), max_retries=3, backoff_factor=0.3):
+        """
+        Args:
+            profile: FaultProfile of the fake API
+            log: CallLog recording each call
+            playlist_ids: Playlists returned for the current user
+            max_retries: Retries of throttled or failed calls
+            backoff_factor: Base of the exponential backoff between retries
+        """
+        super().__init__()
+        self.profile = profile
+        self.log = log
+        self.playlist_ids = list(playlist_ids)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None,
+             proxies=None):
+        """Answer a prepared request, retrying like spotipy's default policy"""
+        for attempt in range(self.max_retries + 1):
+            status, payload, headers = self._attempt(request)
+            if status < 429 or attempt == self.max_retries:
+                break
+            if status == 429:
+                time.sleep(self.profile.retry_after)
+            else:
+                time.sleep(self.backoff_factor * 2 ** attempt)
+        return self._response(request, status, payload, headers)
+
+    def close(self):
+        """Nothing to release"""
+
+    def _attempt(self, request):
+        """Answer one attempt of a request"""
+        start = time.perf_counter()
+        url = urlsplit(request.url)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+        endpoint = self._endpoint(parts)
+
+        self.profile.wait()
+        status = self.profile.outcome()
+        headers = {'Content-Type': 'application/json'}
+        if status == 429:
+            headers['Retry-After'] = str(self.profile.retry_after)
+            payload = {'error': {'status': 429, 'message': 'API rate limit exceeded'}}
+        elif status != 200:
+            payload = {'error': {'status': status, 'message': 'Service unavailable'}}
+        else:
+            payload = self._answer(endpoint, parts, query)
+            if payload is None:
+                status = 404
+                payload = {'error': {'status': 404, 'message': 'Not found'}}
+
+        self.log.record(endpoint, status, time.perf_counter() - start)
+        return status, payload, headers
+
+    @staticmethod
+    def _endpoint(parts):
+        """Name the endpoint of a request path, e.g. 'playlist_items'"""
+        if parts[1:3] == ['me', 'playlists']:
+            return 'current_user_playlists'
+        if parts[1:2] == ['playlists'] and parts[3:4] == ['tracks']:
+            return 'playlist_items'
+        if parts[1:2] == ['playlists']:
+            return 'playlist'
+        return 'unknown'
+
+    def _answer(self, endpoint, parts, query):
+        """Build the JSON body of a successful call"""
+        limit = int(query.get('limit', 20))
+        offset = int(query.get('offset', 0))
+
+        if endpoint == 'current_user_playlists':
+            page = self.playlist_ids[offset:offset + limit]
+            return {
+                'total': len(self.playlist_ids),
+                'items': [
+                    {'id': playlist_id, 'name': f"Benchmark {playlist_id}",
+                     'tracks': {'total': playlist_size(playlist_id)}, 'images': []}
+                    for playlist_id in page
+                ]
+            }
+
+        if endpoint in ('playlist', 'playlist_items') and parts[2].startswith(PLAYLIST_PREFIX):
+            total = playlist_size(parts[2])
+            if endpoint == 'playlist':
+                return {
+                    'name': f"Benchmark {parts[2]}",
+                    'description': '',
+                    'snapshot_id': f"snapshot-{total}",
+                    'tracks': {'total': total}
+                }
+            return {
+                'total': total,
+                'items': [{'track': fake_track(index)}
+                          for index in range(offset, min(offset + limit, total))]
+            }
+        return None
+
+    @staticmethod
+    def _response(request, status, payload, headers):
+        """Wrap an answer in a requests.Response"""
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK' if status == 200 else 'Error'
+        response.headers.update(headers)
+        response._content = json.dumps(payload).encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class FakeYouTubeHttp:
+    """
+    httplib2.Http stand-in answering YouTube Data API calls
+
+    Keeps playlists in memory, so inserts, listings and deletes behave like
+    the real API. Batch requests are answered part by part, with the fault
+    profile applied to each part.
+    """
+
+    def __init__(self, profile, log, candidates=5):
+        """
+        Args:
+            profile: FaultProfile of the fake API
+            log: CallLog recording each call
+            candidates: Search results returned per query at most
+        """
+        self.profile = profile
+        self.log = log
+        self.candidates = candidates
+        self._playlists = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        """Answer a request the way httplib2.Http.request does"""
+        url = urlsplit(uri)
+        if url.path.rstrip('/').endswith('/batch'):
+            return self._batch(body, headers or {})
+
+        start = time.perf_counter()
+        self.profile.wait()
+        status, payload = self._call(method, url.path, url.query, body)
+        self.log.record(self._endpoint(method, url.path), status, time.perf_counter() - start)
+        return self._response(status, payload)
+
+    def playlist_items(self, playlist_id):
+        """Get the video IDs in a fake playlist, in order"""
+        with self._lock:
+            return [item['video_id'] for item in self._playlists.get(playlist_id, [])]
+
+    @staticmethod
+    def _endpoint(method, path):
+        """Name the endpoint of a request, e.g. 'playlistItems.insert'"""
+        resource = path.rstrip('/').rsplit('/', 1)[-1]
+        action = {'GET': 'list', 'POST': 'insert', 'DELETE': 'delete'}.get(method, method)
+        return f"{resource}.{action}"
+
+    def _call(self, method, path, query_string, body):
+        """Answer one call, possibly with an injected fault"""
+        status = self.profile.outcome()
+        if status == 429:
+            return 429, self._error(429, 'rateLimitExceeded')
+        if status != 200:
+            return 503, self._error(503, 'backendError')
+
+        query = {key: values[0] for key, values in parse_qs(query_string).items()}
+        data = json.loads(body) if body else {}
+        endpoint = self._endpoint(method, path)
+        handler = {
+            'search.list': self._search,
+            'videos.list': self._videos,
+            'channels.list': self._channels,
+            'playlists.insert': self._insert_playlist,
+            'playlists.list': self._list_playlists,
+            'playlistItems.insert': self._insert_item,
+            'playlistItems.list': self._list_items,
+            'playlistItems.delete': self._delete_item,
+        }.get(endpoint)
+        if handler is None:
+            return 404, self._error(404, 'notFound')
+        return handler(query, data)
+
+    @staticmethod
+    def _error(status, reason):
+        """Build a Google API error body"""
+        return {'error': {'code': status, 'message': reason, 'errors': [{'reason': reason}]}}
+
+    @staticmethod
+    def _video_id(text, rank):
+        """Derive a stable 11-character video ID"""
+        return hashlib.sha1(f"{text}#{rank}".encode('utf-8')).hexdigest()[:11]
+
+    def _search(self, query, data):
+        """search.list: the query itself ranks first, then other versions"""
+        text = query.get('q', '')
+        artist = text.split(' - ', 1)[0]
+        count = min(int(query.get('maxResults', 5)), self.candidates)
+        suffixes = ['', ' (Live)', ' (Cover)', ' (Lyrics)', ' (Remix)']
+        items = [
+            {
+                'id': {'kind': 'youtube#video', 'videoId': self._video_id(text, rank)},
+                'snippet': {
+                    'title': text + suffixes[rank % len(suffixes)],
+                    'channelTitle': f"{artist} - Topic" if rank == 0 else f"Channel {rank}"
+                }
+            }
+            for rank in range(count)
+        ]
+        return 200, {'items': items}
+
+    def _videos(self, query, data):
+        """videos.list: every video is as long as the fake tracks"""
+        return 200, {'items': [
+            {'id': video_id, 'contentDetails': {'duration': VIDEO_DURATION}}
+            for video_id in query.get('id', '').split(',') if video_id
+        ]}
+
+    def _channels(self, query, data):
+        """channels.list: a single channel for the authenticated user"""
+        return 200, {'items': [{'id': 'UCbenchmark'}]}
+
+    def _new_id(self, prefix):
+        """Allocate an ID, called with the lock held"""
+        self._next_id += 1
+        return f"{prefix}{self._next_id}"
+
+    def _insert_playlist(self, query, data):
+        """playlists.insert"""
+        with self._lock:
+            playlist_id = self._new_id('PLbench')
+            self._playlists[playlist_id] = []
+        return 200, {'id': playlist_id, 'snippet': data.get('snippet', {})}
+
+    def _list_playlists(self, query, data):
+        """playlists.list by ID"""
+        with self._lock:
+            exists = query.get('id') in self._playlists
+        return 200, {'items': [{'id': query['id']}] if exists else []}
+
+    def _insert_item(self, query, data):
+        """playlistItems.insert, honouring an explicit position"""
+        snippet = data.get('snippet', {})
+        with self._lock:
+            items = self._playlists.get(snippet.get('playlistId'))
+            if items is None:
+                return 404, self._error(404, 'playlistNotFound')
+            item = {'id': self._new_id('PLI'), 'video_id': snippet['resourceId']['videoId']}
+            position = snippet.get('position')
+            if position is None or position > len(items):
+                items.append(item)
+            else:
+                items.insert(position, item)
+        return 200, {'id': item['id']}
+
+    def _list_items(self, query, data):
+        """playlistItems.list, 50 items per page"""
+        start = int(query.get('pageToken') or 0)
+        size = int(query.get('maxResults', 5))
+        with self._lock:
+            items = list(self._playlists.get(query.get('playlistId'), []))
+        page = items[start:start + size]
+        response = {'items': [{'id': item['id'], 'contentDetails': {'videoId': item['video_id']}}
+                              for item in page]}
+        if start + size < len(items):
+            response['nextPageToken'] = str(start + size)
+        return 200, response
+
+    def _delete_item(self, query, data):
+        """playlistItems.delete"""
+        with self._lock:
+            for items in self._playlists.values():
+                for index, item in enumerate(items):
+                    if item['id'] == query.get('id'):
+                        del items[index]
+                        return 204, None
+        return 404, self._error(404, 'playlistItemNotFound')
+
+    def _batch(self, body, headers):
+        """Answer a multipart batch request with one latency for the round trip"""
+        start = time.perf_counter()
+        self.profile.wait()
+        content_type = headers.get('content-type') or headers.get('Content-Type')
+        message = email.parser.Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{body}")
+
+        boundary = 'batch_benchmark'
+        parts = []
+        for part in message.get_payload():
+            content_id = part['Content-ID'][1:-1]
+            request_line, rest = part.get_payload().split('\n', 1)
+            method, path, _ = request_line.strip().split(' ', 2)
+            url = urlsplit(path)
+            part_body = rest.split('\r\n\r\n', 1)[1] if '\r\n\r\n' in rest else rest.split('\n\n', 1)[-1]
+            status, payload = self._call(method, url.path, url.query, part_body.strip() or None)
+            self.log.record(self._endpoint(method, url.path), status)
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload) if payload is not None else ''}\r\n"
+            )
+        self.log.record('batch', 200, time.perf_counter() - start)
+        content = ''.join(parts) + f"--{boundary}--\r\n"
+        response = httplib2.Response({
+            'status': '200',
+            'content-type': f"multipart/mixed; boundary={boundary}"
+        })
+        return response, content.encode('utf-8')
+
+    @staticmethod
+    def _response(status, payload):
+        """Wrap an answer in an httplib2 response tuple"""
+        response = httplib2.Response({'status': str(status), 'content-type': 'application/json'})
+        response.reason = 'OK' if status < 300 else 'Error'
+        content = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        return response, content
@@ -0,0 +1,225 @@
+"""
+Bulk Conversion Module
+Converts many Spotify playlists in one pass, searching each distinct song once
+and writing the playlists through shared bounded worker pools
+"""
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import Config
+import metrics
+from quota import QuotaExceededError
+from video_cache import normalize_query
+
+
+class SharedResolver:
+    """
+    Resolves each distinct track once across the playlists of a bulk run
+
+    The first playlist to reach a track searches for it; every other playlist
+    containing the track waits for and reuses that result.
+    """
+
+    def __init__(self, youtube):
+        """
+        Initialize the resolver
+
+        Args:
+            youtube: Authenticated YouTubeService used for the lookups
+        """
+        self.youtube = youtube
+        self._lookups = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, song, track):
+        """
+        Resolve a song, see YouTubeService.add_songs_to_playlist
+
+        Returns:
+            Tuple of (video_id, cache_hit); reused lookups count as cache hits
+        """
+        key = (track.get('id') if track else None) or normalize_query(song)
+        with self._lock:
+            lookup = self._lookups.get(key)
+            leader = lookup is None
+            if leader:
+                lookup = self._lookups[key] = Future()
+
+        if not leader:
+            return lookup.result()[0], True
+
+        try:
+            if track is None:
+                result = self.youtube.lookup_video(song)
+            else:
+                result = self.youtube.lookup_track(track)
+        except BaseException as e:
+            lookup.set_exception(e)
+            raise
+        lookup.set_result(result)
+        return result
+
+    def unique_count(self):
+        """Number of distinct songs looked up so far"""
+        with self._lock:
+            return len(self._lookups)
+
+
+def load_playlists(spotify, playlist_ids=None):
+    """
+    Fetch the details and tracks of several playlists concurrently
+
+    Args:
+        spotify: Authenticated SpotifyService
+        playlist_ids: Spotify playlist IDs, or None for all of the user's
+            playlists
+
+    Returns:
+        List of dicts with id, details and tracks, in the given order.
+        Playlists without tracks are left out.
+    """
+    if playlist_ids is None:
+        playlist_ids = [playlist['id'] for playlist in spotify.get_user_playlists()]
+    # The same playlist listed twice would be converted twice
+    playlist_ids = list(dict.fromkeys(playlist_ids))
+
+    def load(playlist_id):
+        return {
+            'id': playlist_id,
+            'details': spotify.get_playlist_details(playlist_id),
+            'tracks': list(spotify.iter_playlist_track_records(playlist_id))
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, Config.SPOTIFY_PAGE_WORKERS)) as executor:
+        futures = [metrics.submit(executor, load, playlist_id) for playlist_id in playlist_ids]
+        playlists = [future.result() for future in futures]
+    return [playlist for playlist in playlists if playlist['tracks']]
+
+
+def count_unique(playlists):
+    """Count the distinct songs across loaded playlists"""
+    return len({
+        track.get('id') or normalize_query(track['query'])
+        for playlist in playlists
+        for track in playlist['tracks']
+    })
+
+
+def convert_playlists(youtube, store, playlists, progress_callback=None, executor=None):
+    """
+    Convert loaded playlists to YouTube in one pass over their distinct songs
+
+    Up to Config.BULK_PLAYLIST_WORKERS playlists are written at a time, each
+    keeping its own song order, while every search runs on one shared
+    executor, by default a pool of Config.YOUTUBE_SEARCH_WORKERS threads.
+    Each playlist gets its own checkpoint, so an interrupted playlist can be
+    resumed on its own. Running the same bulk conversion again resumes the
+    playlists left unfinished and skips those already converted.
+
+    Args:
+        youtube: Authenticated YouTubeService
+        store: CheckpointStore recording progress
+        playlists: Playlists from load_playlists
+        progress_callback: Optional callable(event, song, video_id)
+        executor: Optional executor to run the searches on instead
+
+    Returns:
+        Dict with playlists (a summary per playlist), total_songs,
+        unique_songs, added_count, failed_count and quota_exceeded
+    """
+    owner = youtube.get_channel_id()
+    resolver = SharedResolver(youtube)
+    quota_exceeded = threading.Event()
+
+    def convert(searches, playlist):
+        details = playlist['details']
+        summary = {
+            'spotify_playlist_id': playlist['id'],
+            'name': details['name'],
+            'conversion_id': None,
+            'playlist_id': None,
+            'total_songs': len(playlist['tracks']),
+            'added_count': 0,
+            'failed_songs': [song['query'] for song in playlist['tracks']],
+            'quota_exceeded': False,
+            'already_converted': False,
+            'error': None
+        }
+        if quota_exceeded.is_set():
+            # Don't create playlists that can't get any songs today; running
+            # the bulk conversion again converts them
+            summary['quota_exceeded'] = True
+            return summary
+
+        checkpoint, converted_playlist_id = store.claim(
+            owner,
+            playlist['id'],
+            f"{details['name']} (from Spotify)",
+            f"Converted from Spotify playlist. Original had {details['total_tracks']} tracks."
+        )
+        if converted_playlist_id:
+            summary.update(
+                playlist_id=converted_playlist_id,
+                playlist_url=f"https://www.youtube.com/playlist?list={converted_playlist_id}",
+                failed_songs=[],
+                already_converted=True
+            )
+            return summary
+        if checkpoint is None:
+            summary['error'] = 'Already being converted'
+            return summary
+        summary['conversion_id'] = checkpoint.id
+        try:
+            result = youtube.create_playlist_from_songs(
+                checkpoint.name,
+                playlist['tracks'],
+                checkpoint.description,
+                progress_callback=progress_callback,
+                checkpoint=checkpoint,
+                executor=searches,
+                resolver=resolver
+            )
+            checkpoint.finish(completed=not result['quota_exceeded'])
+        except QuotaExceededError:
+            quota_exceeded.set()
+            summary['quota_exceeded'] = True
+            return summary
+        except Exception as e:
+            print(f"Error converting playlist {playlist['id']}: {str(e)}")
+            summary['error'] = str(e)
+            return summary
+        finally:
+            checkpoint.release()
+
+        if result['quota_exceeded']:
+            quota_exceeded.set()
+        summary.update(
+            playlist_id=result['playlist_id'],
+            playlist_url=f"https://www.youtube.com/playlist?list={result['playlist_id']}",
+            added_count=result['added_count'],
+            failed_songs=result['failed_songs'],
+            quota_exceeded=result['quota_exceeded']
+        )
+        return summary
+
+    search_workers = max(1, Config.YOUTUBE_SEARCH_WORKERS)
+    playlist_workers = max(1, Config.BULK_PLAYLIST_WORKERS)
+    if executor is None:
+        pool = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix='bulk-search')
+    else:
+        pool = nullcontext(executor)
+    with pool as searches:
+        with ThreadPoolExecutor(max_workers=playlist_workers,
+                                thread_name_prefix='bulk-playlist') as writers:
+            futures = [metrics.submit(writers, convert, searches, playlist)
+                       for playlist in playlists]
+            summaries = [future.result() for future in futures]
+
+    return {
+        'playlists': summaries,
+        'total_songs': sum(summary['total_songs'] for summary in summaries),
+        'unique_songs': resolver.unique_count(),
+        'added_count': sum(summary['added_count'] for summary in summaries),
+        'failed_count': sum(len(summary['failed_songs']) for summary in summaries),
+        'quota_exceeded': quota_exceeded.is_set()
+    }
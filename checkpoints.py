@@ -0,0 +1,419 @@
+"""
+Checkpoints Module
+Records conversion progress per song so an interrupted conversion can resume
+without repeating searches or inserts
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from config import Config
+
+
+class Checkpoint:
+    """Progress of one conversion, written through to a CheckpointStore"""
+
+    def __init__(self, store, conversion_id, owner, spotify_playlist_id, name,
+                 description, youtube_playlist_id=None, songs=None, claim_id=None):
+        """
+        Initialize a checkpoint, use CheckpointStore.create or resume instead
+
+        Args:
+            store: CheckpointStore the checkpoint is persisted in
+            conversion_id: ID of the conversion
+            owner: YouTube channel ID the conversion belongs to
+            spotify_playlist_id: The Spotify playlist being converted
+            name: Name of the YouTube playlist
+            description: Description of the YouTube playlist
+            youtube_playlist_id: The YouTube playlist, once created
+            songs: Dict of song position to its stored state
+            claim_id: ID of the claim the caller holds on the conversion
+        """
+        self.store = store
+        self.id = conversion_id
+        self.owner = owner
+        self.spotify_playlist_id = spotify_playlist_id
+        self.name = name
+        self.description = description
+        self.youtube_playlist_id = youtube_playlist_id
+        self._songs = songs or {}
+        self.claim_id = claim_id
+        self._lock = threading.Lock()
+
+    def get(self, position, song):
+        """
+        Get the stored state of a song
+
+        Args:
+            position: Index of the song in the conversion
+            song: Song string, a different song at the position is ignored
+
+        Returns:
+            Dict with video_id, status and playlist_item_id, or None if the
+            song was never resolved. status is None until it was written.
+        """
+        with self._lock:
+            state = self._songs.get(position)
+        if state is None or state['song'] != song:
+            return None
+        return state
+
+    def added_count(self):
+        """Number of songs already in the YouTube playlist"""
+        with self._lock:
+            return sum(1 for state in self._songs.values() if state['status'] == 'added')
+
+    def set_playlist_id(self, youtube_playlist_id):
+        """
+        Record the YouTube playlist the songs go into
+
+        Inserts recorded for a previous playlist are forgotten, resolved
+        videos are kept.
+        """
+        with self._lock:
+            self.youtube_playlist_id = youtube_playlist_id
+            for state in self._songs.values():
+                state['status'] = None
+                state['playlist_item_id'] = None
+        self.store._set_playlist_id(self.id, self.claim_id, youtube_playlist_id)
+
+    def record_resolved(self, position, song, video_id):
+        """Record the video a song resolved to, None if it wasn't found"""
+        state = {'song': song, 'video_id': video_id, 'status': None,
+                 'playlist_item_id': None}
+        with self._lock:
+            self._songs[position] = state
+        self.store._save_song(self.id, self.claim_id, position, state)
+
+    def record_written(self, position, status, playlist_item_id=None):
+        """
+        Record the outcome of writing a song to the playlist
+
+        Args:
+            position: Index of the song in the conversion
+            status: 'added', 'insert_failed' or 'not_found'
+            playlist_item_id: The new playlist item, if it was added
+        """
+        with self._lock:
+            state = self._songs.get(position)
+            if state is None:
+                return
+            state['status'] = status
+            state['playlist_item_id'] = playlist_item_id
+        self.store._save_song(self.id, self.claim_id, position, state)
+
+    def reconcile(self, playlist_items):
+        """
+        Mark songs added whose insert landed but was never recorded
+
+        A crash between an insert and its checkpoint write leaves the video in
+        the playlist without a recorded item ID. Matching unclaimed playlist
+        items by video ID keeps a resume from inserting it again.
+
+        Args:
+            playlist_items: List of (playlist_item_id, video_id) currently in
+                the YouTube playlist
+        """
+        with self._lock:
+            claimed = {state['playlist_item_id'] for state in self._songs.values()
+                       if state['status'] == 'added'}
+            unclaimed = {}
+            for item_id, video_id in playlist_items:
+                if item_id not in claimed:
+                    unclaimed.setdefault(video_id, []).append(item_id)
+
+            found = []
+            for position in sorted(self._songs):
+                state = self._songs[position]
+                if state['status'] == 'added' or not state['video_id']:
+                    continue
+                item_ids = unclaimed.get(state['video_id'])
+                if item_ids:
+                    found.append((position, item_ids.pop(0)))
+
+        for position, item_id in found:
+            self.record_written(position, 'added', item_id)
+
+    def finish(self, completed):
+        """
+        Record the end of a run
+
+        Args:
+            completed: True if every song was processed, in which case the
+                per-song state is dropped as there is nothing left to resume
+        """
+        self.store._finish(self.id, self.claim_id, completed)
+
+    def release(self):
+        """Allow the conversion to be resumed again, by any process"""
+        self.store._release(self.id, self.claim_id)
+
+
+class ClaimLostError(Exception):
+    """Raised when a conversion's lease expired and another process claimed it"""
+
+
+class CheckpointStore:
+    """
+    SQLite store of conversion checkpoints
+
+    A conversion is claimed in the database with a lease that every write
+    renews, so processes sharing the file (gunicorn workers, batch workers)
+    never run the same conversion at once, while one left running by a
+    process that died can be claimed again once its lease runs out.
+    """
+
+    def __init__(self, path, lease=600):
+        """
+        Open (or create) the checkpoint database
+
+        Args:
+            path: Path of the SQLite database file
+            lease: Seconds a claim holds without a write before another
+                process may take the conversion over
+        """
+        self.lease = lease
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # Every song is written through as it progresses; NORMAL still
+            # survives a process crash, which is what checkpoints are for
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversions ('
+                'id TEXT PRIMARY KEY, '
+                'owner TEXT NOT NULL, '
+                'spotify_playlist_id TEXT NOT NULL, '
+                'youtube_playlist_id TEXT, '
+                'name TEXT NOT NULL, '
+                'description TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'claim_id TEXT, '
+                'lease_until REAL)'
+            )
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(conversions)')}
+            for column, kind in (('claim_id', 'TEXT'), ('lease_until', 'REAL')):
+                # Databases written before conversions were leased
+                if column not in columns:
+                    self._conn.execute(f'ALTER TABLE conversions ADD COLUMN {column} {kind}')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS conversions_playlist '
+                'ON conversions (owner, spotify_playlist_id, updated_at)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversion_songs ('
+                'conversion_id TEXT NOT NULL, '
+                'position INTEGER NOT NULL, '
+                'song TEXT NOT NULL, '
+                'video_id TEXT, '
+                'status TEXT, '
+                'playlist_item_id TEXT, '
+                'PRIMARY KEY (conversion_id, position))'
+            )
+
+    def create(self, owner, spotify_playlist_id, name, description):
+        """
+        Start a new conversion checkpoint, claimed by the caller
+
+        Args:
+            owner: YouTube channel ID the conversion belongs to
+            spotify_playlist_id: The Spotify playlist being converted
+            name: Name of the YouTube playlist
+            description: Description of the YouTube playlist
+
+        Returns:
+            The new Checkpoint
+        """
+        with self._lock, self._conn:
+            return self._create(owner, spotify_playlist_id, name, description)
+
+    def resume(self, owner, conversion_id=None, spotify_playlist_id=None):
+        """
+        Claim an unfinished conversion to continue it
+
+        Args:
+            owner: YouTube channel ID the conversion must belong to
+            conversion_id: ID of the conversion to resume
+            spotify_playlist_id: Resume the latest unfinished conversion of
+                this playlist when conversion_id isn't given
+
+        Returns:
+            The Checkpoint, or None if there is no unfinished conversion or it
+            is already running, in this or another process
+        """
+        with self._lock, self._conn:
+            if conversion_id:
+                row = self._conn.execute(
+                    'SELECT id FROM conversions WHERE id = ? AND owner = ? AND status != ?',
+                    (conversion_id, owner, 'completed')
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    'SELECT id FROM conversions WHERE owner = ? AND spotify_playlist_id = ? '
+                    'AND status != ? ORDER BY updated_at DESC LIMIT 1',
+                    (owner, spotify_playlist_id, 'completed')
+                ).fetchone()
+            return self._resume(owner, row[0]) if row else None
+
+    def claim(self, owner, spotify_playlist_id, name, description):
+        """
+        Claim the conversion of a playlist that should be converted only once
+
+        Resumes the latest conversion of the playlist if it is unfinished, or
+        starts a new one if the playlist was never converted, so running the
+        same conversions again never creates a second YouTube playlist.
+
+        Args:
+            owner: YouTube channel ID the conversion belongs to
+            spotify_playlist_id: The Spotify playlist being converted
+            name: Name of the YouTube playlist, if a conversion is started
+            description: Description of the YouTube playlist, likewise
+
+        Returns:
+            Tuple of (checkpoint, converted_playlist_id). checkpoint is None
+            if the latest conversion completed, in which case
+            converted_playlist_id is its YouTube playlist, or if it is
+            running, in this or another process.
+        """
+        with self._lock, self._conn:
+            # Processes checking for the same playlist take turns, so only
+            # one of them starts its conversion
+            self._conn.execute('BEGIN IMMEDIATE')
+            row = self._conn.execute(
+                'SELECT id, status, youtube_playlist_id FROM conversions '
+                'WHERE owner = ? AND spotify_playlist_id = ? '
+                'ORDER BY updated_at DESC LIMIT 1',
+                (owner, spotify_playlist_id)
+            ).fetchone()
+
+            if row is None:
+                return self._create(owner, spotify_playlist_id, name, description), None
+            conversion_id, status, youtube_playlist_id = row
+            if status == 'completed':
+                return None, youtube_playlist_id
+            return self._resume(owner, conversion_id), None
+
+    def _create(self, owner, spotify_playlist_id, name, description):
+        """Insert a new claimed conversion, called in a transaction with the lock held"""
+        conversion_id = uuid.uuid4().hex
+        claim_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn.execute(
+            'INSERT INTO conversions (id, owner, spotify_playlist_id, name, description, '
+            'status, updated_at, claim_id, lease_until) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (conversion_id, owner, spotify_playlist_id, name, description, 'running',
+             now, claim_id, now + self.lease)
+        )
+        return Checkpoint(self, conversion_id, owner, spotify_playlist_id, name, description,
+                          claim_id=claim_id)
+
+    def _resume(self, owner, conversion_id):
+        """
+        Claim an unfinished conversion, called in a transaction with the lock held
+
+        Returns:
+            The Checkpoint, or None if another claim on it holds a lease
+        """
+        # One conditional update, so only one process wins however many race
+        claim_id = uuid.uuid4().hex
+        now = time.time()
+        claimed = self._conn.execute(
+            'UPDATE conversions SET status = ?, updated_at = ?, claim_id = ?, lease_until = ? '
+            'WHERE id = ? AND (status != ? OR lease_until IS NULL OR lease_until < ?)',
+            ('running', now, claim_id, now + self.lease, conversion_id, 'running', now)
+        ).rowcount
+        if not claimed:
+            return None
+
+        spotify_playlist_id, youtube_playlist_id, name, description = self._conn.execute(
+            'SELECT spotify_playlist_id, youtube_playlist_id, name, description '
+            'FROM conversions WHERE id = ?', (conversion_id,)
+        ).fetchone()
+        songs = {
+            position: {'song': song, 'video_id': video_id, 'status': status,
+                       'playlist_item_id': item_id}
+            for position, song, video_id, status, item_id in self._conn.execute(
+                'SELECT position, song, video_id, status, playlist_item_id '
+                'FROM conversion_songs WHERE conversion_id = ?', (conversion_id,)
+            )
+        }
+        return Checkpoint(self, conversion_id, owner, spotify_playlist_id, name,
+                          description, youtube_playlist_id, songs, claim_id)
+
+    def _renew(self, conversion_id, claim_id, **changes):
+        """
+        Extend a claim's lease, updating other columns of the conversion too,
+        called in a transaction with the lock held
+
+        Raises:
+            ClaimLostError: If the lease ran out and another claim took over
+        """
+        now = time.time()
+        columns = ''.join(f', {column} = ?' for column in changes)
+        renewed = self._conn.execute(
+            f'UPDATE conversions SET updated_at = ?, lease_until = ?{columns} '
+            'WHERE id = ? AND claim_id IS ?',
+            (now, now + self.lease, *changes.values(), conversion_id, claim_id)
+        ).rowcount
+        if not renewed:
+            raise ClaimLostError(f"Conversion {conversion_id} was taken over by another run")
+
+    def _set_playlist_id(self, conversion_id, claim_id, youtube_playlist_id):
+        """Persist the YouTube playlist of a conversion"""
+        with self._lock, self._conn:
+            self._renew(conversion_id, claim_id, youtube_playlist_id=youtube_playlist_id)
+            self._conn.execute(
+                'UPDATE conversion_songs SET status = NULL, playlist_item_id = NULL '
+                'WHERE conversion_id = ?', (conversion_id,)
+            )
+
+    def _save_song(self, conversion_id, claim_id, position, state):
+        """Persist the state of one song"""
+        with self._lock, self._conn:
+            self._renew(conversion_id, claim_id)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO conversion_songs '
+                '(conversion_id, position, song, video_id, status, playlist_item_id) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (conversion_id, position, state['song'], state['video_id'],
+                 state['status'], state['playlist_item_id'])
+            )
+
+    def _finish(self, conversion_id, claim_id, completed):
+        """Persist the end of a run"""
+        with self._lock, self._conn:
+            self._renew(conversion_id, claim_id,
+                        status='completed' if completed else 'interrupted')
+            if completed:
+                self._conn.execute(
+                    'DELETE FROM conversion_songs WHERE conversion_id = ?', (conversion_id,)
+                )
+
+    def _release(self, conversion_id, claim_id):
+        """Drop a claim on a conversion, unless another claim took over"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE conversions SET claim_id = NULL, lease_until = NULL '
+                'WHERE id = ? AND claim_id IS ?', (conversion_id, claim_id)
+            )
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Get the process-wide checkpoint store configured in Config"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CheckpointStore(Config.CHECKPOINT_DB_PATH, Config.CHECKPOINT_LEASE)
+        return _default_store
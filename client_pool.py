@@ -0,0 +1,90 @@
+"""
+Client Pool Module
+Keeps prebuilt, authenticated service instances per user so requests never
+share or mutate each other's API clients
+"""
+import threading
+import time
+from collections import OrderedDict
+import metrics
+from spotify_service import SpotifyService
+from youtube_service import YouTubeService
+
+
+class ClientPool:
+    """LRU pool of authenticated SpotifyService and YouTubeService instances"""
+
+    def __init__(self, max_size, idle_ttl, token_store):
+        """
+        Initialize the pool
+
+        Args:
+            max_size: Maximum number of service instances kept
+            idle_ttl: Seconds an unused instance is kept before it's rebuilt
+            token_store: TokenStore the clients read their tokens from
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.token_store = token_store
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def spotify(self, sid):
+        """Get the SpotifyService authenticated for a session"""
+        return self._get(('spotify', sid), lambda: self._build_spotify(sid))
+
+    def youtube(self, sid):
+        """Get the YouTubeService authenticated for a session"""
+        return self._get(('youtube', sid), lambda: self._build_youtube(sid))
+
+    def discard_spotify(self, sid):
+        """Drop the SpotifyService of a session"""
+        self._discard(('spotify', sid))
+
+    def discard_youtube(self, sid):
+        """Drop the YouTubeService of a session"""
+        self._discard(('youtube', sid))
+
+    def size(self):
+        """Number of service instances currently pooled"""
+        with self._lock:
+            return len(self._clients)
+
+    def _get(self, key, build):
+        """Return the pooled instance for key, building it on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and now - entry[1] <= self.idle_ttl:
+                self._clients[key] = (entry[0], now)
+                self._clients.move_to_end(key)
+                return entry[0]
+
+        # Build outside the lock so one slow build doesn't block other users
+        client = build()
+
+        with self._lock:
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+        return client
+
+    def _discard(self, key):
+        """Remove an instance from the pool if present"""
+        with self._lock:
+            self._clients.pop(key, None)
+
+    def _build_spotify(self, sid):
+        """Create a SpotifyService reading the session's token from the store"""
+        with metrics.timed('spotify_client_build'):
+            spotify = SpotifyService()
+            spotify.set_token_store(self.token_store, sid)
+        return spotify
+
+    def _build_youtube(self, sid):
+        """Create a YouTubeService with a prebuilt discovery client"""
+        with metrics.timed('youtube_client_build'):
+            youtube = YouTubeService()
+            youtube.set_token_store(self.token_store, sid)
+        return youtube
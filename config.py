@@ -14,6 +14,7 @@ class Config:
     SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
     SPOTIFY_REDIRECT_URI = os.environ.get('SPOTIFY_REDIRECT_URI', 'http://localhost:5000/spotify/callback')
     SPOTIFY_SCOPE = 'playlist-read-private playlist-read-collaborative'
+    SPOTIFY_PAGE_WORKERS = int(os.environ.get('SPOTIFY_PAGE_WORKERS', 4))
     
     # YouTube
     YOUTUBE_CLIENT_ID = os.environ.get('YOUTUBE_CLIENT_ID')
@@ -24,3 +25,83 @@ class Config:
     # API Configuration
     YOUTUBE_API_SERVICE_NAME = 'youtube'
     YOUTUBE_API_VERSION = 'v3'
+    # Optional path to a pinned discovery document (defaults to the bundled copy)
+    YOUTUBE_DISCOVERY_DOC = os.environ.get('YOUTUBE_DISCOVERY_DOC')
+    
+    # YouTube quota and rate limiting. The daily budget is shared by every
+    # process using YOUTUBE_QUOTA_DB_PATH (empty tracks it per process); the
+    # request rate is per process.
+    YOUTUBE_DAILY_QUOTA = int(os.environ.get('YOUTUBE_DAILY_QUOTA', 10000))
+    YOUTUBE_QUOTA_DB_PATH = os.environ.get('YOUTUBE_QUOTA_DB_PATH', 'youtube_quota.db')
+    YOUTUBE_REQUESTS_PER_SECOND = float(os.environ.get('YOUTUBE_REQUESTS_PER_SECOND', 10))
+    YOUTUBE_REQUEST_BURST = int(os.environ.get('YOUTUBE_REQUEST_BURST', 10))
+    YOUTUBE_MAX_RETRIES = int(os.environ.get('YOUTUBE_MAX_RETRIES', 5))
+    YOUTUBE_BACKOFF_BASE = float(os.environ.get('YOUTUBE_BACKOFF_BASE', 0.5))
+    YOUTUBE_BACKOFF_MAX = float(os.environ.get('YOUTUBE_BACKOFF_MAX', 30))
+    
+    # Conversion pipeline
+    YOUTUBE_SEARCH_WORKERS = int(os.environ.get('YOUTUBE_SEARCH_WORKERS', 8))
+    # Playlist inserts per HTTP batch request (1 sends single inserts, max 50)
+    YOUTUBE_INSERT_BATCH_SIZE = int(os.environ.get('YOUTUBE_INSERT_BATCH_SIZE', 1))
+    CONVERSION_WORKERS = int(os.environ.get('CONVERSION_WORKERS', 4))
+    JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 3600))
+    SSE_KEEPALIVE = int(os.environ.get('SSE_KEEPALIVE', 15))
+    # Playlists of a bulk conversion written to YouTube at the same time
+    BULK_PLAYLIST_WORKERS = int(os.environ.get('BULK_PLAYLIST_WORKERS', 4))
+    
+    # Track matching: search candidates per track and the lowest accepted score
+    MATCH_CANDIDATES = int(os.environ.get('MATCH_CANDIDATES', 5))
+    MATCH_MIN_SCORE = float(os.environ.get('MATCH_MIN_SCORE', 0.3))
+    
+    # Admission control: conversions queued or running at once, overall and
+    # per user, before new ones are turned away with 429
+    MAX_ACTIVE_CONVERSIONS = int(os.environ.get('MAX_ACTIVE_CONVERSIONS', 16))
+    MAX_CONVERSIONS_PER_USER = int(os.environ.get('MAX_CONVERSIONS_PER_USER', 2))
+    # Retry-After sent when no running conversion has an ETA yet
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 30))
+    # Threads searching songs for every conversion, shared round-robin by user
+    SONG_WORKERS = int(os.environ.get('SONG_WORKERS', 32))
+    
+    # Run /convert conversions as coroutines on the shared event loop
+    ASYNC_CONVERSIONS = os.environ.get('ASYNC_CONVERSIONS', '').lower() in ('1', 'true', 'yes')
+    ASYNC_HTTP_MAX_CONNECTIONS = int(os.environ.get('ASYNC_HTTP_MAX_CONNECTIONS', 100))
+    
+    # Mapping of converted playlists used by sync mode
+    SYNC_DB_PATH = os.environ.get('SYNC_DB_PATH', 'sync_state.db')
+    
+    # Per-song progress of conversions, used to resume interrupted ones
+    CHECKPOINT_DB_PATH = os.environ.get('CHECKPOINT_DB_PATH', 'checkpoints.db')
+    # Seconds a running conversion may go without progress before another
+    # process may take it over
+    CHECKPOINT_LEASE = int(os.environ.get('CHECKPOINT_LEASE', 600))
+    
+    # OAuth tokens of each session, kept server-side and refreshed before expiry
+    TOKEN_DB_PATH = os.environ.get('TOKEN_DB_PATH', 'tokens.db')
+    TOKEN_REFRESH_MARGIN = int(os.environ.get('TOKEN_REFRESH_MARGIN', 300))
+    TOKEN_RETENTION = int(os.environ.get('TOKEN_RETENTION', 30 * 24 * 3600))
+    
+    # Per-user client pool
+    CLIENT_POOL_SIZE = int(os.environ.get('CLIENT_POOL_SIZE', 256))
+    CLIENT_POOL_IDLE_TTL = int(os.environ.get('CLIENT_POOL_IDLE_TTL', 3600))
+    
+    # Per-user cache of the Spotify playlist list served by /playlists
+    PLAYLIST_CACHE_TTL = int(os.environ.get('PLAYLIST_CACHE_TTL', 60))
+    PLAYLIST_CACHE_SIZE = int(os.environ.get('PLAYLIST_CACHE_SIZE', 1024))
+    
+    # Keep-alive HTTP transports shared by all users' clients
+    SPOTIFY_HTTP_POOL_SIZE = int(os.environ.get('SPOTIFY_HTTP_POOL_SIZE', 16))
+    YOUTUBE_HTTP_POOL_SIZE = int(os.environ.get('YOUTUBE_HTTP_POOL_SIZE', 16))
+    HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 60))
+    
+    # Video lookup cache (set VIDEO_CACHE_PATH to an empty string to disable)
+    VIDEO_CACHE_PATH = os.environ.get('VIDEO_CACHE_PATH', 'video_cache.db')
+    VIDEO_CACHE_TTL = int(os.environ.get('VIDEO_CACHE_TTL', 30 * 24 * 3600))
+    VIDEO_CACHE_NEGATIVE_TTL = int(os.environ.get('VIDEO_CACHE_NEGATIVE_TTL', 24 * 3600))
+    VIDEO_CACHE_MAX_ENTRIES = int(os.environ.get('VIDEO_CACHE_MAX_ENTRIES', 100000))
+    
+    # Read-only video index built with video_index.py (empty to disable)
+    VIDEO_INDEX_PATH = os.environ.get('VIDEO_INDEX_PATH', '')
+    
+    # Share in-flight searches between worker processes through the video cache
+    SEARCH_SINGLEFLIGHT_SHARED = os.environ.get('SEARCH_SINGLEFLIGHT_SHARED', '').lower() in ('1', 'true', 'yes')
+    SEARCH_SINGLEFLIGHT_LEASE_TTL = float(os.environ.get('SEARCH_SINGLEFLIGHT_LEASE_TTL', 10))
@@ -0,0 +1,69 @@
+"""
+Shared pytest setup: throwaway state and the fake APIs from benchmarks.fakes
+"""
+import os
+import tempfile
+import pytest
+
+# Config reads the environment when it is first imported
+_STATE_DIR = tempfile.mkdtemp(prefix='converter-tests-')
+for _name, _value in {
+    'SPOTIFY_CLIENT_ID': 'test',
+    'SPOTIFY_CLIENT_SECRET': 'test',
+    'YOUTUBE_CLIENT_ID': 'test',
+    'YOUTUBE_CLIENT_SECRET': 'test',
+    'YOUTUBE_DAILY_QUOTA': str(10 ** 12),
+    'YOUTUBE_QUOTA_DB_PATH': '',
+    'YOUTUBE_REQUESTS_PER_SECOND': '0',
+    'YOUTUBE_BACKOFF_BASE': '0',
+    'VIDEO_CACHE_PATH': '',
+    'VIDEO_INDEX_PATH': '',
+    'CHECKPOINT_DB_PATH': os.path.join(_STATE_DIR, 'checkpoints.db'),
+    'TOKEN_DB_PATH': os.path.join(_STATE_DIR, 'tokens.db'),
+    'SYNC_DB_PATH': os.path.join(_STATE_DIR, 'sync_state.db'),
+}.items():
+    os.environ[_name] = _value
+
+# test_structure.py is a standalone script run with `python test_structure.py`
+collect_ignore = ['test_structure.py']
+
+
+class FakeAPIs:
+    """Services wired to in-process fake Spotify and YouTube APIs"""
+
+    def __init__(self):
+        from benchmarks.fakes import CallLog, FakeSpotifyAdapter, FakeYouTubeHttp, FaultProfile
+        self.spotify_log = CallLog()
+        self.youtube_log = CallLog()
+        self.spotify_adapter = FakeSpotifyAdapter(FaultProfile(), self.spotify_log)
+        self.youtube_http = FakeYouTubeHttp(FaultProfile(), self.youtube_log)
+
+    def spotify(self):
+        """Build a SpotifyService talking to the fake Spotify API"""
+        from spotify_service import SpotifyService
+        service = SpotifyService()
+        service.set_access_token('test')
+        service.sp._session.mount('https://api.spotify.com/', self.spotify_adapter)
+        return service
+
+    def youtube(self, scheduler=None):
+        """
+        Build a YouTubeService talking to the fake YouTube API
+
+        Args:
+            scheduler: Optional QuotaScheduler replacing the process-wide one
+        """
+        from google.oauth2.credentials import Credentials
+        from transport import HttpPool
+        from youtube_service import YouTubeService
+        service = YouTubeService()
+        service.set_credentials(Credentials(token='test'))
+        service.http_pool = HttpPool(1, factory=lambda: self.youtube_http)
+        if scheduler is not None:
+            service.scheduler = scheduler
+        return service
+
+
+@pytest.fixture
+def fake_apis():
+    return FakeAPIs()
@@ -0,0 +1,126 @@
+"""
+Fair Executor Module
+Thread pool shared by every conversion that runs queued song work round-robin
+across users, so one user's large playlist can't hold up everyone else's songs
+"""
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from config import Config
+
+
+class FairExecutor:
+    """
+    Thread pool with one work queue per owner
+
+    Each free worker takes the next item of the owner after the one it last
+    served, so owners with work queued get turns in rotation however much
+    each has queued. Work of one owner runs in the order it was submitted.
+    """
+
+    def __init__(self, max_workers):
+        """
+        Initialize the executor; worker threads start as work arrives
+
+        Args:
+            max_workers: Threads running work at most
+        """
+        self.max_workers = max_workers
+        self._queues = OrderedDict()
+        self._condition = threading.Condition()
+        self._size = 0
+        self._threads = 0
+        self._idle = 0
+
+    def submit(self, owner, fn, *args, **kwargs):
+        """
+        Queue work for an owner
+
+        Args:
+            owner: Identifies whose turn the work runs in, e.g. a session ID
+            fn: Callable run as fn(*args, **kwargs)
+
+        Returns:
+            concurrent.futures.Future of fn's result
+        """
+        future = Future()
+        with self._condition:
+            self._queues.setdefault(owner, deque()).append((future, fn, args, kwargs))
+            self._size += 1
+            if self._idle < self._size and self._threads < self.max_workers:
+                self._threads += 1
+                threading.Thread(target=self._work, name=f"fair-{self._threads}",
+                                 daemon=True).start()
+            self._condition.notify()
+        return future
+
+    def for_owner(self, owner):
+        """Get an executor submitting everything as an owner's work"""
+        return OwnerExecutor(self, owner)
+
+    def queued(self):
+        """Number of items waiting for a worker"""
+        with self._condition:
+            return self._size
+
+    def _next(self):
+        """Take the next owner's oldest item, called with the lock held"""
+        owner, items = next(iter(self._queues.items()))
+        item = items.popleft()
+        self._size -= 1
+        if items:
+            # The owner's next item waits for every other owner's turn
+            self._queues.move_to_end(owner)
+        else:
+            del self._queues[owner]
+        return item
+
+    def _work(self):
+        """Worker thread loop"""
+        while True:
+            with self._condition:
+                self._idle += 1
+                while not self._queues:
+                    self._condition.wait()
+                self._idle -= 1
+                future, fn, args, kwargs = self._next()
+
+            # Work cancelled while queued, e.g. after quota ran out, is dropped
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class OwnerExecutor:
+    """An owner's view of a FairExecutor, usable wherever an executor is"""
+
+    def __init__(self, executor, owner):
+        """
+        Args:
+            executor: The shared FairExecutor
+            owner: Owner the work is submitted as
+        """
+        self.executor = executor
+        self.owner = owner
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue work, see FairExecutor.submit"""
+        return self.executor.submit(self.owner, fn, *args, **kwargs)
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def get_default_executor():
+    """Get the process-wide song executor configured in Config"""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = FairExecutor(Config.SONG_WORKERS)
+        return _default_executor
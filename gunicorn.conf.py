@@ -0,0 +1,31 @@
+"""
+Gunicorn Configuration
+Loads and warms up the app once in the master process, then forks workers
+that share it copy-on-write, so new workers can serve as soon as they start.
+
+Usage:
+    gunicorn
+
+gunicorn reads this file from the working directory. It also honours
+WEB_CONCURRENCY (worker processes, default 1) and PORT. Jobs are tracked per
+process, so more than one worker needs session-affine load balancing.
+"""
+import gc
+import os
+
+
+wsgi_app = 'app:app'
+preload_app = True
+# Progress streams hold a thread for as long as a client watches a job
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+
+def when_ready(server):
+    """Warm the preloaded app up before the first workers are forked"""
+    import app
+
+    app.warmup()
+    # Keep the collector from touching, and so copying, every object loaded
+    # so far in each worker
+    gc.freeze()
@@ -0,0 +1,320 @@
+"""
+Jobs Module
+Runs playlist conversions on a background executor and tracks their progress
+"""
+import math
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+
+class AdmissionError(Exception):
+    """Raised when a conversion is turned away because too many are active"""
+
+    def __init__(self, message, retry_after):
+        """
+        Args:
+            message: Why the conversion was turned away
+            retry_after: Seconds after which a retry may be admitted
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConversionJob:
+    """Progress and outcome of one background conversion"""
+
+    def __init__(self, owner):
+        """Initialize a queued job owned by the given session"""
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = 'queued'
+        self.total_songs = None
+        self.quota = None
+        self.resolved = 0
+        self.added = 0
+        self.failed = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def set_total(self, total_songs):
+        """Set the number of songs the conversion will process"""
+        with self._lock:
+            self.total_songs = total_songs
+            self._publish('progress', self._progress())
+
+    def set_quota(self, quota):
+        """Attach a quota prediction to the job"""
+        with self._lock:
+            self.quota = quota
+            self._publish('progress', self._progress())
+
+    def start(self):
+        """Mark the job as running"""
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+            self._publish('progress', self._progress())
+
+    def complete(self, result):
+        """Mark the job as completed with its result"""
+        with self._lock:
+            self.result = result
+            self.status = 'completed'
+            self.finished_at = time.time()
+            self._publish('complete', result)
+
+    def fail(self, error):
+        """Mark the job as failed with an error message"""
+        with self._lock:
+            self.error = error
+            self.status = 'failed'
+            self.finished_at = time.time()
+            self._publish('error', {'error': error})
+
+    def subscribe(self):
+        """
+        Subscribe to the job's progress events
+
+        Returns:
+            Queue of (event, data) tuples, starting with a progress snapshot
+            and ending with a 'complete' or 'error' event
+        """
+        events = queue.Queue()
+        with self._lock:
+            events.put(('progress', self._progress()))
+            if self.status == 'completed':
+                events.put(('complete', self.result))
+            elif self.status == 'failed':
+                events.put(('error', {'error': self.error}))
+            else:
+                self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        """Stop delivering events to a queue returned by subscribe"""
+        with self._lock:
+            if events in self._subscribers:
+                self._subscribers.remove(events)
+
+    def record(self, event, song, video_id=None):
+        """
+        Record a per-song progress event
+
+        Args:
+            event: One of 'resolved', 'added' or 'failed'
+            song: Song string the event is about
+            video_id: Resolved video ID, if any
+        """
+        with self._lock:
+            if event == 'resolved':
+                self.resolved += 1
+            elif event == 'added':
+                self.added += 1
+            elif event == 'failed':
+                self.failed += 1
+            else:
+                return
+
+            data = self._progress()
+            data['song'] = song
+            data['video_id'] = video_id
+            self._publish(event, data)
+
+    def _publish(self, event, data):
+        """Deliver an event to every subscriber, called with the lock held"""
+        for events in self._subscribers:
+            events.put((event, data))
+        if event in ('complete', 'error'):
+            self._subscribers = []
+
+    def _progress(self):
+        """Snapshot the progress counters, called with the lock held"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total_songs': self.total_songs,
+            'resolved': self.resolved,
+            'added': self.added,
+            'failed': self.failed,
+            'eta_seconds': self.eta_seconds(),
+            'quota': self.quota
+        }
+
+    def eta_seconds(self):
+        """Estimate the seconds left from the average time per finished song"""
+        done = self.added + self.failed
+        if self.status != 'running' or not self.total_songs or not done:
+            return None
+        elapsed = time.time() - self.started_at
+        return round(elapsed / done * max(self.total_songs - done, 0), 1)
+
+    def to_dict(self):
+        """Serialize the job for the /jobs endpoint"""
+        with self._lock:
+            data = self._progress()
+            data['result'] = self.result
+            data['error'] = self.error
+            return data
+
+
+class JobManager:
+    """Background executor and registry of conversion jobs"""
+
+    def __init__(self, max_workers, retention, max_active=None, max_per_owner=None,
+                 retry_after=30):
+        """
+        Initialize the job manager
+
+        Args:
+            max_workers: Number of conversions that run at the same time
+            retention: Seconds a finished job is kept for polling
+            max_active: Jobs queued or running at once before new ones are
+                turned away, None for no limit
+            max_per_owner: Jobs one owner may have queued or running at once,
+                None for no limit
+            retry_after: Seconds suggested to retry after when turned away
+                while no running job has an ETA
+        """
+        self.retention = retention
+        self.max_active = max_active
+        self.max_per_owner = max_per_owner
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='conversion')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner, fn, *args):
+        """
+        Queue a conversion
+
+        Args:
+            owner: Identifier of the session that owns the job
+            fn: Callable run as fn(job, *args), returning the job result
+
+        Returns:
+            The queued ConversionJob
+
+        Raises:
+            AdmissionError: If max_active or max_per_owner jobs are active
+        """
+        job = self._admit(owner)
+        self._executor.submit(self._run, job, fn, *args)
+        return job
+
+    def submit_async(self, owner, fn, *args):
+        """
+        Queue a conversion that runs on the shared event loop
+
+        Unlike submit, the job takes no worker thread while it waits on the
+        network, so any number of these run at once.
+
+        Args:
+            owner: Identifier of the session that owns the job
+            fn: Coroutine function run as fn(job, *args), returning the job
+                result
+
+        Returns:
+            The queued ConversionJob
+
+        Raises:
+            AdmissionError: If max_active or max_per_owner jobs are active
+        """
+        # The event loop and its HTTP client are only loaded once needed
+        import aio
+        
+        job = self._admit(owner)
+        aio.get_default_loop().submit(self._run_async(job, fn, *args))
+        return job
+
+    def active_count(self):
+        """Number of jobs queued or running"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.finished_at is None)
+
+    def get(self, job_id, owner):
+        """Get a job by ID, or None if it doesn't exist or isn't owned by owner"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def _run(self, job, fn, *args):
+        """Run a job and record its outcome, with a per-stage timing breakdown"""
+        job.start()
+        try:
+            with metrics.breakdown() as timings:
+                result = fn(job, *args)
+        except Exception as e:
+            job.fail(str(e))
+        else:
+            result['timings'] = timings.to_dict()
+            job.complete(result)
+
+    async def _run_async(self, job, fn, *args):
+        """Run an async job and record its outcome, see _run"""
+        job.start()
+        try:
+            with metrics.breakdown() as timings:
+                result = await fn(job, *args)
+        except Exception as e:
+            job.fail(str(e))
+        else:
+            result['timings'] = timings.to_dict()
+            job.complete(result)
+
+    def _admit(self, owner):
+        """
+        Register a new job unless its owner or the server is at its limit
+
+        Returns:
+            The queued ConversionJob
+
+        Raises:
+            AdmissionError: If max_active or max_per_owner jobs are active
+        """
+        with self._lock:
+            self._prune()
+            active = [job for job in self._jobs.values() if job.finished_at is None]
+            owned = [job for job in active if job.owner == owner]
+            if self.max_per_owner is not None and len(owned) >= self.max_per_owner:
+                metrics.ADMISSION_REJECTIONS.inc(1, 'user')
+                raise AdmissionError(
+                    f"You already have {len(owned)} conversions in progress",
+                    self._retry_after(owned)
+                )
+            if self.max_active is not None and len(active) >= self.max_active:
+                metrics.ADMISSION_REJECTIONS.inc(1, 'global')
+                raise AdmissionError("The server is busy, try again shortly",
+                                     self._retry_after(active))
+
+            job = ConversionJob(owner)
+            self._jobs[job.id] = job
+            return job
+
+    def _retry_after(self, jobs):
+        """Seconds until the first of the given jobs is expected to finish"""
+        etas = [eta for eta in (job.eta_seconds() for job in jobs) if eta is not None]
+        if not etas:
+            return self.retry_after
+        return max(1, math.ceil(min(etas)))
+
+    def _prune(self):
+        """Forget finished jobs older than the retention period"""
+        cutoff = time.time() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
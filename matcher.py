@@ -0,0 +1,121 @@
+"""
+Matcher Module
+Scores YouTube search candidates against Spotify track metadata
+"""
+import re
+import unicodedata
+
+
+# Words that usually mark a different version of a song, unless the track
+# itself is that version
+VERSION_MARKERS = ('cover', 'live', 'karaoke', 'remix', 'instrumental', 'reaction',
+                   'sped', 'slowed', 'nightcore', '8d', 'acoustic', 'tutorial')
+
+NAME_WEIGHT = 0.45
+ARTIST_WEIGHT = 0.30
+DURATION_WEIGHT = 0.25
+VERSION_PENALTY = 0.25
+# Seconds of duration difference at which the duration score reaches zero
+DURATION_TOLERANCE = 30
+
+_ISO_DURATION = re.compile(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$')
+
+
+def _tokens(text):
+    """Split text into casefolded word tokens of any script, without accents"""
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text)
+                   if not unicodedata.combining(char))
+    # Recompose what stripping left decomposed, e.g. Hangul syllables
+    return re.findall(r'\w+', unicodedata.normalize('NFC', text).casefold())
+
+
+def parse_duration(value):
+    """
+    Parse an ISO 8601 duration from videos.list (e.g. "PT3M21S")
+
+    Returns:
+        Duration in seconds, or None if it can't be parsed
+    """
+    match = _ISO_DURATION.match(value or '')
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _coverage(needle, haystack):
+    """Fraction of the needle's tokens present in the haystack tokens"""
+    if not needle:
+        return 0.0
+    haystack = set(haystack)
+    return sum(1 for token in needle if token in haystack) / len(needle)
+
+
+def score_candidate(track, candidate):
+    """
+    Score how well a YouTube video matches a Spotify track
+
+    Args:
+        track: Track record with name, artists and duration_ms
+        candidate: Dict with title, channel and duration (seconds or None)
+
+    Returns:
+        Score, higher is better, roughly between -0.25 and 1
+    """
+    # Drop "(feat. ...)" and "- Remastered 2011" style suffixes from the name
+    name = re.split(r'\s[-(\[]', track['name'])[0] or track['name']
+    name_tokens = _tokens(name)
+    title_tokens = _tokens(candidate['title'])
+    channel_tokens = _tokens(candidate['channel'])
+    channel_joined = ''.join(channel_tokens)
+
+    name_score = _coverage(name_tokens, title_tokens)
+
+    artist_score = 0.0
+    for artist in track['artists']:
+        artist_tokens = _tokens(artist)
+        if artist_tokens and ''.join(artist_tokens) in channel_joined:
+            # Official channels, "Artist - Topic" and "ArtistVEVO"
+            artist_score = 1.0
+            break
+        artist_score = max(artist_score, _coverage(artist_tokens, title_tokens))
+
+    if track.get('duration_ms') and candidate.get('duration') is not None:
+        delta = abs(track['duration_ms'] / 1000 - candidate['duration'])
+        duration_score = max(0.0, 1 - delta / DURATION_TOLERANCE)
+    else:
+        duration_score = 0.5
+
+    track_tokens = set(_tokens(track['name']))
+    penalty = VERSION_PENALTY if any(
+        marker in title_tokens and marker not in track_tokens for marker in VERSION_MARKERS
+    ) else 0.0
+
+    return (NAME_WEIGHT * name_score + ARTIST_WEIGHT * artist_score
+            + DURATION_WEIGHT * duration_score - penalty)
+
+
+def best_candidate(track, candidates, min_score=0.0):
+    """
+    Pick the best-scoring candidate for a track
+
+    Args:
+        track: Track record
+        candidates: Candidate dicts in search result order
+        min_score: Lowest score accepted as a match
+
+    Returns:
+        The best candidate, or None if none scores at least min_score.
+        Ties keep YouTube's ranking. A track whose name has no word tokens
+        can't be scored, so it gets YouTube's top result.
+    """
+    candidates = list(candidates)
+    if not _tokens(track['name']):
+        return candidates[0] if candidates else None
+
+    best, best_score = None, min_score
+    for candidate in candidates:
+        score = score_candidate(track, candidate)
+        if best is None and score >= best_score or score > best_score:
+            best, best_score = candidate, score
+    return best
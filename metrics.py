@@ -0,0 +1,298 @@
+"""
+Metrics Module
+Per-stage latency histograms and counters exposed in the Prometheus text
+format, plus per-conversion timing breakdowns
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Latency buckets in seconds, from cache lookups up to backed-off API calls
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    """Add a metric to the registry rendered by render()"""
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def _format_labels(labels):
+    """Format a label dict as {name="value",...}"""
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    """Format a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by one label"""
+
+    def __init__(self, name, description, label=None):
+        """
+        Create and register a counter
+
+        Args:
+            name: Metric name
+            description: HELP text
+            label: Optional label name the counter is split by
+        """
+        self.name = name
+        self.description = description
+        self.label = label
+        # An unlabeled counter is reported as 0 before its first increment
+        self._values = {} if label else {None: 0}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def inc(self, amount=1, label_value=None):
+        """Increase the counter, for label_value if the counter has a label"""
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value=None):
+        """Get the current count"""
+        with self._lock:
+            return self._values.get(label_value, 0)
+
+    def render(self):
+        """Render the counter as Prometheus text lines"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: str(item[0]))
+        for label_value, value in values:
+            labels = {self.label: label_value} if self.label else {}
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values, optionally split by one label"""
+
+    def __init__(self, name, description, label=None, buckets=BUCKETS):
+        """
+        Create and register a histogram
+
+        Args:
+            name: Metric name
+            description: HELP text
+            label: Optional label name the histogram is split by
+            buckets: Sorted upper bounds of the buckets
+        """
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label_value -> [per-bucket counts (non-cumulative), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value, label_value=None):
+        """Record an observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_value)
+            if state is None:
+                state = self._values[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        """Render the histogram as Prometheus text lines"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted(
+                ((label_value, (list(state[0]), state[1], state[2]))
+                 for label_value, state in self._values.items()),
+                key=lambda item: str(item[0])
+            )
+        for label_value, (counts, total, count) in values:
+            labels = {self.label: label_value} if self.label else {}
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = dict(labels, le=_format_value(float(bound)))
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback whenever metrics are rendered"""
+
+    def __init__(self, name, description, read, label=None):
+        """
+        Create and register a gauge
+
+        Args:
+            name: Metric name
+            description: HELP text
+            read: Callable returning the value, or a dict of label value to
+                value if the gauge has a label
+            label: Optional label name the gauge is split by
+        """
+        self.name = name
+        self.description = description
+        self.read = read
+        self.label = label
+        _register(self)
+
+    def render(self):
+        """Render the gauge as Prometheus text lines"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        value = self.read()
+        if self.label:
+            for label_value, sample in sorted(value.items()):
+                labels = {self.label: label_value}
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(sample)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram('converter_stage_duration_seconds',
+                          'Latency of each pipeline stage call', label='stage')
+STAGE_CALLS = Counter('converter_stage_calls_total',
+                      'Calls made per pipeline stage', label='stage')
+STAGE_ERRORS = Counter('converter_stage_errors_total',
+                       'Calls per pipeline stage that raised an error', label='stage')
+QUOTA_UNITS = Counter('converter_youtube_quota_units_total',
+                      'YouTube Data API quota units spent')
+CACHE_LOOKUPS = Counter('converter_video_cache_lookups_total',
+                        'Video cache lookups by result', label='result')
+INDEX_LOOKUPS = Counter('converter_video_index_lookups_total',
+                        'Video index lookups by result', label='result')
+ADMISSION_REJECTIONS = Counter('converter_admission_rejections_total',
+                               'Conversions turned away by admission control, by limit hit',
+                               label='limit')
+HTTP_CONNECTIONS = Counter('converter_http_connections_total',
+                           'Outbound HTTP connections opened, by API', label='api')
+
+
+class Breakdown:
+    """Time spent per stage during one conversion"""
+
+    def __init__(self):
+        """Start timing a conversion"""
+        self._started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, error=False):
+        """Add one call of a stage to the breakdown"""
+        with self._lock:
+            state = self._stages.get(stage)
+            if state is None:
+                state = self._stages[stage] = {'calls': 0, 'errors': 0, 'seconds': 0.0}
+            state['calls'] += 1
+            state['errors'] += int(error)
+            state['seconds'] += seconds
+
+    def to_dict(self):
+        """
+        Serialize the breakdown
+
+        Returns:
+            Dict with wall_seconds and stages (stage to calls, errors and
+            seconds). Stages run concurrently, so their seconds are summed
+            across threads and can add up to more than wall_seconds.
+        """
+        with self._lock:
+            stages = {
+                stage: dict(state, seconds=round(state['seconds'], 3))
+                for stage, state in sorted(self._stages.items())
+            }
+        return {
+            'wall_seconds': round(time.perf_counter() - self._started, 3),
+            'stages': stages
+        }
+
+
+_current_breakdown = contextvars.ContextVar('current_breakdown', default=None)
+
+
+@contextmanager
+def breakdown():
+    """
+    Collect the stage timings of the enclosed work into a Breakdown
+
+    Work submitted to executors with submit() is included.
+
+    Yields:
+        The Breakdown being filled in
+    """
+    collected = Breakdown()
+    token = _current_breakdown.set(collected)
+    try:
+        yield collected
+    finally:
+        _current_breakdown.reset(token)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Time the enclosed call as one call of a pipeline stage
+
+    Records its latency, counts it (and whether it raised) and adds it to
+    the current conversion's breakdown, if any.
+
+    Args:
+        stage: Name of the stage, e.g. 'youtube_search'
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        STAGE_CALLS.inc(1, stage)
+        if error:
+            STAGE_ERRORS.inc(1, stage)
+        collected = _current_breakdown.get()
+        if collected is not None:
+            collected.add(stage, elapsed, error)
+
+
+def submit(executor, fn, *args):
+    """
+    Submit work to an executor, keeping the caller's breakdown
+
+    Executor threads don't inherit context variables, so the call runs in a
+    copy of the submitting thread's context.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def render():
+    """Render every registered metric in the Prometheus text format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
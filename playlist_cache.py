@@ -0,0 +1,124 @@
+"""
+Playlist Cache Module
+Short-lived per-user cache of formatted Spotify playlist lists, versioned by
+the playlists' snapshot IDs so unchanged lists keep the same ETag
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+
+def format_playlist(playlist):
+    """Format a Spotify playlist object for the web interface"""
+    return {
+        'id': playlist['id'],
+        'name': playlist['name'],
+        'tracks': playlist['tracks']['total'],
+        'image': playlist['images'][0]['url'] if playlist.get('images') else None,
+        'snapshot_id': playlist.get('snapshot_id')
+    }
+
+
+class PlaylistList:
+    """A user's formatted playlists and the version they were cached at"""
+
+    def __init__(self, playlists, fetched_at):
+        """
+        Args:
+            playlists: Formatted playlists, see format_playlist
+            fetched_at: Time the playlists were fetched from Spotify
+        """
+        self.playlists = playlists
+        self.fetched_at = fetched_at
+        # Any edit to a playlist changes its snapshot ID, and with it the version
+        payload = json.dumps(playlists, sort_keys=True, separators=(',', ':'))
+        self.version = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def page(self, offset=0, limit=None):
+        """Get the playlists from offset on, at most limit of them"""
+        end = None if limit is None else offset + limit
+        return self.playlists[offset:end]
+
+
+class PlaylistCache:
+    """LRU cache of each user's PlaylistList, refetched after a short TTL"""
+
+    def __init__(self, ttl, max_entries):
+        """
+        Initialize the cache
+
+        Args:
+            ttl: Seconds a fetched list is served before it is refetched
+            max_entries: Users whose lists are kept at most
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        """
+        Get a user's playlists, fetching them on a miss or once stale
+
+        Args:
+            key: Identifies the user
+            fetch: Callable returning the user's Spotify playlist objects
+
+        Returns:
+            The user's PlaylistList
+        """
+        entry = self.peek(key)
+        if entry is None:
+            # Fetch outside the lock so one user's slow listing doesn't block others
+            entry = self.put(key, fetch())
+        return entry
+
+    def peek(self, key):
+        """Get a user's cached PlaylistList, or None if it's missing or stale"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry.fetched_at > self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, playlists):
+        """
+        Cache a user's freshly fetched playlists
+
+        Args:
+            key: Identifies the user
+            playlists: The user's Spotify playlist objects
+
+        Returns:
+            The new PlaylistList
+        """
+        entry = PlaylistList([format_playlist(playlist) for playlist in playlists], time.time())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key):
+        """Forget a user's cached playlists"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Get the process-wide playlist cache configured in Config"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PlaylistCache(Config.PLAYLIST_CACHE_TTL,
+                                           Config.PLAYLIST_CACHE_SIZE)
+        return _default_cache
@@ -0,0 +1,293 @@
+"""
+Playlist Sync Module
+Remembers converted playlists so re-running a conversion only applies the
+tracks that changed on Spotify since the last run
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from config import Config
+from video_cache import normalize_query
+
+
+def track_keys(tracks):
+    """
+    Build a stable key per track, numbering repeats of the same track
+
+    Args:
+        tracks: Track records in playlist order
+
+    Returns:
+        List of keys, one per track
+    """
+    seen = Counter()
+    keys = []
+    for track in tracks:
+        identity = track.get('id') or normalize_query(track['query'])
+        keys.append(f"{identity}#{seen[identity]}")
+        seen[identity] += 1
+    return keys
+
+
+class SyncStore:
+    """SQLite store of Spotify playlist to YouTube playlist mappings"""
+
+    def __init__(self, path):
+        """
+        Open (or create) the sync database
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS syncs ('
+                'owner TEXT NOT NULL, '
+                'spotify_playlist_id TEXT NOT NULL, '
+                'youtube_playlist_id TEXT NOT NULL, '
+                'snapshot_id TEXT, '
+                'updated_at REAL NOT NULL, '
+                'PRIMARY KEY (owner, spotify_playlist_id))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS sync_items ('
+                'owner TEXT NOT NULL, '
+                'spotify_playlist_id TEXT NOT NULL, '
+                'track_key TEXT NOT NULL, '
+                'song TEXT NOT NULL, '
+                'video_id TEXT NOT NULL, '
+                'playlist_item_id TEXT NOT NULL, '
+                'PRIMARY KEY (owner, spotify_playlist_id, track_key))'
+            )
+
+    def get(self, owner, spotify_playlist_id):
+        """
+        Get the stored mapping for a playlist
+
+        Args:
+            owner: YouTube channel ID the converted playlist belongs to
+            spotify_playlist_id: The Spotify playlist ID
+
+        Returns:
+            Dict with youtube_playlist_id, snapshot_id and items (track_key to
+            dict with song, video_id and playlist_item_id), or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT youtube_playlist_id, snapshot_id FROM syncs '
+                'WHERE owner = ? AND spotify_playlist_id = ?',
+                (owner, spotify_playlist_id)
+            ).fetchone()
+            if row is None:
+                return None
+
+            items = self._conn.execute(
+                'SELECT track_key, song, video_id, playlist_item_id FROM sync_items '
+                'WHERE owner = ? AND spotify_playlist_id = ?',
+                (owner, spotify_playlist_id)
+            ).fetchall()
+
+        return {
+            'youtube_playlist_id': row[0],
+            'snapshot_id': row[1],
+            'items': {
+                key: {'song': song, 'video_id': video_id, 'playlist_item_id': item_id}
+                for key, song, video_id, item_id in items
+            }
+        }
+
+    def save(self, owner, spotify_playlist_id, youtube_playlist_id, snapshot_id, items):
+        """
+        Replace the stored mapping for a playlist
+
+        Args:
+            owner: YouTube channel ID the converted playlist belongs to
+            spotify_playlist_id: The Spotify playlist ID
+            youtube_playlist_id: The YouTube playlist it was converted to
+            snapshot_id: Spotify snapshot the YouTube playlist now reflects
+            items: Dict of track_key to dict with song, video_id and
+                playlist_item_id
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO syncs '
+                '(owner, spotify_playlist_id, youtube_playlist_id, snapshot_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (owner, spotify_playlist_id, youtube_playlist_id, snapshot_id, time.time())
+            )
+            self._conn.execute(
+                'DELETE FROM sync_items WHERE owner = ? AND spotify_playlist_id = ?',
+                (owner, spotify_playlist_id)
+            )
+            self._conn.executemany(
+                'INSERT INTO sync_items '
+                '(owner, spotify_playlist_id, track_key, song, video_id, playlist_item_id) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (owner, spotify_playlist_id, key, item['song'], item['video_id'],
+                     item['playlist_item_id'])
+                    for key, item in items.items()
+                ]
+            )
+
+
+def _added_items(keys, result):
+    """Map track keys to the playlist items a conversion inserted for them"""
+    return {
+        key: {
+            'song': song_result['song'],
+            'video_id': song_result['video_id'],
+            'playlist_item_id': song_result['playlist_item_id']
+        }
+        for key, song_result in zip(keys, result['results'])
+        if song_result['playlist_item_id']
+    }
+
+
+def sync_playlist(spotify, youtube, store, playlist_id, progress_callback=None,
+                  executor=None, details=None, checkpoint_store=None):
+    """
+    Convert a Spotify playlist, updating the previous conversion if there is one
+
+    The first run creates the YouTube playlist. Later runs cost a single
+    Spotify call when the playlist's snapshot is unchanged; otherwise only
+    added tracks are searched and inserted (appended at the end) and removed
+    tracks are deleted. Songs that failed before are retried whenever the
+    playlist changes.
+
+    Args:
+        spotify: Authenticated SpotifyService
+        youtube: Authenticated YouTubeService
+        store: SyncStore holding previous conversions
+        playlist_id: The Spotify playlist ID
+        progress_callback: Optional callable(event, song, video_id)
+        executor: Optional executor to run searches on, see
+            YouTubeService.add_songs_to_playlist
+        details: The playlist's details if the caller already fetched them
+        checkpoint_store: Optional CheckpointStore recording the first run
+            song by song, so a first run that is interrupted before the sync
+            is saved resumes in the playlist it created
+
+    Returns:
+        Dict with playlist_id, unchanged, total_songs, added_count,
+        removed_count, failed_songs, cache_hits, cache_misses, quota_exceeded
+        and a per-song results list for the songs that were processed
+    """
+    if details is None:
+        details = spotify.get_playlist_details(playlist_id)
+    owner = youtube.get_channel_id()
+    state = store.get(owner, playlist_id)
+
+    if state and state['snapshot_id'] == details['snapshot_id']:
+        return {
+            'playlist_id': state['youtube_playlist_id'],
+            'unchanged': True,
+            'total_songs': len(state['items']),
+            'added_count': 0,
+            'removed_count': 0,
+            'failed_songs': [],
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'quota_exceeded': False,
+            'results': []
+        }
+
+    if state and not youtube.playlist_exists(state['youtube_playlist_id']):
+        # The converted playlist was deleted on YouTube, start over
+        state = None
+
+    tracks = list(spotify.iter_playlist_track_records(playlist_id))
+    keys = track_keys(tracks)
+
+    checkpoint = None
+    if state is None:
+        name = f"{details['name']} (from Spotify)"
+        description = (f"Converted from Spotify playlist. "
+                       f"Original had {details['total_tracks']} tracks.")
+        if checkpoint_store:
+            checkpoint = (checkpoint_store.resume(owner, spotify_playlist_id=playlist_id)
+                          or checkpoint_store.create(owner, playlist_id, name, description))
+        try:
+            result = youtube.create_playlist_from_songs(
+                name,
+                tracks,
+                description,
+                progress_callback=progress_callback,
+                checkpoint=checkpoint,
+                executor=executor
+            )
+        except BaseException:
+            if checkpoint:
+                checkpoint.release()
+            raise
+        youtube_playlist_id = result['playlist_id']
+        items = _added_items(keys, result)
+        removed_count = 0
+    else:
+        youtube_playlist_id = state['youtube_playlist_id']
+        items = dict(state['items'])
+        current = set(keys)
+
+        removed_count = 0
+        for key in [key for key in items if key not in current]:
+            if youtube.remove_playlist_item(items[key]['playlist_item_id']):
+                del items[key]
+                removed_count += 1
+
+        new = [(key, track) for key, track in zip(keys, tracks) if key not in items]
+        # Batched inserts keep their order only with explicit positions
+        start_position = len(youtube.list_playlist_items(youtube_playlist_id)) if new else None
+        result = youtube.add_songs_to_playlist(
+            youtube_playlist_id,
+            [track for _, track in new],
+            progress_callback,
+            start_position=start_position,
+            executor=executor
+        )
+        items.update(_added_items([key for key, _ in new], result))
+
+    # Don't record the snapshot as synced if the run was cut short, so the
+    # next run picks up where this one stopped
+    snapshot_id = None if result['quota_exceeded'] else details['snapshot_id']
+    store.save(owner, playlist_id, youtube_playlist_id, snapshot_id, items)
+    if checkpoint:
+        # The sync state tracks the playlist from here on, including the
+        # songs still missing from it
+        checkpoint.finish(completed=True)
+        checkpoint.release()
+
+    return {
+        'playlist_id': youtube_playlist_id,
+        'unchanged': False,
+        'total_songs': len(tracks),
+        'added_count': result['added_count'],
+        'removed_count': removed_count,
+        'failed_songs': result['failed_songs'],
+        'cache_hits': result['cache_hits'],
+        'cache_misses': result['cache_misses'],
+        'quota_exceeded': result['quota_exceeded'],
+        'results': result['results']
+    }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Get the process-wide sync store configured in Config"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SyncStore(Config.SYNC_DB_PATH)
+        return _default_store
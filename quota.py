@@ -0,0 +1,415 @@
+"""
+Quota Module
+Schedules YouTube Data API calls against the daily quota, rate-limits them
+with a token bucket and retries transient failures with backoff
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from googleapiclient.errors import HttpError
+from config import Config
+import metrics
+
+
+# Quota units charged per call, see https://developers.google.com/youtube/v3/determine_quota_cost
+SEARCH_COST = 100
+INSERT_COST = 50
+UPDATE_COST = 50
+DELETE_COST = 50
+LIST_COST = 1
+
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+# 403 reasons that mean "slow down" rather than "out of quota"
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+QUOTA_REASONS = ('quotaExceeded', 'dailyLimitExceeded')
+
+# The YouTube quota resets at midnight Pacific Time
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+
+class QuotaExceededError(Exception):
+    """Raised when a call would exceed the daily YouTube quota"""
+
+
+def _error_reasons(error):
+    """Extract the reason codes from a Google API error response"""
+    try:
+        data = json.loads(error.content.decode('utf-8'))
+    except (ValueError, AttributeError):
+        return set()
+    return {item.get('reason') for item in data.get('error', {}).get('errors', [])}
+
+
+def is_transient(error):
+    """Check whether an API error is worth retrying"""
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status in TRANSIENT_STATUSES:
+        return True
+    return error.resp.status == 403 and bool(_error_reasons(error) & set(RATE_LIMIT_REASONS))
+
+
+def is_quota_exceeded(error):
+    """Check whether an API error reports that the daily quota is used up"""
+    return (isinstance(error, HttpError) and error.resp.status == 403
+            and bool(_error_reasons(error) & set(QUOTA_REASONS)))
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+
+    def __init__(self, rate, capacity):
+        """
+        Initialize a full bucket
+
+        Args:
+            rate: Tokens added per second, 0 disables rate limiting
+            capacity: Maximum number of tokens, i.e. the allowed burst
+        """
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until the requested number of tokens is available"""
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """Wait without blocking the event loop until the tokens are available"""
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def _take(self, tokens):
+        """
+        Take tokens if they are available
+
+        Returns:
+            0 once taken, otherwise the seconds until they could be
+        """
+        if self.rate <= 0:
+            return 0
+        tokens = min(tokens, self.capacity)
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+
+class QuotaLedger:
+    """Quota units spent per quota day, counted in this process"""
+
+    def __init__(self):
+        self._day = None
+        self._spent = 0
+
+    def spent(self, day):
+        """Units spent on a day"""
+        return self._spent if day == self._day else 0
+
+    def charge(self, day, cost, budget):
+        """
+        Add units spent on a day if they fit in the budget
+
+        Returns:
+            Tuple of (charged, units spent before the charge)
+        """
+        spent = self.spent(day)
+        if spent + cost > budget:
+            return False, spent
+        self._day, self._spent = day, spent + cost
+        return True, spent
+
+    def exhaust(self, day, budget):
+        """Count a day's budget as spent"""
+        self._day, self._spent = day, max(self.spent(day), budget)
+
+
+class SharedQuotaLedger:
+    """
+    SQLite record of quota units spent per quota day
+
+    Every process using the same file draws on one budget, as their calls all
+    count against the same Google Cloud project.
+    """
+
+    # Days of history kept
+    RETENTION_DAYS = 7
+
+    def __init__(self, path):
+        """
+        Open (or create) the ledger database
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.reopen()
+
+    def reopen(self):
+        """Open a new connection, e.g. in a child process after fork()"""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # Every API call writes here; a power loss costing the last few
+            # counted units is no reason to sync each one to disk
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS quota_days ('
+                'day TEXT PRIMARY KEY, '
+                'spent INTEGER NOT NULL)'
+            )
+
+    def spent(self, day):
+        """Units spent on a day"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT spent FROM quota_days WHERE day = ?', (day.isoformat(),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def charge(self, day, cost, budget):
+        """
+        Add units spent on a day if they fit in the budget
+
+        The check and the update are one statement, so concurrent processes
+        can't both take the last units.
+
+        Returns:
+            Tuple of (charged, units spent before the charge)
+        """
+        key = day.isoformat()
+        with self._lock, self._conn:
+            if self._conn.execute(
+                'INSERT OR IGNORE INTO quota_days (day, spent) VALUES (?, 0)', (key,)
+            ).rowcount:
+                self._conn.execute(
+                    'DELETE FROM quota_days WHERE day < ?',
+                    ((day - timedelta(days=self.RETENTION_DAYS)).isoformat(),)
+                )
+            charged = self._conn.execute(
+                'UPDATE quota_days SET spent = spent + ? WHERE day = ? AND spent + ? <= ?',
+                (cost, key, cost, budget)
+            ).rowcount
+            spent = self._conn.execute(
+                'SELECT spent FROM quota_days WHERE day = ?', (key,)
+            ).fetchone()[0]
+        return bool(charged), spent - cost if charged else spent
+
+    def exhaust(self, day, budget):
+        """Count a day's budget as spent"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO quota_days (day, spent) VALUES (?, ?) '
+                'ON CONFLICT (day) DO UPDATE SET spent = MAX(spent, excluded.spent)',
+                (day.isoformat(), budget)
+            )
+
+
+class QuotaScheduler:
+    """Central gate for YouTube API calls: quota accounting, rate limit and retries"""
+
+    def __init__(self, daily_budget, rate, burst, max_retries, backoff_base, backoff_max,
+                 ledger=None):
+        """
+        Initialize the scheduler
+
+        Args:
+            daily_budget: Quota units available per day
+            rate: Calls per second allowed by the token bucket
+            burst: Calls allowed in a burst
+            max_retries: Retries for 429/5xx responses
+            backoff_base: Base delay in seconds for exponential backoff
+            backoff_max: Maximum delay in seconds between retries
+            ledger: QuotaLedger or SharedQuotaLedger counting the units
+                spent, by default one counting this process's calls
+        """
+        self.daily_budget = daily_budget
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        self.ledger = ledger or QuotaLedger()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        """Current quota day; units spent on earlier days no longer count"""
+        return datetime.now(QUOTA_TIMEZONE).date()
+
+    def remaining(self):
+        """Quota units left today"""
+        return max(self.daily_budget - self.spent(), 0)
+
+    def spent(self):
+        """Quota units spent today"""
+        with self._lock:
+            return self.ledger.spent(self._today())
+
+    def charge(self, cost):
+        """
+        Reserve quota units for a call
+
+        Raises:
+            QuotaExceededError: If the units are not available today
+        """
+        with self._lock:
+            charged, spent = self.ledger.charge(self._today(), cost, self.daily_budget)
+        if not charged:
+            raise QuotaExceededError(
+                f"YouTube quota exhausted ({spent}/{self.daily_budget} units used today)"
+            )
+        metrics.QUOTA_UNITS.inc(cost)
+
+    def exhaust(self):
+        """Mark today's quota as used up, e.g. after the API reported it"""
+        with self._lock:
+            self.ledger.exhaust(self._today(), self.daily_budget)
+
+    def predict(self, search_count, insert_count, other_units=0):
+        """
+        Predict whether a workload fits in the remaining quota
+
+        Args:
+            search_count: Number of search.list calls
+            insert_count: Number of playlistItems.insert calls
+            other_units: Any additional units, e.g. creating the playlist
+
+        Returns:
+            Dict with estimated_units, remaining_units and fits
+        """
+        estimated = search_count * SEARCH_COST + insert_count * INSERT_COST + other_units
+        remaining = self.remaining()
+        return {
+            'estimated_units': estimated,
+            'remaining_units': remaining,
+            'fits': estimated <= remaining
+        }
+
+    def call(self, cost, fn, calls=1):
+        """
+        Run an API call through the scheduler
+
+        Args:
+            cost: Quota units charged per attempt
+            fn: Callable performing the request
+            calls: Number of API calls fn makes, e.g. the size of a batch
+
+        Returns:
+            Whatever fn returns
+
+        Raises:
+            QuotaExceededError: If the daily quota is used up
+        """
+        attempt = 0
+        while True:
+            self.charge(cost)
+            with metrics.timed('youtube_throttle'):
+                self.bucket.acquire(calls)
+            try:
+                return fn()
+            except HttpError as e:
+                if is_quota_exceeded(e):
+                    self.exhaust()
+                    raise QuotaExceededError(str(e)) from e
+                if not is_transient(e) or attempt >= self.max_retries:
+                    raise
+
+            # Exponential backoff with full jitter
+            with metrics.timed('youtube_backoff'):
+                time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def call_async(self, cost, fn, calls=1):
+        """
+        Run an async API call through the scheduler, see call
+
+        Args:
+            cost: Quota units charged per attempt
+            fn: Coroutine function performing the request
+            calls: Number of API calls fn makes
+
+        Returns:
+            Whatever fn's coroutine returns
+        """
+        attempt = 0
+        while True:
+            # The ledger may be SQLite, which must not block the event loop
+            await asyncio.to_thread(self.charge, cost)
+            with metrics.timed('youtube_throttle'):
+                await self.bucket.acquire_async(calls)
+            try:
+                return await fn()
+            except HttpError as e:
+                if is_quota_exceeded(e):
+                    await asyncio.to_thread(self.exhaust)
+                    raise QuotaExceededError(str(e)) from e
+                if not is_transient(e) or attempt >= self.max_retries:
+                    raise
+
+            with metrics.timed('youtube_backoff'):
+                await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter before retry number attempt + 1"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, delay)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """Get the process-wide scheduler configured in Config"""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            ledger = None
+            if Config.YOUTUBE_QUOTA_DB_PATH:
+                ledger = SharedQuotaLedger(Config.YOUTUBE_QUOTA_DB_PATH)
+            _default_scheduler = QuotaScheduler(
+                Config.YOUTUBE_DAILY_QUOTA,
+                rate=Config.YOUTUBE_REQUESTS_PER_SECOND,
+                burst=Config.YOUTUBE_REQUEST_BURST,
+                max_retries=Config.YOUTUBE_MAX_RETRIES,
+                backoff_base=Config.YOUTUBE_BACKOFF_BASE,
+                backoff_max=Config.YOUTUBE_BACKOFF_MAX,
+                ledger=ledger
+            )
+        return _default_scheduler
+
+
+def _reopen_default_ledger():
+    """Give a forked child its own connection to the default scheduler's ledger"""
+    if _default_scheduler is not None and isinstance(_default_scheduler.ledger, SharedQuotaLedger):
+        _default_scheduler.ledger.reopen()
+
+
+# A SQLite connection must not be used across fork()
+os.register_at_fork(after_in_child=_reopen_default_ledger)
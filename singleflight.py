@@ -0,0 +1,226 @@
+"""
+Single-Flight Module
+Coalesces concurrent identical lookups so they share one upstream request
+"""
+import asyncio
+import threading
+import time
+from config import Config
+
+
+class _Flight:
+    """An in-progress call that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time
+
+    Callers for a key that is already in flight wait for that call and share
+    its result. With a shared store (see VideoCache leases), one process at a
+    time resolves a key and the other processes wait for its result to show
+    up in the store instead of repeating the request.
+    """
+
+    def __init__(self, store=None, lease_ttl=10, poll_interval=0.05):
+        """
+        Initialize the single-flight group
+
+        Args:
+            store: Optional object with acquire_lease(key, ttl) and
+                release_lease(key) shared between processes
+            lease_ttl: Seconds a cross-process lease is held at most
+            poll_interval: Seconds between checks while another process
+                holds the lease
+        """
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+        self._remote = 0
+
+    def do(self, key, fn, peek=None):
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: Identity of the call
+            fn: Callable performing the upstream request
+            peek: Optional callable returning (found, value) from the shared
+                store, used while another process holds the key's lease
+
+        Returns:
+            Tuple of (result, shared), shared is True if the result came from
+            another caller's request
+        """
+        with self._lock:
+            self._calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                flight = _Flight()
+                self._flights[key] = flight
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, shared = self._lead(key, fn, peek)
+            return flight.result, shared
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _lead(self, key, fn, peek):
+        """Run the call for this process, coordinating with other processes"""
+        if self.store is None or peek is None:
+            return self._execute(fn), False
+
+        deadline = time.monotonic() + self.lease_ttl
+        while not self.store.acquire_lease(key, self.lease_ttl):
+            found, value = peek()
+            if found:
+                with self._lock:
+                    self._remote += 1
+                return value, True
+            if time.monotonic() > deadline:
+                # The other process is stuck or gone, stop waiting for it
+                return self._execute(fn), False
+            time.sleep(self.poll_interval)
+
+        try:
+            # The previous lease holder may have just stored the result
+            found, value = peek()
+            if found:
+                with self._lock:
+                    self._remote += 1
+                return value, True
+            return self._execute(fn), False
+        finally:
+            self.store.release_lease(key)
+
+    def _execute(self, fn):
+        """Run the upstream call and count it"""
+        with self._lock:
+            self._executions += 1
+        return fn()
+
+    def stats(self):
+        """
+        Get the coalescing counters
+
+        Returns:
+            Dict with calls, executions, coalesced (waited on a call in this
+            process) and remote (satisfied by another process)
+        """
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'executions': self._executions,
+                'coalesced': self._coalesced,
+                'remote': self._remote
+            }
+
+
+class AsyncSingleFlight:
+    """
+    Runs at most one coroutine per key at a time on an event loop
+
+    The asyncio counterpart of SingleFlight: callers for a key already in
+    flight await the leader's task instead of blocking a thread. It only
+    coalesces within the loop, there is no cross-process lease.
+    """
+
+    def __init__(self):
+        """Initialize the single-flight group, used from one loop at a time"""
+        self._flights = {}
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: Identity of the call
+            fn: Coroutine function performing the upstream request
+
+        Returns:
+            Tuple of (result, shared), see SingleFlight.do
+        """
+        self._calls += 1
+        task = self._flights.get(key)
+        shared = task is not None
+        if shared:
+            self._coalesced += 1
+        else:
+            self._executions += 1
+            task = self._flights[key] = asyncio.ensure_future(fn())
+
+            def land(done):
+                if self._flights.get(key) is done:
+                    del self._flights[key]
+            task.add_done_callback(land)
+
+        # A cancelled caller leaves the call running for the others
+        return await asyncio.shield(task), shared
+
+    def stats(self):
+        """Get the coalescing counters, see SingleFlight.stats"""
+        return {
+            'calls': self._calls,
+            'executions': self._executions,
+            'coalesced': self._coalesced,
+            'remote': 0
+        }
+
+
+_default_group = None
+_default_group_lock = threading.Lock()
+_default_async_group = None
+
+
+def get_default_group(store=None):
+    """
+    Get the process-wide single-flight group for video searches
+
+    Args:
+        store: Shared store used when Config.SEARCH_SINGLEFLIGHT_SHARED is set
+    """
+    global _default_group
+    with _default_group_lock:
+        if _default_group is None:
+            _default_group = SingleFlight(
+                store=store if Config.SEARCH_SINGLEFLIGHT_SHARED else None,
+                lease_ttl=Config.SEARCH_SINGLEFLIGHT_LEASE_TTL
+            )
+        return _default_group
+
+
+def get_default_async_group():
+    """Get the process-wide single-flight group for searches on the shared loop"""
+    global _default_async_group
+    with _default_group_lock:
+        if _default_async_group is None:
+            _default_async_group = AsyncSingleFlight()
+        return _default_async_group
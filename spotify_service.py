@@ -2,9 +2,95 @@
 Spotify Service Module
 Handles all Spotify API interactions including authentication and playlist fetching
 """
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from config import Config
+import metrics
+from tokens import SPOTIFY
+from transport import get_default_session
+
+# spotipy is imported where it is used: loading it (and redis, which spotipy
+# imports when installed) is a large share of the app's import time
+
+
+# Only request what the converter uses to keep track pages small
+TRACK_FIELDS = ('total,items(track(id,name,artists(name),album(name),'
+                'external_ids(isrc),duration_ms))')
+TRACK_PAGE_SIZE = 100
+PLAYLIST_PAGE_SIZE = 50
+
+
+def create_oauth():
+    """Create the SpotifyOAuth helper for the configured app"""
+    from spotipy.cache_handler import MemoryCacheHandler
+    from spotipy.oauth2 import SpotifyOAuth
+    
+    return SpotifyOAuth(
+        client_id=Config.SPOTIFY_CLIENT_ID,
+        client_secret=Config.SPOTIFY_CLIENT_SECRET,
+        redirect_uri=Config.SPOTIFY_REDIRECT_URI,
+        scope=Config.SPOTIFY_SCOPE,
+        requests_session=get_default_session(),
+        # Tokens live in the token store, never in a shared cache file
+        cache_handler=MemoryCacheHandler()
+    )
+
+
+def track_record(track):
+    """
+    Convert a Spotify track object into a structured record
+    
+    Returns:
+        Dict with id, name, artists, album, isrc, duration_ms and query, the
+        "Artist - Track Name" string
+    """
+    artists = [artist['name'] for artist in track.get('artists') or []]
+    # Get primary artist and track name
+    artist = artists[0] if artists else 'Unknown Artist'
+    return {
+        'id': track.get('id'),
+        'name': track['name'],
+        'artists': artists,
+        'album': (track.get('album') or {}).get('name'),
+        'isrc': (track.get('external_ids') or {}).get('isrc'),
+        'duration_ms': track.get('duration_ms'),
+        'query': f"{artist} - {track['name']}"
+    }
+
+
+class StoredTokenManager:
+    """
+    spotipy auth manager reading a session's token from a TokenStore
+    
+    spotipy asks for the token before every request, so it is refreshed
+    before it expires even in the middle of a long conversion.
+    """
+    
+    def __init__(self, store, sid, oauth=None):
+        """
+        Args:
+            store: TokenStore holding the session's token info
+            sid: Session ID the token belongs to
+            oauth: SpotifyOAuth used to refresh the token, created on the
+                first refresh if None
+        """
+        self.store = store
+        self.sid = sid
+        self.oauth = oauth
+    
+    def _refresh(self, info):
+        """Refresh stored token info"""
+        if self.oauth is None:
+            self.oauth = create_oauth()
+        return self.oauth.refresh_access_token(info['refresh_token'])
+    
+    def get_access_token(self, as_dict=False):
+        """Get the session's current access token, see spotipy's auth managers"""
+        token_info = self.store.fresh(self.sid, SPOTIFY, self._refresh)
+        if token_info is None:
+            raise Exception("Not authenticated with Spotify")
+        return token_info if as_dict else token_info['access_token']
 
 
 class SpotifyService:
@@ -12,84 +98,178 @@ class SpotifyService:
     
     def __init__(self):
         """Initialize Spotify service with OAuth"""
-        self.sp_oauth = SpotifyOAuth(
-            client_id=Config.SPOTIFY_CLIENT_ID,
-            client_secret=Config.SPOTIFY_CLIENT_SECRET,
-            redirect_uri=Config.SPOTIFY_REDIRECT_URI,
-            scope=Config.SPOTIFY_SCOPE
-        )
+        self._sp_oauth = None
         self.sp = None
     
+    @property
+    def sp_oauth(self):
+        """SpotifyOAuth helper, created on first use"""
+        # Pooled API clients never start an OAuth flow, so they skip building it
+        if self._sp_oauth is None:
+            self._sp_oauth = create_oauth()
+        return self._sp_oauth
+    
     def get_auth_url(self):
         """Get Spotify authorization URL"""
         return self.sp_oauth.get_authorize_url()
     
+    def get_token_info(self, code):
+        """
+        Exchange an authorization code for token info
+        
+        Returns:
+            Dict with access_token, refresh_token and expires_at
+        """
+        return self.sp_oauth.get_access_token(code, as_dict=True, check_cache=False)
+    
     def get_access_token(self, code):
         """Exchange authorization code for access token"""
-        token_info = self.sp_oauth.get_access_token(code)
-        return token_info['access_token']
+        return self.get_token_info(code)['access_token']
+    
+    def set_token_store(self, store, sid):
+        """
+        Authenticate the client with a session's token from a token store
+        
+        Args:
+            store: TokenStore holding the token info
+            sid: Session ID the token belongs to
+        """
+        import spotipy
+        
+        self.sp = spotipy.Spotify(auth_manager=StoredTokenManager(store, sid, self._sp_oauth),
+                                  requests_session=get_default_session())
     
     def set_access_token(self, token):
-        """Set access token for Spotify client"""
-        self.sp = spotipy.Spotify(auth=token)
+        """
+        Set access token for Spotify client
+        
+        The client sends the token with each request over the process-wide
+        keep-alive session, so users share pooled connections.
+        """
+        import spotipy
+        
+        self.sp = spotipy.Spotify(auth=token, requests_session=get_default_session())
+    
+    def _iter_pages(self, fetch_page, page_size):
+        """
+        Iterate over every page of a paginated endpoint
+        
+        The first page reports the total, so the remaining pages are fetched
+        concurrently by offset while earlier pages are being consumed. Only a
+        bounded window of pages is in flight at once, and pages are yielded
+        in order.
+        
+        Args:
+            fetch_page: Callable taking an offset and returning that page
+            page_size: Number of items per page
+            
+        Yields:
+            Pages in offset order
+        """
+        def fetch(offset):
+            with metrics.timed('spotify_page'):
+                return fetch_page(offset)
+        
+        first_page = fetch(0)
+        offsets = iter(range(page_size, first_page['total'], page_size))
+        workers = max(1, Config.SPOTIFY_PAGE_WORKERS)
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Start on the next pages before handing out the first one
+            pending = deque(metrics.submit(executor, fetch, offset)
+                            for offset in islice(offsets, workers))
+            yield first_page
+            
+            while pending:
+                page = pending.popleft().result()
+                for offset in islice(offsets, 1):
+                    pending.append(metrics.submit(executor, fetch, offset))
+                yield page
     
     def get_user_playlists(self):
         """Fetch all playlists for the authenticated user"""
         if not self.sp:
             raise Exception("Not authenticated with Spotify")
         
-        playlists = []
-        results = self.sp.current_user_playlists()
-        
-        while results:
-            playlists.extend(results['items'])
-            if results['next']:
-                results = self.sp.next(results)
-            else:
-                results = None
+        pages = self._iter_pages(
+            lambda offset: self.sp.current_user_playlists(limit=PLAYLIST_PAGE_SIZE,
+                                                          offset=offset),
+            PLAYLIST_PAGE_SIZE
+        )
         
+        playlists = []
+        for page in pages:
+            playlists.extend(page['items'])
         return playlists
     
-    def get_playlist_tracks(self, playlist_id):
+    def iter_playlist_track_records(self, playlist_id):
         """
-        Fetch all tracks from a specific playlist
+        Stream the tracks of a playlist page by page as structured records
+        
+        Later pages keep downloading while earlier tracks are consumed, so
+        callers can start working before the whole playlist is fetched.
         
         Args:
             playlist_id: The Spotify playlist ID
             
-        Returns:
-            List of song strings in format "Artist - Track Name"
+        Yields:
+            Dicts with id, name, artists, album, isrc, duration_ms and query,
+            the "Artist - Track Name" string
         """
         if not self.sp:
             raise Exception("Not authenticated with Spotify")
         
-        tracks = []
-        results = self.sp.playlist_tracks(playlist_id)
+        pages = self._iter_pages(
+            lambda offset: self.sp.playlist_items(playlist_id,
+                                                  fields=TRACK_FIELDS,
+                                                  limit=TRACK_PAGE_SIZE,
+                                                  offset=offset,
+                                                  additional_types=('track',)),
+            TRACK_PAGE_SIZE
+        )
         
-        while results:
-            for item in results['items']:
+        for page in pages:
+            for item in page['items']:
                 track = item['track']
                 if track:  # Sometimes track can be None
-                    # Get primary artist and track name
-                    artist = track['artists'][0]['name'] if track['artists'] else 'Unknown Artist'
-                    track_name = track['name']
-                    tracks.append(f"{artist} - {track_name}")
+                    yield track_record(track)
+    
+    def iter_playlist_tracks(self, playlist_id):
+        """
+        Stream the tracks of a playlist page by page
+        
+        Args:
+            playlist_id: The Spotify playlist ID
             
-            if results['next']:
-                results = self.sp.next(results)
-            else:
-                results = None
+        Yields:
+            Song strings in format "Artist - Track Name"
+        """
+        for record in self.iter_playlist_track_records(playlist_id):
+            yield record['query']
+    
+    def get_playlist_tracks(self, playlist_id):
+        """
+        Fetch all tracks from a specific playlist
         
-        return tracks
+        Args:
+            playlist_id: The Spotify playlist ID
+            
+        Returns:
+            List of song strings in format "Artist - Track Name"
+        """
+        return list(self.iter_playlist_tracks(playlist_id))
     
     def get_playlist_details(self, playlist_id):
         """Get playlist details including name and description"""
         if not self.sp:
             raise Exception("Not authenticated with Spotify")
         
-        playlist = self.sp.playlist(playlist_id)
+        with metrics.timed('spotify_playlist'):
+            playlist = self.sp.playlist(playlist_id,
+                                        fields='name,description,snapshot_id,tracks.total')
         return {
             'name': playlist['name'],
             'description': playlist.get('description', ''),
+            'snapshot_id': playlist.get('snapshot_id'),
             'total_tracks': playlist['tracks']['total']
         }
@@ -0,0 +1,43 @@
+"""
+Tests for the shared event loop thread
+"""
+import asyncio
+import concurrent.futures
+import pytest
+from aio import EventLoopThread
+
+
+@pytest.fixture
+def loop_thread():
+    loop_thread = EventLoopThread(max_connections=1, timeout=1)
+    yield loop_thread
+    loop_thread.loop.call_soon_threadsafe(loop_thread.loop.stop)
+
+
+def test_run_returns_the_result(loop_thread):
+    async def add(a, b):
+        await asyncio.sleep(0)
+        return a + b
+    assert loop_thread.run(add(1, 2)) == 3
+
+
+def test_errors_reach_the_caller(loop_thread):
+    async def fail():
+        raise ValueError("boom")
+    with pytest.raises(ValueError):
+        loop_thread.run(fail())
+
+
+def test_cancelled_coroutine_does_not_leave_the_caller_waiting(loop_thread):
+    started = concurrent.futures.Future()
+
+    async def wait_forever():
+        started.set_result(asyncio.current_task())
+        await asyncio.sleep(3600)
+
+    future = loop_thread.submit(wait_forever())
+    task = started.result(timeout=1)
+    loop_thread.loop.call_soon_threadsafe(task.cancel)
+
+    with pytest.raises(concurrent.futures.CancelledError):
+        future.result(timeout=1)
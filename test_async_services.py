@@ -0,0 +1,72 @@
+"""
+Tests for the async YouTube client against a mocked HTTP transport
+"""
+import asyncio
+import time
+import httpx
+import pytest
+from async_services import AsyncYouTubeService
+from benchmarks.fakes import fake_track
+from quota import QuotaScheduler
+from singleflight import AsyncSingleFlight
+from spotify_service import track_record
+from tokens import YOUTUBE, TokenStore
+
+
+@pytest.fixture
+def youtube(tmp_path):
+    store = TokenStore(str(tmp_path / 'tokens.db'), refresh_margin=300, retention=3600)
+    store.save('sid', YOUTUBE, {'access_token': 'test', 'refresh_token': 'refresh',
+                                'scopes': [], 'expires_at': time.time() + 3600})
+    service = AsyncYouTubeService(store, 'sid')
+    service.scheduler = QuotaScheduler(10 ** 6, rate=0, burst=1, max_retries=0,
+                                       backoff_base=0, backoff_max=0)
+    service.flights = AsyncSingleFlight()
+    service.requests = []
+
+    async def handle(request):
+        endpoint = request.url.path.rsplit('/', 1)[-1]
+        service.requests.append(endpoint)
+        # Let the other lookups start while this one is in flight
+        await asyncio.sleep(0.02)
+        if endpoint == 'videos':
+            return httpx.Response(200, json={'items': [
+                {'id': video_id, 'contentDetails': {'duration': 'PT3M30S'}}
+                for video_id in request.url.params['id'].split(',')
+            ]})
+        query = request.url.params['q']
+        return httpx.Response(200, json={'items': [
+            {'id': {'videoId': f"{rank}{query[:10]}"},
+             'snippet': {'title': query, 'channelTitle': 'Channel'}}
+            for rank in range(int(request.url.params['maxResults']))
+        ]})
+
+    service.http = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    return service
+
+
+def test_concurrent_lookups_share_one_search(youtube):
+    track = track_record(fake_track(1))
+
+    async def lookups():
+        return await asyncio.gather(
+            *(youtube.lookup_video('A - One') for _ in range(5)),
+            *(youtube.lookup_track(track) for _ in range(3))
+        )
+    results = asyncio.run(lookups())
+
+    assert youtube.requests.count('search') == 2
+    assert youtube.requests.count('videos') == 1
+    assert len({video_id for video_id, _ in results[:5]}) == 1
+    assert len({video_id for video_id, _ in results[5:]}) == 1
+
+
+def test_lookups_after_a_flight_lands_search_again(youtube):
+    async def lookup():
+        return await youtube.lookup_video('A - One')
+    asyncio.run(lookup())
+    asyncio.run(lookup())
+
+    # Without a video cache nothing is remembered between flights
+    assert youtube.requests.count('search') == 2
+    assert youtube.flights.stats()['coalesced'] == 0
@@ -0,0 +1,41 @@
+"""
+Tests for the batch converter's per-playlist work
+"""
+import pytest
+import batch
+import checkpoints
+from checkpoints import CheckpointStore
+from quota import QuotaScheduler
+
+
+@pytest.fixture
+def worker(fake_apis, tmp_path, monkeypatch):
+    """Set up this process as a batch worker talking to the fake APIs"""
+    store = CheckpointStore(str(tmp_path / 'checkpoints.db'))
+    monkeypatch.setattr(checkpoints, 'get_default_store', lambda: store)
+    monkeypatch.setattr(batch, '_spotify', fake_apis.spotify())
+    monkeypatch.setattr(batch, '_owner', 'UCbenchmark')
+
+    def use_quota(budget):
+        scheduler = QuotaScheduler(budget, rate=0, burst=1, max_retries=0,
+                                   backoff_base=0, backoff_max=0)
+        monkeypatch.setattr(batch, '_youtube', fake_apis.youtube(scheduler))
+    return use_quota
+
+
+def test_rerun_resumes_then_skips(fake_apis, worker):
+    worker(400)
+    stopped = batch.convert('bench4')
+    assert stopped['quota_exceeded']
+    assert stopped['conversion_id']
+
+    worker(10 ** 6)
+    resumed = batch.convert('bench4')
+    assert resumed['success'] and not resumed['quota_exceeded']
+    assert resumed['conversion_id'] == stopped['conversion_id']
+    assert len(fake_apis.youtube_http.playlist_items(resumed['playlist_id'])) == 4
+
+    again = batch.convert('bench4')
+    assert again['already_converted']
+    assert again['playlist_id'] == resumed['playlist_id']
+    assert len(fake_apis.youtube_http._playlists) == 1
@@ -0,0 +1,34 @@
+"""
+Tests for bulk conversions against the fake APIs
+"""
+from config import Config
+import bulk
+from checkpoints import CheckpointStore
+from quota import QuotaScheduler
+
+
+def scheduler(budget):
+    return QuotaScheduler(budget, rate=0, burst=1, max_retries=0, backoff_base=0, backoff_max=0)
+
+
+def test_rerun_resumes_unfinished_and_skips_converted(fake_apis, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'BULK_PLAYLIST_WORKERS', 1)
+    store = CheckpointStore(str(tmp_path / 'checkpoints.db'))
+    playlists = bulk.load_playlists(fake_apis.spotify(), ['bench3', 'bench4'])
+
+    # Enough quota for the first playlist and part of the second
+    first = bulk.convert_playlists(fake_apis.youtube(scheduler(700)), store, playlists)
+    done, stopped = first['playlists']
+    assert first['quota_exceeded']
+    assert done['added_count'] == 3 and not done['quota_exceeded']
+    assert stopped['quota_exceeded'] and stopped['added_count'] < 4
+
+    second = bulk.convert_playlists(fake_apis.youtube(scheduler(10 ** 6)), store, playlists)
+    skipped, resumed = second['playlists']
+    assert skipped['already_converted'] and skipped['playlist_id'] == done['playlist_id']
+    assert resumed['conversion_id'] == stopped['conversion_id']
+    assert resumed['playlist_id'] is not None and not resumed['quota_exceeded']
+
+    youtube_playlists = fake_apis.youtube_http._playlists
+    assert len(youtube_playlists) == 2
+    assert len(fake_apis.youtube_http.playlist_items(resumed['playlist_id'])) == 4
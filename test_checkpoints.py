@@ -0,0 +1,177 @@
+"""
+Tests for conversion checkpoints
+"""
+import sqlite3
+import threading
+import time
+import pytest
+from checkpoints import CheckpointStore, ClaimLostError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / 'checkpoints.db'))
+
+
+def test_claim_starts_a_conversion_of_a_new_playlist(store):
+    checkpoint, converted = store.claim('channel', 'spotify', 'Name', 'Description')
+    assert converted is None
+    assert checkpoint.spotify_playlist_id == 'spotify'
+    assert checkpoint.name == 'Name'
+
+
+def test_claim_resumes_an_unfinished_conversion(store):
+    first, _ = store.claim('channel', 'spotify', 'Name', 'Description')
+    first.set_playlist_id('youtube')
+    first.record_resolved(0, 'A - a', 'video-a')
+    first.record_written(0, 'added', 'item-a')
+    first.finish(completed=False)
+    first.release()
+
+    resumed, converted = store.claim('channel', 'spotify', 'Other', 'Other')
+    assert converted is None
+    assert resumed.id == first.id
+    assert resumed.youtube_playlist_id == 'youtube'
+    assert resumed.name == 'Name'
+    assert resumed.added_count() == 1
+
+
+def test_claim_skips_a_completed_conversion(store):
+    first, _ = store.claim('channel', 'spotify', 'Name', 'Description')
+    first.set_playlist_id('youtube')
+    first.finish(completed=True)
+    first.release()
+
+    assert store.claim('channel', 'spotify', 'Name', 'Description') == (None, 'youtube')
+    # Another channel converts the playlist on its own
+    checkpoint, converted = store.claim('other', 'spotify', 'Name', 'Description')
+    assert checkpoint is not None and converted is None
+
+
+def test_claim_leaves_a_running_conversion_alone(store):
+    store.claim('channel', 'spotify', 'Name', 'Description')
+    assert store.claim('channel', 'spotify', 'Name', 'Description') == (None, None)
+
+
+def test_two_processes_never_claim_the_same_conversion(tmp_path):
+    path = str(tmp_path / 'checkpoints.db')
+    first = CheckpointStore(path).create('channel', 'spotify', 'Name', 'Description')
+    first.finish(completed=False)
+    first.release()
+
+    # Each store stands in for a process with its own connection
+    stores = [CheckpointStore(path) for _ in range(8)]
+    barrier = threading.Barrier(len(stores))
+    claims = []
+
+    def claim(store):
+        barrier.wait()
+        claims.append(store.claim('channel', 'spotify', 'Name', 'Description')[0])
+
+    threads = [threading.Thread(target=claim, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [checkpoint for checkpoint in claims if checkpoint is not None]
+    assert len(claims) == 8 and len(winners) == 1
+    assert winners[0].id == first.id
+    assert stores[0].resume('channel', conversion_id=first.id) is None
+
+    winners[0].release()
+    assert stores[1].resume('channel', conversion_id=first.id) is not None
+
+
+def test_new_playlist_is_created_once_across_processes(tmp_path):
+    path = str(tmp_path / 'checkpoints.db')
+    first = CheckpointStore(path)
+    second = CheckpointStore(path)
+    assert first.claim('channel', 'spotify', 'Name', 'Description')[0] is not None
+    assert second.claim('channel', 'spotify', 'Name', 'Description') == (None, None)
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    path = str(tmp_path / 'checkpoints.db')
+    stalled = CheckpointStore(path, lease=0.1).create('channel', 'spotify', 'Name', 'Description')
+    stalled.set_playlist_id('youtube')
+    other = CheckpointStore(path, lease=60)
+    assert other.resume('channel', conversion_id=stalled.id) is None
+
+    time.sleep(0.2)
+    taken = other.resume('channel', conversion_id=stalled.id)
+    assert taken is not None and taken.youtube_playlist_id == 'youtube'
+
+    # The stalled run finds out on its next write instead of inserting twice
+    with pytest.raises(ClaimLostError):
+        stalled.record_resolved(0, 'A - a', 'video-a')
+    stalled.release()
+    assert other.resume('channel', conversion_id=stalled.id) is None
+    taken.record_resolved(0, 'A - a', 'video-a')
+
+
+def test_conversions_left_running_before_leases_can_be_resumed(tmp_path):
+    path = str(tmp_path / 'checkpoints.db')
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE conversions (id TEXT PRIMARY KEY, owner TEXT NOT NULL, '
+        'spotify_playlist_id TEXT NOT NULL, youtube_playlist_id TEXT, name TEXT NOT NULL, '
+        'description TEXT NOT NULL, status TEXT NOT NULL, updated_at REAL NOT NULL)'
+    )
+    conn.execute("INSERT INTO conversions VALUES "
+                 "('old', 'channel', 'spotify', 'youtube', 'Name', '', 'running', 0)")
+    conn.commit()
+    conn.close()
+
+    checkpoint = CheckpointStore(path).resume('channel', spotify_playlist_id='spotify')
+    assert checkpoint.id == 'old' and checkpoint.youtube_playlist_id == 'youtube'
+
+
+def resolved(store, songs):
+    """Start a conversion with songs resolved to videos but not yet written"""
+    checkpoint = store.create('channel', 'spotify', 'Name', 'Description')
+    checkpoint.set_playlist_id('youtube')
+    for position, (song, video_id) in enumerate(songs):
+        checkpoint.record_resolved(position, song, video_id)
+    return checkpoint
+
+
+def test_reconcile_claims_inserts_that_landed_unrecorded(store):
+    checkpoint = resolved(store, [('A - a', 'va'), ('B - b', 'vb'), ('C - c', 'vc')])
+    checkpoint.record_written(0, 'added', 'item-a')
+
+    # The insert of b landed before a crash, c's never went out
+    checkpoint.reconcile([('item-a', 'va'), ('item-b', 'vb')])
+
+    assert checkpoint.get(1, 'B - b')['status'] == 'added'
+    assert checkpoint.get(1, 'B - b')['playlist_item_id'] == 'item-b'
+    assert checkpoint.get(2, 'C - c')['status'] is None
+    assert checkpoint.added_count() == 2
+
+
+def test_reconcile_matches_repeated_videos_one_item_each(store):
+    checkpoint = resolved(store, [('A - a', 'va'), ('A - a (again)', 'va'), ('A - a (thrice)', 'va')])
+    checkpoint.record_written(0, 'added', 'item-1')
+
+    checkpoint.reconcile([('item-1', 'va'), ('item-2', 'va')])
+
+    assert checkpoint.get(1, 'A - a (again)')['playlist_item_id'] == 'item-2'
+    assert checkpoint.get(2, 'A - a (thrice)')['status'] is None
+
+
+def test_reconcile_ignores_unresolved_songs(store):
+    checkpoint = resolved(store, [('A - a', None)])
+    checkpoint.reconcile([('item-x', 'vx')])
+    assert checkpoint.get(0, 'A - a')['status'] is None
+
+
+def test_reconciled_state_survives_a_resume(store):
+    checkpoint = resolved(store, [('A - a', 'va')])
+    checkpoint.reconcile([('item-a', 'va')])
+    checkpoint.finish(completed=False)
+    checkpoint.release()
+
+    resumed = store.resume('channel', conversion_id=checkpoint.id)
+    assert resumed.get(0, 'A - a')['playlist_item_id'] == 'item-a'
+    # A different song at the position isn't mistaken for the stored one
+    assert resumed.get(0, 'B - b') is None
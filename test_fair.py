@@ -0,0 +1,64 @@
+"""
+Tests for the round-robin song executor
+"""
+import threading
+from fair import FairExecutor
+
+
+def run_order(executor, submissions):
+    """
+    Queue work behind a blocked worker, then let it all run
+
+    Args:
+        executor: FairExecutor with a single worker
+        submissions: List of (owner, name) queued in this order
+
+    Returns:
+        Names in the order they ran
+    """
+    gate = threading.Event()
+    order = []
+    first = executor.submit('blocker', gate.wait, 5)
+    futures = [executor.submit(owner, order.append, name) for owner, name in submissions]
+    gate.set()
+    first.result(timeout=5)
+    for future in futures:
+        future.result(timeout=5)
+    return order
+
+
+def test_second_owner_runs_before_the_first_owners_backlog_drains():
+    executor = FairExecutor(max_workers=1)
+    submissions = [('alice', f"a{index}") for index in range(6)] + [('bob', 'b0')]
+    order = run_order(executor, submissions)
+    assert order == ['a0', 'b0', 'a1', 'a2', 'a3', 'a4', 'a5']
+
+
+def test_owners_take_turns_keeping_their_own_order():
+    executor = FairExecutor(max_workers=1)
+    submissions = ([('alice', f"a{index}") for index in range(3)]
+                   + [('bob', f"b{index}") for index in range(3)]
+                   + [('carol', 'c0')])
+    order = run_order(executor, submissions)
+    assert order == ['a0', 'b0', 'c0', 'a1', 'b1', 'a2', 'b2']
+
+
+def test_cancelled_work_is_skipped():
+    executor = FairExecutor(max_workers=1)
+    started = threading.Event()
+    gate = threading.Event()
+    ran = []
+
+    def block():
+        started.set()
+        gate.wait(5)
+    executor.submit('alice', block)
+    started.wait(5)
+    cancelled = executor.submit('alice', ran.append, 'cancelled')
+    kept = executor.for_owner('bob').submit(ran.append, 'kept')
+    assert executor.queued() == 2
+
+    assert cancelled.cancel()
+    gate.set()
+    kept.result(timeout=5)
+    assert ran == ['kept']
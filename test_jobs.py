@@ -0,0 +1,96 @@
+"""
+Tests for job admission limits
+"""
+import threading
+import time
+import pytest
+from jobs import AdmissionError, JobManager
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def blocking(release):
+    """Job function that runs until release is set"""
+    def run(job):
+        release.wait(5)
+        return {}
+    return run
+
+
+def wait_running(jobs):
+    deadline = time.time() + 5
+    while any(job.status != 'running' for job in jobs) and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def wait_idle(manager):
+    deadline = time.time() + 5
+    while manager.active_count() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_owner_limit_turns_away_only_that_owner(release):
+    manager = JobManager(max_workers=4, retention=60, max_per_owner=2, retry_after=30)
+    manager.submit('alice', blocking(release))
+    manager.submit('alice', blocking(release))
+
+    with pytest.raises(AdmissionError) as error:
+        manager.submit('alice', blocking(release))
+    assert error.value.retry_after == 30
+    assert 'alice' not in str(error.value)
+
+    manager.submit('bob', blocking(release))
+    assert manager.active_count() == 3
+
+
+def test_global_limit_counts_queued_jobs(release):
+    # One worker, so the second job waits in the queue but still counts
+    manager = JobManager(max_workers=1, retention=60, max_active=2, retry_after=12)
+    manager.submit('alice', blocking(release))
+    manager.submit('bob', blocking(release))
+
+    with pytest.raises(AdmissionError) as error:
+        manager.submit('carol', blocking(release))
+    assert error.value.retry_after == 12
+    assert 'busy' in str(error.value)
+
+
+def test_finished_jobs_free_their_slot(release):
+    manager = JobManager(max_workers=2, retention=60, max_active=1, max_per_owner=1)
+    job = manager.submit('alice', blocking(release))
+    with pytest.raises(AdmissionError):
+        manager.submit('alice', blocking(release))
+
+    release.set()
+    wait_idle(manager)
+    assert job.status == 'completed'
+    # The finished job is still kept for polling
+    assert manager.get(job.id, 'alice') is job
+    manager.submit('alice', lambda job: {})
+
+
+def test_retry_after_follows_the_earliest_eta(release):
+    manager = JobManager(max_workers=2, retention=60, max_per_owner=2, retry_after=30)
+    jobs = [manager.submit('alice', blocking(release)) for _ in range(2)]
+    wait_running(jobs)
+    for job, elapsed in zip(jobs, (10, 2)):
+        job.set_total(4)
+        job.started_at = time.time() - elapsed
+        job.record('added', 'song')
+
+    with pytest.raises(AdmissionError) as error:
+        manager.submit('alice', blocking(release))
+    # 2s for the first song leaves 6s for the other three
+    assert error.value.retry_after == 6
+
+
+def test_no_limits_admit_everything(release):
+    manager = JobManager(max_workers=1, retention=60)
+    for owner in ('alice', 'alice', 'bob'):
+        manager.submit(owner, blocking(release))
+    assert manager.active_count() == 3
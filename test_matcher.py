@@ -0,0 +1,88 @@
+"""
+Tests for the matcher's scoring of YouTube candidates
+"""
+from matcher import _tokens, best_candidate, parse_duration, score_candidate
+
+
+def track(name, artists, duration_ms=200000):
+    return {'name': name, 'artists': artists, 'duration_ms': duration_ms,
+            'query': f"{artists[0]} - {name}"}
+
+
+def candidate(video_id, title, channel, duration=200):
+    return {'video_id': video_id, 'title': title, 'channel': channel, 'duration': duration}
+
+
+def test_parse_duration():
+    assert parse_duration('PT3M21S') == 201
+    assert parse_duration('PT1H2M') == 3720
+    assert parse_duration('P1DT1S') == 86401
+    assert parse_duration('') is None
+    assert parse_duration('PT') is None
+
+
+def test_tokens_strip_accents_and_keep_other_scripts():
+    assert _tokens('Beyoncé – Déjà Vu') == ['beyonce', 'deja', 'vu']
+    assert _tokens('Король и Шут') == ['король', 'и', 'шут']
+    assert _tokens('좋은 날') == ['좋은', '날']
+
+
+def test_exact_match_scores_high():
+    score = score_candidate(track('Bohemian Rhapsody', ['Queen']),
+                            candidate('a', 'Queen – Bohemian Rhapsody (Official Video)', 'Queen Official'))
+    assert score > 0.9
+
+
+def test_cyrillic_exact_match_is_accepted():
+    song = track('Кукла колдуна', ['Король и Шут'])
+    exact = candidate('a', 'Король и Шут - Кукла колдуна', 'Король и Шут')
+    assert score_candidate(song, exact) > 0.9
+    assert best_candidate(song, [exact], 0.3) is exact
+
+
+def test_hangul_exact_match_is_accepted():
+    song = track('좋은 날', ['IU'])
+    exact = candidate('a', '[MV] IU(아이유) _ 좋은 날(Good Day)', 'IU Official')
+    other = candidate('b', '[MV] IU(아이유) _ 너랑 나(You&I)', 'IU Official')
+    assert best_candidate(song, [other, exact], 0.3) is exact
+
+
+def test_version_markers_are_penalised():
+    song = track('Yesterday', ['The Beatles'])
+    original = candidate('a', 'Yesterday (Remastered 2009)', 'The Beatles - Topic')
+    cover = candidate('b', 'Yesterday - The Beatles (cover)', 'Some Guitarist')
+    assert best_candidate(song, [cover, original]) is original
+
+
+def test_version_marker_in_track_name_is_not_penalised():
+    song = track('Yesterday - Live', ['The Beatles'])
+    live = candidate('a', 'The Beatles - Yesterday (Live)', 'The Beatles - Topic')
+    assert score_candidate(song, live) > 0.9
+
+
+def test_duration_mismatch_lowers_score():
+    song = track('Song', ['Artist'], duration_ms=180000)
+    close = candidate('a', 'Artist - Song', 'Artist', duration=181)
+    far = candidate('b', 'Artist - Song', 'Artist', duration=600)
+    assert score_candidate(song, close) - score_candidate(song, far) > 0.2
+
+
+def test_below_min_score_is_rejected():
+    song = track('Bohemian Rhapsody', ['Queen'])
+    unrelated = candidate('a', 'Cooking pasta at home', 'Chef', duration=900)
+    assert best_candidate(song, [unrelated], 0.3) is None
+
+
+def test_ties_keep_youtube_ranking():
+    song = track('Song', ['Artist'])
+    first = candidate('a', 'Artist - Song', 'Artist')
+    second = candidate('b', 'Artist - Song', 'Artist')
+    assert best_candidate(song, [first, second]) is first
+
+
+def test_untokenizable_name_falls_back_to_top_result():
+    song = track('♥♥♥', ['???'])
+    first = candidate('a', 'Something else', 'Channel', duration=900)
+    second = candidate('b', 'Another', 'Channel', duration=900)
+    assert best_candidate(song, iter([first, second]), 0.3) is first
+    assert best_candidate(song, [], 0.3) is None
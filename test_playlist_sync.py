@@ -0,0 +1,168 @@
+"""
+Tests for syncing converted playlists against the fake YouTube API
+"""
+import pytest
+from benchmarks.fakes import fake_track
+from checkpoints import CheckpointStore
+from config import Config
+from playlist_sync import SyncStore, sync_playlist, track_keys
+from quota import QuotaScheduler
+from spotify_service import track_record
+
+
+class StubSpotify:
+    """SpotifyService stand-in serving one playlist that can be edited"""
+
+    def __init__(self, indexes):
+        self.snapshot = 0
+        self.indexes = list(indexes)
+
+    def edit(self, indexes):
+        self.snapshot += 1
+        self.indexes = list(indexes)
+
+    def get_playlist_details(self, playlist_id):
+        return {'name': 'Mix', 'description': '', 'snapshot_id': f"snapshot{self.snapshot}",
+                'total_tracks': len(self.indexes)}
+
+    def iter_playlist_track_records(self, playlist_id):
+        return (track_record(fake_track(index)) for index in self.indexes)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SyncStore(str(tmp_path / 'sync_state.db'))
+
+
+def playlist_songs(fake_apis, youtube_playlist_id, results):
+    """Songs in a fake YouTube playlist, by the videos results resolved them to"""
+    songs = {result['video_id']: result['song'] for result in results}
+    return [songs.get(video_id) for video_id in fake_apis.youtube_http.playlist_items(youtube_playlist_id)]
+
+
+def test_batched_appends_keep_playlist_order(fake_apis, store, monkeypatch):
+    monkeypatch.setattr(Config, 'YOUTUBE_INSERT_BATCH_SIZE', 50)
+    spotify = StubSpotify(range(3))
+    youtube = fake_apis.youtube()
+    first = sync_playlist(spotify, youtube, store, 'mix')
+
+    positions = []
+    insert_playlist_items = youtube.insert_playlist_items
+
+    def spy(playlist_id, video_ids, position=None):
+        positions.append(position)
+        return insert_playlist_items(playlist_id, video_ids, position)
+
+    monkeypatch.setattr(youtube, 'insert_playlist_items', spy)
+    spotify.edit(range(6))
+    second = sync_playlist(spotify, youtube, store, 'mix')
+
+    # Without positions the server may apply a batch's inserts in any order
+    assert positions == [3]
+    assert playlist_songs(fake_apis, second['playlist_id'], first['results'] + second['results']) == [
+        track_record(fake_track(index))['query'] for index in range(6)
+    ]
+
+
+def test_track_keys_number_repeats():
+    tracks = [{'id': 'a', 'query': 'A - a'}, {'id': None, 'query': 'B  - b'},
+              {'id': 'a', 'query': 'A - a'}, {'id': None, 'query': 'b - B'}]
+    # Tracks without a Spotify ID fall back to their normalized query
+    assert track_keys(tracks) == ['a#0', 'b - b#0', 'a#1', 'b - b#1']
+
+
+def test_first_sync_converts_and_unchanged_snapshot_costs_nothing(fake_apis, store):
+    spotify = StubSpotify(range(3))
+    youtube = fake_apis.youtube()
+    first = sync_playlist(spotify, youtube, store, 'mix')
+    assert not first['unchanged'] and first['added_count'] == 3
+
+    fake_apis.youtube_log.reset()
+    again = sync_playlist(spotify, youtube, store, 'mix')
+    assert again['unchanged'] and again['playlist_id'] == first['playlist_id']
+    assert fake_apis.youtube_log.calls() == {}
+
+
+def test_sync_applies_only_the_changes(fake_apis, store):
+    spotify = StubSpotify([0, 1, 2, 3])
+    youtube = fake_apis.youtube()
+    first = sync_playlist(spotify, youtube, store, 'mix')
+
+    fake_apis.youtube_log.reset()
+    spotify.edit([0, 2, 3, 4, 5])
+    second = sync_playlist(spotify, youtube, store, 'mix')
+
+    assert (second['added_count'], second['removed_count']) == (2, 1)
+    calls = fake_apis.youtube_log.calls()
+    assert sum(calls['search.list'].values()) == 2
+    assert sum(calls['playlistItems.delete'].values()) == 1
+    assert playlist_songs(fake_apis, second['playlist_id'], first['results'] + second['results']) == [
+        track_record(fake_track(index))['query'] for index in [0, 2, 3, 4, 5]
+    ]
+
+
+def test_sync_keeps_repeated_tracks_apart(fake_apis, store):
+    spotify = StubSpotify([0, 1, 0])
+    youtube = fake_apis.youtube()
+    first = sync_playlist(spotify, youtube, store, 'mix')
+
+    # Dropping one copy removes only the second one's playlist item
+    spotify.edit([0, 1])
+    second = sync_playlist(spotify, youtube, store, 'mix')
+    assert (second['added_count'], second['removed_count']) == (0, 1)
+    assert fake_apis.youtube_http.playlist_items(first['playlist_id']) == [
+        result['video_id'] for result in first['results'][:2]
+    ]
+
+
+def test_sync_starts_over_when_the_youtube_playlist_is_gone(fake_apis, store):
+    spotify = StubSpotify(range(2))
+    youtube = fake_apis.youtube()
+    first = sync_playlist(spotify, youtube, store, 'mix')
+    del fake_apis.youtube_http._playlists[first['playlist_id']]
+
+    spotify.edit(range(3))
+    second = sync_playlist(spotify, youtube, store, 'mix')
+    assert second['playlist_id'] != first['playlist_id']
+    assert second['added_count'] == 3
+
+
+def test_interrupted_sync_is_picked_up_by_the_next_run(fake_apis, store):
+    spotify = StubSpotify(range(2))
+    first = sync_playlist(spotify, fake_apis.youtube(), store, 'mix')
+
+    # Quota for the lookups and one new song's search and insert
+    spotify.edit(range(4))
+    limited = fake_apis.youtube(QuotaScheduler(160, rate=0, burst=1, max_retries=0,
+                                               backoff_base=0, backoff_max=0))
+    stopped = sync_playlist(spotify, limited, store, 'mix')
+    assert stopped['quota_exceeded'] and stopped['added_count'] == 1
+
+    finished = sync_playlist(spotify, fake_apis.youtube(), store, 'mix')
+    assert not finished['quota_exceeded'] and finished['added_count'] == 1
+    assert len(fake_apis.youtube_http.playlist_items(first['playlist_id'])) == 4
+
+
+def test_crashed_first_run_resumes_in_its_playlist(fake_apis, store, tmp_path):
+    checkpoint_store = CheckpointStore(str(tmp_path / 'checkpoints.db'))
+    spotify = StubSpotify(range(4))
+
+    def crash_after_two(event, song, video_id):
+        if event == 'added' and song == track_record(fake_track(1))['query']:
+            raise RuntimeError("worker killed")
+
+    with pytest.raises(RuntimeError):
+        sync_playlist(spotify, fake_apis.youtube(), store, 'mix', crash_after_two,
+                      checkpoint_store=checkpoint_store)
+    assert store.get('UCbenchmark', 'mix') is None
+
+    result = sync_playlist(spotify, fake_apis.youtube(), store, 'mix',
+                           checkpoint_store=checkpoint_store)
+    assert len(fake_apis.youtube_http._playlists) == 1
+    assert result['added_count'] == 4
+    assert playlist_songs(fake_apis, result['playlist_id'], result['results']) == [
+        track_record(fake_track(index))['query'] for index in range(4)
+    ]
+    assert len(store.get('UCbenchmark', 'mix')['items']) == 4
+    # The sync state took over, so the checkpoint is done
+    assert checkpoint_store.resume('UCbenchmark', spotify_playlist_id='mix') is None
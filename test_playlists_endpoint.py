@@ -0,0 +1,75 @@
+"""
+Tests for the cached /playlists endpoint against the fake Spotify API
+"""
+import time
+import httpx
+import pytest
+import requests
+import aio
+import app as app_module
+import playlist_cache
+import tokens
+
+
+@pytest.fixture
+def client(fake_apis, monkeypatch):
+    adapter = fake_apis.spotify_adapter
+    adapter.playlist_ids = ['bench1', 'bench2', 'bench3']
+
+    def handle(request):
+        # Answer the async client's requests with the fake Spotify adapter
+        prepared = requests.Request(request.method, str(request.url),
+                                    headers=dict(request.headers)).prepare()
+        answer = adapter.send(prepared)
+        return httpx.Response(answer.status_code, headers=dict(answer.headers),
+                              content=answer.content)
+
+    monkeypatch.setattr(aio.get_default_loop(), 'http',
+                        httpx.AsyncClient(transport=httpx.MockTransport(handle)))
+    monkeypatch.setattr(playlist_cache, '_default_cache', playlist_cache.PlaylistCache(60, 10))
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['sid'] = 'playlists-test'
+    app_module.token_store.save('playlists-test', tokens.SPOTIFY,
+                                {'access_token': 'test', 'refresh_token': 'refresh',
+                                 'expires_at': time.time() + 3600})
+    return client
+
+
+def spotify_calls(fake_apis):
+    return fake_apis.spotify_log.calls().get('current_user_playlists', {}).get('calls', 0)
+
+
+def test_repeat_load_revalidates_without_spotify(client, fake_apis):
+    first = client.get('/playlists?limit=2')
+    assert first.status_code == 200
+    assert [playlist['id'] for playlist in first.json] == ['bench1', 'bench2']
+    assert first.headers['X-Total-Count'] == '3'
+    etag = first.headers['ETag']
+    calls = spotify_calls(fake_apis)
+    assert calls == 1
+
+    repeat = client.get('/playlists?limit=2', headers={'If-None-Match': etag})
+    assert repeat.status_code == 304 and repeat.data == b''
+    assert spotify_calls(fake_apis) == calls
+
+    # Each page has its own ETag
+    other_page = client.get('/playlists?limit=2&offset=2', headers={'If-None-Match': etag})
+    assert other_page.status_code == 200
+    assert [playlist['id'] for playlist in other_page.json] == ['bench3']
+
+
+def test_changed_playlists_get_a_new_etag(client, fake_apis):
+    etag = client.get('/playlists').headers['ETag']
+
+    # Once the cached list is stale, an unchanged listing keeps its ETag
+    playlist_cache.get_default_cache().invalidate('playlists-test')
+    assert client.get('/playlists', headers={'If-None-Match': etag}).status_code == 304
+    assert spotify_calls(fake_apis) == 2
+
+    fake_apis.spotify_adapter.playlist_ids.append('bench4')
+    playlist_cache.get_default_cache().invalidate('playlists-test')
+    changed = client.get('/playlists', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert len(changed.json) == 4
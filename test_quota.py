@@ -0,0 +1,199 @@
+"""
+Tests for YouTube quota accounting and call scheduling
+"""
+import asyncio
+import json
+import threading
+from datetime import date, datetime, timezone
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+import quota
+from quota import (QuotaExceededError, QuotaScheduler, SharedQuotaLedger, TokenBucket,
+                   is_quota_exceeded, is_transient)
+
+
+def scheduler(budget, ledger=None):
+    return QuotaScheduler(budget, rate=0, burst=1, max_retries=2, backoff_base=0,
+                          backoff_max=0, ledger=ledger)
+
+
+def http_error(status, reason=None):
+    errors = [{'reason': reason}] if reason else []
+    content = json.dumps({'error': {'code': status, 'errors': errors}}).encode('utf-8')
+    return HttpError(httplib2.Response({'status': status}), content)
+
+
+def failing(*errors, result='ok'):
+    """Callable raising the given errors in turn, then returning result"""
+    errors = list(errors)
+    calls = []
+
+    def call():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    call.calls = calls
+    return call
+
+
+def test_error_classification():
+    assert is_transient(http_error(503))
+    assert is_transient(http_error(429))
+    assert is_transient(http_error(403, 'rateLimitExceeded'))
+    assert not is_transient(http_error(403, 'quotaExceeded'))
+    assert not is_transient(http_error(404))
+    assert is_quota_exceeded(http_error(403, 'quotaExceeded'))
+    assert not is_quota_exceeded(http_error(403, 'forbidden'))
+
+
+def test_charge_stops_at_the_budget():
+    gate = scheduler(250)
+    gate.charge(100)
+    gate.charge(100)
+    with pytest.raises(QuotaExceededError):
+        gate.charge(100)
+    gate.charge(50)
+    assert (gate.spent(), gate.remaining()) == (250, 0)
+
+
+def test_spent_quota_resets_on_a_new_day():
+    gate = scheduler(100)
+    gate._today = lambda: date(2024, 1, 1)
+    gate.charge(100)
+    assert gate.remaining() == 0
+
+    gate._today = lambda: date(2024, 1, 2)
+    assert gate.remaining() == 100
+    gate.charge(100)
+
+
+def test_quota_day_follows_pacific_time(monkeypatch):
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 1, 2, 7, 30, tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(quota, 'datetime', FixedDatetime)
+    # 07:30 UTC is still the previous evening in California
+    assert QuotaScheduler._today() == date(2024, 1, 1)
+
+
+def test_call_retries_transient_errors():
+    gate = scheduler(1000)
+    call = failing(http_error(503), http_error(403, 'rateLimitExceeded'))
+    assert gate.call(10, call) == 'ok'
+    # Every attempt is charged
+    assert len(call.calls) == 3 and gate.spent() == 30
+
+
+def test_call_gives_up_after_max_retries():
+    gate = scheduler(1000)
+    call = failing(*[http_error(503)] * 3)
+    with pytest.raises(HttpError):
+        gate.call(1, call)
+    assert len(call.calls) == 3
+
+
+def test_call_does_not_retry_other_errors():
+    call = failing(http_error(404))
+    with pytest.raises(HttpError):
+        scheduler(1000).call(1, call)
+    assert len(call.calls) == 1
+
+
+def test_quota_error_from_the_api_exhausts_the_day():
+    gate = scheduler(1000)
+    with pytest.raises(QuotaExceededError):
+        gate.call(1, failing(http_error(403, 'quotaExceeded')))
+    assert gate.remaining() == 0
+    with pytest.raises(QuotaExceededError):
+        gate.call(1, failing())
+
+
+def test_call_async_retries_like_call():
+    gate = scheduler(1000)
+    call = failing(http_error(500))
+
+    async def request():
+        return call()
+    assert asyncio.run(gate.call_async(1, request)) == 'ok'
+    assert len(call.calls) == 2
+
+
+def test_call_async_keeps_the_shared_ledger_off_the_loop(tmp_path):
+    threads = []
+
+    class RecordingLedger(SharedQuotaLedger):
+        def charge(self, day, cost, budget):
+            threads.append(threading.get_ident())
+            return super().charge(day, cost, budget)
+
+        def exhaust(self, day, budget):
+            threads.append(threading.get_ident())
+            super().exhaust(day, budget)
+
+    gate = scheduler(1000, RecordingLedger(str(tmp_path / 'quota.db')))
+
+    async def run():
+        loop_thread = threading.get_ident()
+        with pytest.raises(QuotaExceededError):
+            await gate.call_async(1, failing(http_error(403, 'quotaExceeded')))
+        return loop_thread
+    loop_thread = asyncio.run(run())
+
+    assert len(threads) == 2 and loop_thread not in threads
+    assert gate.remaining() == 0
+
+
+def test_backoff_is_capped_full_jitter():
+    gate = QuotaScheduler(1, rate=0, burst=1, max_retries=5, backoff_base=0.5, backoff_max=3)
+    for attempt, cap in [(0, 0.5), (1, 1), (2, 2), (3, 3), (10, 3)]:
+        delays = [gate._backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+        assert max(delays) > cap / 2
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket._take(1) == 0
+    assert bucket._take(1) == 0
+    assert 0 < bucket._take(1) <= 0.1
+    assert TokenBucket(rate=0, capacity=1)._take(100) == 0
+
+
+def test_shared_ledger_is_one_budget_across_connections(tmp_path):
+    path = str(tmp_path / 'quota.db')
+    first = scheduler(250, SharedQuotaLedger(path))
+    second = scheduler(250, SharedQuotaLedger(path))
+
+    first.charge(100)
+    second.charge(100)
+    assert first.spent() == second.spent() == 200
+    with pytest.raises(QuotaExceededError):
+        first.charge(100)
+    second.charge(50)
+    assert first.remaining() == 0
+
+
+def test_shared_ledger_exhaust_is_seen_by_every_process(tmp_path):
+    path = str(tmp_path / 'quota.db')
+    first = scheduler(1000, SharedQuotaLedger(path))
+    second = scheduler(1000, SharedQuotaLedger(path))
+
+    second.charge(1)
+    first.exhaust()
+    with pytest.raises(QuotaExceededError):
+        second.charge(1)
+
+
+def test_shared_ledger_counts_days_apart(tmp_path):
+    ledger = SharedQuotaLedger(str(tmp_path / 'quota.db'))
+    assert ledger.charge(date(2024, 1, 1), 80, 100) == (True, 0)
+    assert ledger.charge(date(2024, 1, 1), 30, 100) == (False, 80)
+    assert ledger.charge(date(2024, 1, 2), 30, 100) == (True, 0)
+    assert ledger.spent(date(2024, 1, 1)) == 80
+    # Days past the retention are dropped as new ones start
+    ledger.charge(date(2024, 1, 20), 1, 100)
+    assert ledger.spent(date(2024, 1, 1)) == 0
@@ -0,0 +1,124 @@
+"""
+Tests for coalescing concurrent lookups
+"""
+import threading
+import time
+from singleflight import SingleFlight
+from video_cache import VideoCache
+
+
+class CountingSearch:
+    """Upstream stand-in that counts its calls and takes a while to answer"""
+
+    def __init__(self, result, delay=0.1, cache=None, key=None):
+        self.result = result
+        self.delay = delay
+        self.cache = cache
+        self.key = key
+        self.calls = 0
+        self.started = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        self.started.set()
+        time.sleep(self.delay)
+        if self.cache is not None:
+            self.cache.set(self.key, self.result)
+        return self.result
+
+
+def run_threads(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flights = SingleFlight()
+    search = CountingSearch('video')
+
+    results = run_threads(8, lambda: flights.do('A - One', search))
+
+    assert search.calls == 1
+    assert sorted(results) == [('video', False)] + [('video', True)] * 7
+    assert flights.stats() == {'calls': 8, 'executions': 1, 'coalesced': 7, 'remote': 0}
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flights = SingleFlight()
+    slow = CountingSearch('slow', delay=0.5)
+    thread = threading.Thread(target=lambda: flights.do('A - One', slow))
+    thread.start()
+    assert slow.started.wait(5)
+
+    started = time.monotonic()
+    assert flights.do('B - Two', lambda: 'fast') == ('fast', False)
+    assert time.monotonic() - started < 0.25
+    thread.join()
+
+
+def test_errors_reach_every_waiting_caller():
+    flights = SingleFlight()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        time.sleep(0.1)
+        raise RuntimeError("search failed")
+
+    def call():
+        try:
+            flights.do('A - One', fail)
+        except RuntimeError as e:
+            return str(e)
+    assert run_threads(4, call) == ['search failed'] * 4
+    assert len(calls) == 1
+
+    # A failed flight isn't remembered
+    assert flights.do('A - One', lambda: 'video') == ('video', False)
+
+
+def test_another_process_waits_for_the_lease_holder(tmp_path):
+    path = str(tmp_path / 'video_cache.db')
+    # Each cache stands in for a process with its own connection
+    first_cache = VideoCache(path, ttl=3600, negative_ttl=3600, max_entries=100)
+    second_cache = VideoCache(path, ttl=3600, negative_ttl=3600, max_entries=100)
+    first = SingleFlight(store=first_cache, lease_ttl=5, poll_interval=0.01)
+    second = SingleFlight(store=second_cache, lease_ttl=5, poll_interval=0.01)
+
+    leader = CountingSearch('video', delay=0.2, cache=first_cache, key='A - One')
+    follower = CountingSearch('other')
+    results = {}
+
+    thread = threading.Thread(target=lambda: results.update(
+        first=first.do('A - One', leader, lambda: first_cache.get('A - One'))
+    ))
+    thread.start()
+    assert leader.started.wait(5)
+    results['second'] = second.do('A - One', follower, lambda: second_cache.get('A - One'))
+    thread.join()
+
+    assert leader.calls == 1 and follower.calls == 0
+    assert results == {'first': ('video', False), 'second': ('video', True)}
+    assert second.stats()['remote'] == 1
+
+
+def test_an_abandoned_lease_stops_blocking_after_its_ttl(tmp_path):
+    cache = VideoCache(str(tmp_path / 'video_cache.db'), ttl=3600, negative_ttl=3600,
+                       max_entries=100)
+    # A process that died while holding the lease
+    assert cache.acquire_lease('A - One', 0.2)
+    flights = SingleFlight(store=cache, lease_ttl=0.2, poll_interval=0.01)
+    search = CountingSearch('video', delay=0)
+
+    started = time.monotonic()
+    assert flights.do('A - One', search, lambda: cache.get('A - One')) == ('video', False)
+    assert search.calls == 1
+    # It waited for the lease to lapse instead of searching alongside
+    assert time.monotonic() - started >= 0.15
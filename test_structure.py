@@ -137,6 +137,11 @@ try:
         '/youtube/callback',
         '/playlists',
         '/convert',
+        '/convert/bulk',
+        '/convert/resume',
+        '/jobs/<job_id>',
+        '/convert/stream',
+        '/metrics',
         '/disconnect/spotify',
         '/disconnect/youtube'
     ]
@@ -0,0 +1,40 @@
+"""
+Tests for the server-side token store
+"""
+import threading
+import time
+import pytest
+from tokens import SPOTIFY, TokenStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TokenStore(str(tmp_path / 'tokens.db'), refresh_margin=300, retention=3600)
+
+
+def test_fresh_refreshes_once_for_concurrent_callers(store):
+    store.save('sid', SPOTIFY, {'access_token': 'old', 'expires_at': 0})
+    refreshes = []
+
+    def refresh(data):
+        refreshes.append(data['access_token'])
+        time.sleep(0.05)
+        return {'access_token': 'new', 'expires_at': time.time() + 3600}
+
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(store.fresh('sid', SPOTIFY, refresh)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert refreshes == ['old']
+    assert {token['access_token'] for token in tokens} == {'new'}
+
+
+def test_fresh_keeps_no_lock_once_done(store):
+    store.save('sid', SPOTIFY, {'access_token': 'old', 'expires_at': 0})
+    store.fresh('sid', SPOTIFY, lambda data: {'access_token': 'new', 'expires_at': time.time() + 3600})
+    assert store.fresh('gone', SPOTIFY, lambda data: data) is None
+    assert store._refresh_locks == {}
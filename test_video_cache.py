@@ -0,0 +1,80 @@
+"""
+Tests for the SQLite video cache
+"""
+from types import SimpleNamespace
+import pytest
+import video_cache
+from video_cache import VideoCache
+
+
+class Clock:
+    """Controllable stand-in for time.time"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(video_cache, 'time', SimpleNamespace(time=clock))
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return VideoCache(str(tmp_path / 'video_cache.db'), ttl=100, negative_ttl=10, max_entries=3)
+
+
+def test_hits_are_keyed_by_normalized_query(cache):
+    assert cache.get('Artist - Song') == (False, None)
+    cache.set('Artist - Song', 'video')
+    assert cache.get('  artist   -  SONG ') == (True, 'video')
+
+
+def test_found_videos_expire_after_the_ttl(cache, clock):
+    cache.set('Artist - Song', 'video')
+    clock.now += 100
+    assert cache.get('Artist - Song') == (True, 'video')
+    clock.now += 1
+    assert cache.get('Artist - Song') == (False, None)
+    # The expired entry is gone, not just hidden
+    clock.now -= 50
+    assert cache.get('Artist - Song') == (False, None)
+
+
+def test_not_found_results_are_cached_for_the_negative_ttl(cache, clock):
+    cache.set('Nobody - Nothing', None)
+    assert cache.get('Nobody - Nothing') == (True, None)
+    clock.now += 11
+    assert cache.get('Nobody - Nothing') == (False, None)
+
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    cache.EVICT_INTERVAL = 1
+    for index in range(3):
+        clock.now += 1
+        cache.set(f"Artist - Song {index}", f"video{index}")
+
+    # Reading the oldest entry makes song 1 the least recently used
+    clock.now += 1
+    assert cache.get('Artist - Song 0') == (True, 'video0')
+    clock.now += 1
+    cache.set('Artist - Song 3', 'video3')
+
+    assert cache.get('Artist - Song 1') == (False, None)
+    for index in (0, 2, 3):
+        assert cache.get(f"Artist - Song {index}") == (True, f"video{index}")
+
+
+def test_leases_are_exclusive_until_released_or_expired(cache, clock):
+    assert cache.acquire_lease('key', ttl=5)
+    assert not cache.acquire_lease('key', ttl=5)
+    cache.release_lease('key')
+    assert cache.acquire_lease('key', ttl=5)
+
+    clock.now += 6
+    assert cache.acquire_lease('key', ttl=5)
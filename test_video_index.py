@@ -0,0 +1,81 @@
+"""
+Tests for the memory-mapped video index
+"""
+import pytest
+from video_index import HEADER, MAGIC, VideoIndex, build_index, isrc_key, query_key, read_rows
+
+
+ROWS = [
+    {'isrc': 'us-abc-12-34567', 'query': 'Artist - Song', 'video_id': 'aaaaaaaaaaa'},
+    {'artist': 'Other', 'title': 'Tune', 'video_id': 'bbbbbbbbbbb'},
+    {'query': 'Missing - Video'},
+    {'query': 'Bad - Video', 'video_id': 'too-short'},
+    {'video_id': 'ccccccccccc'},
+    # Later rows win
+    {'query': 'OTHER  -  tune', 'video_id': 'ddddddddddd'},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / 'index' / 'video_index.bin')
+    assert build_index(ROWS, path) == (3, 3)
+    index = VideoIndex(path)
+    yield index
+    index.close()
+
+
+def test_get_finds_every_key(index):
+    assert len(index) == 3
+    assert index.get(isrc_key('USABC1234567')) == 'aaaaaaaaaaa'
+    assert index.get(query_key('Artist - Song')) == 'aaaaaaaaaaa'
+    assert index.get(query_key('Other - Tune')) == 'ddddddddddd'
+    assert index.get(query_key('Nobody - Nothing')) is None
+
+
+def test_lookup_normalizes_queries(index):
+    assert index.lookup('artist - song') == 'aaaaaaaaaaa'
+    assert index.lookup('Artist - Another Song') is None
+
+
+def test_lookup_track_prefers_the_isrc(index):
+    assert index.lookup_track({'isrc': 'USABC1234567', 'query': 'Other - Tune'}) == 'aaaaaaaaaaa'
+    # An unknown ISRC falls back to the query
+    assert index.lookup_track({'isrc': 'GBXYZ0000001', 'query': 'Other - Tune'}) == 'ddddddddddd'
+    assert index.lookup_track({'isrc': None, 'query': 'Artist - Song'}) == 'aaaaaaaaaaa'
+    assert index.lookup_track({'query': 'Nobody - Nothing'}) is None
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / 'empty.bin')
+    assert build_index([], path) == (0, 0)
+    index = VideoIndex(path)
+    assert len(index) == 0 and index.lookup('Artist - Song') is None
+    index.close()
+
+
+@pytest.mark.parametrize('content', [
+    b'',
+    b'not an index at all',
+    HEADER.pack(MAGIC, 2),
+])
+def test_invalid_files_are_rejected(tmp_path, content):
+    path = tmp_path / 'bad.bin'
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        VideoIndex(str(path))
+
+
+def test_read_rows_reads_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / 'dump.csv'
+    csv_path.write_text('artist,title,video_id\nOther,Tune,bbbbbbbbbbb\n', encoding='utf-8')
+    jsonl_path = tmp_path / 'dump.jsonl'
+    jsonl_path.write_text('{"query": "Artist - Song", "video_id": "aaaaaaaaaaa"}\n\n',
+                          encoding='utf-8')
+
+    assert list(read_rows(str(csv_path))) == [
+        {'artist': 'Other', 'title': 'Tune', 'video_id': 'bbbbbbbbbbb'}
+    ]
+    assert list(read_rows(str(jsonl_path))) == [
+        {'query': 'Artist - Song', 'video_id': 'aaaaaaaaaaa'}
+    ]
@@ -0,0 +1,123 @@
+"""
+Tests for writing songs to playlists against the fake YouTube API
+"""
+import pytest
+from benchmarks.fakes import FaultProfile, fake_track
+from checkpoints import CheckpointStore
+from config import Config
+from quota import QuotaExceededError
+from spotify_service import track_record
+
+
+SONGS = ['A - One', 'B - Two', 'C - Three', 'D - Four', 'E - Five']
+
+
+def quota_runs_out_at(song_out):
+    """Resolver finding every song until the quota runs out on song_out"""
+    def resolve(song, track):
+        if song == song_out:
+            raise QuotaExceededError("Daily YouTube quota exhausted")
+        return f"vid{SONGS.index(song):08d}", False
+    return resolve
+
+
+@pytest.mark.parametrize('batch_size', [1, 10])
+def test_quota_exhausted_mid_window_reports_every_song(fake_apis, monkeypatch, batch_size):
+    monkeypatch.setattr(Config, 'YOUTUBE_INSERT_BATCH_SIZE', batch_size)
+    youtube = fake_apis.youtube()
+    playlist_id = youtube.create_playlist('Test')
+
+    result = youtube.add_songs_to_playlist(playlist_id, SONGS, start_position=0,
+                                           resolver=quota_runs_out_at('B - Two'))
+
+    assert result['quota_exceeded']
+    assert result['total_songs'] == len(result['results']) == 5
+    assert [entry['song'] for entry in result['results']] == SONGS
+    if batch_size == 1:
+        assert result['added_count'] == 1
+        assert result['failed_songs'] == SONGS[1:]
+        assert fake_apis.youtube_http.playlist_items(playlist_id) == ['vid00000000']
+    else:
+        # The first song was still buffered for the batch, so never inserted
+        assert result['added_count'] == 0
+        assert result['failed_songs'] == SONGS
+        assert fake_apis.youtube_http.playlist_items(playlist_id) == []
+
+
+def test_buffered_songs_already_inserted_stay_added(fake_apis, monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'YOUTUBE_INSERT_BATCH_SIZE', 10)
+    youtube = fake_apis.youtube()
+    playlist_id = youtube.create_playlist('Test')
+    checkpoint = CheckpointStore(str(tmp_path / 'checkpoints.db')).create(
+        'owner', 'spotify', 'Test', '')
+    checkpoint.set_playlist_id(playlist_id)
+    checkpoint.record_resolved(0, SONGS[0], 'vid00000000')
+    checkpoint.record_written(0, 'added', 'PLI-earlier')
+
+    result = youtube.add_songs_to_playlist(playlist_id, SONGS, start_position=1,
+                                           checkpoint=checkpoint,
+                                           resolver=quota_runs_out_at('C - Three'))
+
+    statuses = [entry['status'] for entry in result['results']]
+    assert statuses == ['added'] + ['quota_exceeded'] * 4
+    assert result['results'][0]['playlist_item_id'] == 'PLI-earlier'
+    assert result['added_count'] == 1 and result['failed_songs'] == SONGS[1:]
+
+
+def fail_once(fake_apis, video_id, status=503):
+    """Make the fake API fail the first insert of a video"""
+    http = fake_apis.youtube_http
+    call = http._call
+    failed = []
+
+    def flaky(method, path, query_string, body):
+        if method == 'POST' and video_id in (body or '') and not failed:
+            failed.append(video_id)
+            return status, http._error(status, 'backendError')
+        return call(method, path, query_string, body)
+    http._call = flaky
+    return failed
+
+
+def test_batch_retries_transient_failures_in_place(fake_apis):
+    youtube = fake_apis.youtube()
+    playlist_id = youtube.create_playlist('Test')
+    youtube.insert_playlist_item(playlist_id, 'existing')
+    failed = fail_once(fake_apis, 'v1')
+
+    item_ids = youtube.insert_playlist_items(playlist_id, ['v0', 'v1', 'v2', 'v3'], position=1)
+
+    assert failed == ['v1'] and all(item_ids)
+    assert fake_apis.youtube_http.playlist_items(playlist_id) == [
+        'existing', 'v0', 'v1', 'v2', 'v3'
+    ]
+
+
+
+@pytest.mark.parametrize('batch_size', [1, 10])
+def test_pipeline_keeps_song_order_and_picks_the_best_match(fake_apis, monkeypatch, batch_size):
+    monkeypatch.setattr(Config, 'YOUTUBE_SEARCH_WORKERS', 8)
+    monkeypatch.setattr(Config, 'YOUTUBE_INSERT_BATCH_SIZE', batch_size)
+    http = fake_apis.youtube_http
+    # Searches finish out of order
+    http.profile = FaultProfile(jitter=0.01, seed=1)
+    search = http._search
+
+    def best_listed_last(query, data):
+        status, response = search(query, data)
+        best, *others = response['items']
+        # Uploads without the artist in the title or channel score lower
+        for item in others:
+            item['snippet']['title'] = item['snippet']['title'].split(' - ', 1)[1]
+        response['items'] = others + [best]
+        return status, response
+    http._search = best_listed_last
+
+    tracks = [track_record(fake_track(index)) for index in range(30)]
+    result = fake_apis.youtube().create_playlist_from_songs('Test', tracks)
+
+    expected = [http._video_id(track['query'], 0) for track in tracks]
+    assert result['added_count'] == 30 and result['failed_songs'] == []
+    assert [entry['song'] for entry in result['results']] == [track['query'] for track in tracks]
+    assert [entry['video_id'] for entry in result['results']] == expected
+    assert http.playlist_items(result['playlist_id']) == expected
@@ -0,0 +1,170 @@
+"""
+Tokens Module
+Server-side store of each session's Spotify and YouTube OAuth tokens,
+refreshed shortly before they expire so the browser cookie only carries the
+session ID
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+
+SPOTIFY = 'spotify'
+YOUTUBE = 'youtube'
+
+
+class TokenStore:
+    """SQLite store of OAuth tokens keyed by session ID and provider"""
+
+    def __init__(self, path, refresh_margin, retention):
+        """
+        Open (or create) the token database
+
+        Args:
+            path: Path of the SQLite database file
+            refresh_margin: Seconds before expiry a token is refreshed
+            retention: Seconds a token that is neither saved nor refreshed is
+                kept before it is deleted
+        """
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self.retention = retention
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.reopen()
+
+    def reopen(self):
+        """Open a new connection, e.g. in a child process after fork()"""
+        self._lock = threading.Lock()
+        # (sid, provider) to [lock, callers holding or waiting for it], kept
+        # only while a refresh is in progress
+        self._refresh_locks = {}
+        self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS tokens ('
+                'sid TEXT NOT NULL, '
+                'provider TEXT NOT NULL, '
+                'data TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'PRIMARY KEY (sid, provider))'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS tokens_updated ON tokens (updated_at)'
+            )
+
+    def load(self, sid, provider):
+        """
+        Get a stored token
+
+        Args:
+            sid: Session ID
+            provider: SPOTIFY or YOUTUBE
+
+        Returns:
+            The token dict as saved, or None if there is none
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM tokens WHERE sid = ? AND provider = ?', (sid, provider)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, sid, provider, data):
+        """
+        Store a token, replacing the session's previous one
+
+        Args:
+            sid: Session ID
+            provider: SPOTIFY or YOUTUBE
+            data: JSON-serializable token dict with an expires_at timestamp
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO tokens (sid, provider, data, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                (sid, provider, json.dumps(data), now)
+            )
+            self._conn.execute('DELETE FROM tokens WHERE updated_at < ?',
+                               (now - self.retention,))
+
+    def delete(self, sid, provider):
+        """Forget a session's token"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM tokens WHERE sid = ? AND provider = ?',
+                               (sid, provider))
+
+    def fresh(self, sid, provider, refresh, stale_token=None):
+        """
+        Get a token that is not about to expire, refreshing it if needed
+
+        Concurrent callers for the same token wait for a single refresh and
+        all get its result.
+
+        Args:
+            sid: Session ID
+            provider: SPOTIFY or YOUTUBE
+            refresh: Callable taking the stored token dict and returning a
+                refreshed one
+            stale_token: Access token the caller found rejected; it is
+                refreshed even if it isn't close to expiry, unless another
+                caller already replaced it
+
+        Returns:
+            The token dict, or None if the session has no token
+        """
+        key = (sid, provider)
+        with self._lock:
+            entry = self._refresh_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                data = self.load(sid, provider)
+                if data is None:
+                    return None
+                expiring = data.get('expires_at', 0) - self.refresh_margin <= time.time()
+                rejected = stale_token is not None and data.get('access_token') == stale_token
+                if expiring or rejected:
+                    data = refresh(data)
+                    self.save(sid, provider, data)
+                return data
+        finally:
+            # The last caller out drops the lock, so sessions that stop
+            # refreshing don't keep one for the life of the process
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1] and self._refresh_locks.get(key) is entry:
+                    del self._refresh_locks[key]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Get the process-wide token store configured in Config"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = TokenStore(Config.TOKEN_DB_PATH, Config.TOKEN_REFRESH_MARGIN,
+                                        Config.TOKEN_RETENTION)
+        return _default_store
+
+
+def _reopen_default_store():
+    """Give a forked child its own connection to the default store"""
+    if _default_store is not None:
+        _default_store.reopen()
+
+
+# A SQLite connection must not be used across fork(), and the app opens the
+# store at import, before gunicorn forks its preloaded workers
+os.register_at_fork(after_in_child=_reopen_default_store)
@@ -0,0 +1,195 @@
+"""
+Transport Module
+Long-lived keep-alive HTTP transports shared by every user's API clients.
+Credentials are applied per request, so connections are reused across users.
+"""
+import threading
+from contextlib import contextmanager
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from config import Config
+import metrics
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    """urllib3 pool counting the connections it opens"""
+
+    def _new_conn(self):
+        """Open a connection"""
+        metrics.HTTP_CONNECTIONS.inc(1, 'spotify')
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """urllib3 pool counting the connections (TLS handshakes) it opens"""
+
+    def _new_conn(self):
+        """Open a connection"""
+        metrics.HTTP_CONNECTIONS.inc(1, 'spotify')
+        return super()._new_conn()
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report new connections"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Create the pool manager with counting connection pools"""
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool
+        }
+
+
+class SharedSession(requests.Session):
+    """
+    requests.Session shared by every Spotify client
+
+    spotipy closes its session when a client is garbage collected, which
+    would drop every pooled connection, so close() leaves the pool open.
+    """
+
+    def close(self):
+        """Keep the shared connection pool open, see shutdown()"""
+
+    def shutdown(self):
+        """Close the pooled connections"""
+        super().close()
+
+
+def build_spotify_session(pool_size):
+    """
+    Build a keep-alive session for the Spotify Web API
+
+    Retries follow spotipy's own policy, which only applies to the sessions
+    spotipy builds itself.
+
+    Args:
+        pool_size: Connections kept alive per host
+
+    Returns:
+        A SharedSession
+    """
+    retry = Retry(
+        total=3,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504)
+    )
+    adapter = _PooledAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = SharedSession()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class _CountingHTTPSConnection(httplib2.HTTPSConnectionWithTimeout):
+    """httplib2 HTTPS connection counting the connections it opens"""
+
+    def connect(self):
+        """Open the connection"""
+        metrics.HTTP_CONNECTIONS.inc(1, 'youtube')
+        return super().connect()
+
+
+class _CountingHttp(httplib2.Http):
+    """httplib2.Http reporting each new HTTPS connection"""
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        """Send a request, see httplib2.Http.request"""
+        if connection_type is None and uri.startswith('https:'):
+            connection_type = _CountingHTTPSConnection
+        return super().request(uri, method, body=body, headers=headers,
+                               redirections=redirections, connection_type=connection_type)
+
+
+class HttpPool:
+    """
+    Pool of httplib2.Http transports for the YouTube Data API
+
+    An httplib2.Http keeps its connections alive but is not thread-safe, so
+    each request checks one out for its duration. Transports are reused most
+    recently returned first, whose connections are the likeliest to still
+    be open. The pool never blocks: when every transport is busy a new one
+    is made, and only up to max_idle are kept once returned.
+    """
+
+    def __init__(self, max_idle, timeout=None, factory=None):
+        """
+        Initialize the pool
+
+        Args:
+            max_idle: Transports kept for reuse at most
+            timeout: Socket timeout in seconds of new transports
+            factory: Optional callable making a transport, for tests
+        """
+        self.max_idle = max_idle
+        self._factory = factory or (lambda: _CountingHttp(timeout=timeout))
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a transport for one request
+
+        Yields:
+            An httplib2.Http used by no other thread until released
+        """
+        with self._lock:
+            http = self._idle.pop() if self._idle else None
+        if http is None:
+            http = self._factory()
+        try:
+            yield http
+        finally:
+            # httplib2 drops a connection itself when a request fails on it
+            with self._lock:
+                keep = len(self._idle) < self.max_idle
+                if keep:
+                    self._idle.append(http)
+            if not keep:
+                self._close(http)
+
+    def idle_count(self):
+        """Number of transports waiting to be reused"""
+        with self._lock:
+            return len(self._idle)
+
+    @staticmethod
+    def _close(http):
+        """Close the connections of a transport that won't be reused"""
+        close = getattr(http, 'close', None)
+        if close is not None:
+            close()
+
+
+_default_session = None
+_default_http_pool = None
+_default_lock = threading.Lock()
+
+
+def get_default_session():
+    """Get the process-wide Spotify session configured in Config"""
+    global _default_session
+    with _default_lock:
+        if _default_session is None:
+            _default_session = build_spotify_session(Config.SPOTIFY_HTTP_POOL_SIZE)
+        return _default_session
+
+
+def get_default_http_pool():
+    """Get the process-wide YouTube transport pool configured in Config"""
+    global _default_http_pool
+    with _default_lock:
+        if _default_http_pool is None:
+            _default_http_pool = HttpPool(Config.YOUTUBE_HTTP_POOL_SIZE,
+                                          timeout=Config.HTTP_TIMEOUT)
+        return _default_http_pool
@@ -0,0 +1,192 @@
+"""
+Video Cache Module
+Persists resolved song-to-video lookups in a local SQLite database so repeated
+conversions don't spend search quota on songs that were already resolved
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from config import Config
+import metrics
+
+
+def normalize_query(query):
+    """Normalize a search query into a cache key"""
+    return re.sub(r'\s+', ' ', query.casefold()).strip()
+
+
+class VideoCache:
+    """SQLite-backed cache of search query to YouTube video ID"""
+
+    # How many writes happen between LRU eviction passes
+    EVICT_INTERVAL = 64
+
+    def __init__(self, path, ttl, negative_ttl, max_entries):
+        """
+        Open (or create) the cache database
+
+        Args:
+            path: Path of the SQLite database file
+            ttl: Seconds a found video ID stays valid
+            negative_ttl: Seconds a "not found" result stays valid
+            max_entries: Maximum number of entries kept before LRU eviction
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.reopen()
+
+    def reopen(self):
+        """Open a new connection, e.g. in a child process after fork()"""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS videos ('
+                'key TEXT PRIMARY KEY, '
+                'video_id TEXT, '
+                'created_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS videos_accessed_at ON videos (accessed_at)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS leases ('
+                'key TEXT PRIMARY KEY, '
+                'expires_at REAL NOT NULL)'
+            )
+
+    def get(self, query):
+        """
+        Look up a query in the cache
+
+        Args:
+            query: Search query string (e.g., "Artist - Song Name")
+
+        Returns:
+            Tuple of (hit, video_id). video_id is None for a cached "not found".
+        """
+        with metrics.timed('cache_lookup'):
+            hit, video_id = self._get(normalize_query(query))
+        metrics.CACHE_LOOKUPS.inc(1, 'hit' if hit else 'miss')
+        return hit, video_id
+
+    def _get(self, key):
+        """Look up a normalized key, see get"""
+        now = time.time()
+
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT video_id, created_at FROM videos WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+
+            video_id, created_at = row
+            ttl = self.ttl if video_id else self.negative_ttl
+            if now - created_at > ttl:
+                self._conn.execute('DELETE FROM videos WHERE key = ?', (key,))
+                return False, None
+
+            self._conn.execute(
+                'UPDATE videos SET accessed_at = ? WHERE key = ?', (now, key)
+            )
+            return True, video_id
+
+    def set(self, query, video_id):
+        """
+        Store a lookup result
+
+        Args:
+            query: Search query string
+            video_id: Resolved video ID, or None to cache a "not found"
+        """
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO videos (key, video_id, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?)',
+                (key, video_id, now, now)
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_INTERVAL == 0:
+                self._evict()
+
+    def acquire_lease(self, key, ttl):
+        """
+        Claim a key so other processes wait instead of resolving it too
+
+        Args:
+            key: Key to claim
+            ttl: Seconds after which the claim lapses if never released
+
+        Returns:
+            True if the lease was acquired
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM leases WHERE key = ? AND expires_at < ?', (key, now)
+            )
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)',
+                (key, now + ttl)
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, key):
+        """Release a lease taken with acquire_lease"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM leases WHERE key = ?', (key,))
+
+    def _evict(self):
+        """Drop the least recently used entries beyond max_entries"""
+        self._conn.execute(
+            'DELETE FROM videos WHERE key IN ('
+            'SELECT key FROM videos ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Get the process-wide cache configured in Config, or None if disabled"""
+    global _default_cache
+    if not Config.VIDEO_CACHE_PATH:
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = VideoCache(
+                Config.VIDEO_CACHE_PATH,
+                ttl=Config.VIDEO_CACHE_TTL,
+                negative_ttl=Config.VIDEO_CACHE_NEGATIVE_TTL,
+                max_entries=Config.VIDEO_CACHE_MAX_ENTRIES
+            )
+        return _default_cache
+
+
+def _reopen_default_cache():
+    """Give a forked child its own connection to the default cache"""
+    if _default_cache is not None:
+        _default_cache.reopen()
+
+
+# A SQLite connection must not be used across fork(), and the app opens the
+# cache at import, before gunicorn forks its preloaded workers
+os.register_at_fork(after_in_child=_reopen_default_cache)
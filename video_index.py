@@ -0,0 +1,254 @@
+"""
+Video Index Module
+Read-only, memory-mapped index of songs known to map to a YouTube video,
+built in bulk from a dump and consulted before any API call. Worker processes
+mapping the same file share one copy of it in the OS page cache.
+
+Usage:
+    python video_index.py dump.jsonl [more.csv ...] --output video_index.bin
+"""
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from config import Config
+import metrics
+from video_cache import normalize_query
+
+
+MAGIC = b'VIDXv1\0\0'
+# Magic and number of records
+HEADER = struct.Struct('>8sQ')
+# Key hash and video ID, sorted by hash
+RECORD = struct.Struct('>Q11s')
+_HASH = struct.Struct('>Q')
+VIDEO_ID = re.compile(r'[A-Za-z0-9_-]{11}')
+
+
+def isrc_key(isrc):
+    """Index key of a recording's ISRC"""
+    return 'isrc:' + isrc.replace('-', '').strip().upper()
+
+
+def query_key(query):
+    """Index key of an "Artist - Track Name" string"""
+    return 'query:' + normalize_query(query)
+
+
+def key_hash(key):
+    """
+    Hash an index key into the 64 bits stored per record
+
+    Only hashes are stored, so two keys sharing one would return the same
+    video; with a million keys the odds of any collision are about 1 in 40
+    million.
+    """
+    return _HASH.unpack(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest())[0]
+
+
+def row_keys(row):
+    """
+    Get the index keys of a dump row
+
+    Args:
+        row: Dict with an isrc, a query ("Artist - Track Name") and/or an
+            artist and title
+
+    Returns:
+        List of keys
+    """
+    keys = []
+    if row.get('isrc'):
+        keys.append(isrc_key(row['isrc']))
+    if row.get('query'):
+        keys.append(query_key(row['query']))
+    elif row.get('artist') and row.get('title'):
+        keys.append(query_key(f"{row['artist']} - {row['title']}"))
+    return keys
+
+
+def read_rows(path):
+    """
+    Read the rows of a dump
+
+    Args:
+        path: A .csv file with a header row, or a file of JSON objects one
+            per line
+
+    Yields:
+        Row dicts
+    """
+    with open(path, newline='', encoding='utf-8') as dump:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(dump)
+            return
+        for line in dump:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_index(rows, path):
+    """
+    Write an index file from dump rows
+
+    The file is written aside and then moved into place, so processes that
+    have the previous version mapped keep reading it undisturbed.
+
+    Args:
+        rows: Iterable of row dicts with a video_id, see row_keys
+        path: Path of the index file
+
+    Returns:
+        Tuple of (records written, rows skipped). Rows without a valid video
+        ID or any key are skipped; for a key in several rows the last wins.
+    """
+    entries = {}
+    skipped = 0
+    for row in rows:
+        video_id = (row.get('video_id') or '').strip()
+        keys = row_keys(row)
+        if not keys or not VIDEO_ID.fullmatch(video_id):
+            skipped += 1
+            continue
+        for key in keys:
+            entries[key_hash(key)] = video_id.encode('ascii')
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as index:
+        index.write(HEADER.pack(MAGIC, len(entries)))
+        for item in sorted(entries.items()):
+            index.write(RECORD.pack(*item))
+    os.replace(temp_path, path)
+    return len(entries), skipped
+
+
+class VideoIndex:
+    """Memory-mapped index file of key hash to video ID, see build_index"""
+
+    def __init__(self, path):
+        """
+        Map an index file
+
+        Args:
+            path: Path of a file written by build_index
+        """
+        self.path = path
+        with open(path, 'rb') as index:
+            self._map = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        valid = len(self._map) >= HEADER.size
+        if valid:
+            magic, self.count = HEADER.unpack_from(self._map)
+            valid = magic == MAGIC and len(self._map) == HEADER.size + self.count * RECORD.size
+        if not valid:
+            self._map.close()
+            raise ValueError(f"{path} is not a video index")
+
+    def __len__(self):
+        return self.count
+
+    def get(self, key):
+        """
+        Look up an index key
+
+        Returns:
+            The video ID, or None if the key isn't indexed
+        """
+        target = key_hash(key)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if _HASH.unpack_from(self._map, HEADER.size + middle * RECORD.size)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            found, video_id = RECORD.unpack_from(self._map, HEADER.size + low * RECORD.size)
+            if found == target:
+                return video_id.decode('ascii')
+        return None
+
+    def lookup(self, query):
+        """
+        Look up a song string
+
+        Args:
+            query: Search query string (e.g., "Artist - Song Name")
+
+        Returns:
+            The video ID, or None if the song isn't indexed
+        """
+        return self._count(self.get(query_key(query)))
+
+    def lookup_track(self, track):
+        """
+        Look up a track record by its ISRC, then by its artist and name
+
+        Args:
+            track: Track record from SpotifyService.iter_playlist_track_records
+
+        Returns:
+            The video ID, or None if the track isn't indexed
+        """
+        video_id = None
+        if track.get('isrc'):
+            video_id = self.get(isrc_key(track['isrc']))
+        if video_id is None:
+            video_id = self.get(query_key(track['query']))
+        return self._count(video_id)
+
+    @staticmethod
+    def _count(video_id):
+        """Count a lookup's result"""
+        metrics.INDEX_LOOKUPS.inc(1, 'miss' if video_id is None else 'hit')
+        return video_id
+
+    def close(self):
+        """Unmap the file"""
+        self._map.close()
+
+
+_default_index = None
+_default_index_loaded = False
+_default_index_lock = threading.Lock()
+
+
+def get_default_index():
+    """Get the process-wide index configured in Config, or None if there is none"""
+    global _default_index, _default_index_loaded
+    if not Config.VIDEO_INDEX_PATH:
+        return None
+
+    with _default_index_lock:
+        if not _default_index_loaded:
+            _default_index_loaded = True
+            try:
+                _default_index = VideoIndex(Config.VIDEO_INDEX_PATH)
+                print(f"Loaded video index of {len(_default_index)} keys")
+            except (OSError, ValueError) as e:
+                # Songs are still resolved through the cache and the API
+                print(f"Video index not loaded: {str(e)}")
+        return _default_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a video index from JSONL or CSV dumps')
+    parser.add_argument('dumps', nargs='+', help='Dump files; later rows win')
+    parser.add_argument('--output', default=Config.VIDEO_INDEX_PATH or 'video_index.bin')
+    args = parser.parse_args()
+
+    rows = (row for dump in args.dumps for row in read_rows(dump))
+    written, skipped = build_index(rows, args.output)
+    print(f"Wrote {written} keys to {args.output}, skipped {skipped} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,288 @@
 YouTube Service Module
 Handles all YouTube API interactions including authentication, search, and playlist creation
 """
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+import json
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+import httplib2
+from google.auth import exceptions
+from google_auth_httplib2 import AuthorizedHttp
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
 from config import Config
+import metrics
+from matcher import best_candidate, parse_duration
+from quota import (DELETE_COST, INSERT_COST, LIST_COST, SEARCH_COST, QuotaExceededError,
+                   get_default_scheduler, is_transient)
+from singleflight import get_default_group
+from tokens import YOUTUBE
+from transport import get_default_http_pool
+from video_cache import get_default_cache, normalize_query
+from video_index import get_default_index
+
+
+# Google recommends at most 50 calls per batch request
+MAX_BATCH_SIZE = 50
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+
+def get_discovery_document():
+    """
+    Get the parsed YouTube discovery document, loaded once per process
+    
+    Reads Config.YOUTUBE_DISCOVERY_DOC if set, otherwise the document bundled
+    with google-api-python-client, so building a client never hits the network.
+    """
+    global _discovery_document
+    with _discovery_lock:
+        if _discovery_document is None:
+            if Config.YOUTUBE_DISCOVERY_DOC:
+                with open(Config.YOUTUBE_DISCOVERY_DOC) as f:
+                    content = f.read()
+            else:
+                content = get_static_doc(Config.YOUTUBE_API_SERVICE_NAME,
+                                         Config.YOUTUBE_API_VERSION)
+            if content is None:
+                raise Exception("YouTube discovery document not found")
+            
+            document = json.loads(content)
+            # Building resources fills in method parameters in place. Do it once
+            # here so later concurrent builds only overwrite existing keys.
+            client = build_from_document(document, http=httplib2.Http())
+            for resource in document.get('resources', {}):
+                getattr(client, resource)()
+            _discovery_document = document
+        return _discovery_document
+
+
+def search_params(query, max_results):
+    """Parameters of the search.list call looking up a query"""
+    return {'part': 'snippet', 'maxResults': max_results, 'q': query, 'type': 'video'}
+
+
+def first_video(response):
+    """Video ID of a search.list response's top result, None if it has none"""
+    return response['items'][0]['id']['videoId'] if response['items'] else None
+
+
+def video_flight_key(query, max_results):
+    """Single-flight key of a first-result lookup"""
+    return f"{max_results}:{normalize_query(query)}"
+
+
+def match_cache_key(track):
+    """Cache key of a track's ranked match, kept apart from first-result lookups"""
+    return f"match:{track['query']}"
+
+
+def match_flight_key(track):
+    """Single-flight key of a ranked match"""
+    return normalize_query(match_cache_key(track))
+
+
+def search_candidates(response):
+    """Turn a search.list response into match candidates without durations"""
+    return [
+        {
+            'video_id': item['id']['videoId'],
+            'title': item['snippet']['title'],
+            'channel': item['snippet']['channelTitle'],
+            'duration': None
+        }
+        for item in response['items']
+    ]
+
+
+def set_durations(candidates, details):
+    """Fill in candidate durations from a videos.list contentDetails response"""
+    durations = {
+        item['id']: parse_duration(item['contentDetails']['duration'])
+        for item in details['items']
+    }
+    for candidate in candidates:
+        candidate['duration'] = durations.get(candidate['video_id'])
+
+
+def duration_params(candidates):
+    """Parameters of the videos.list call fetching candidate durations"""
+    return {'part': 'contentDetails',
+            'id': ','.join(candidate['video_id'] for candidate in candidates)}
+
+
+def pick_match(track, candidates):
+    """Video ID of the best-scoring candidate, None if none scores high enough"""
+    best = best_candidate(track, candidates, Config.MATCH_MIN_SCORE)
+    return best['video_id'] if best else None
+
+
+class SongResults:
+    """
+    Outcome of each song added to a playlist, in song order
+    
+    Shared by YouTubeService and AsyncYouTubeService, so both report songs
+    the same way and return the result shape sync mode and bulk read.
+    """
+    
+    def __init__(self, progress_callback=None):
+        """
+        Args:
+            progress_callback: Optional callable(event, song, video_id)
+        """
+        self.progress_callback = progress_callback
+        self.added_count = 0
+        self.failed_songs = []
+        self.total_songs = 0
+        self.cache_hits = 0
+        self.quota_exceeded = False
+        self.results = []
+    
+    def notify(self, event, song, video_id):
+        """Report a song's progress to the callback"""
+        if self.progress_callback:
+            self.progress_callback(event, song, video_id)
+    
+    def record(self, song, video_id, cache_hit, status, item_id=None):
+        """
+        Record the outcome of a song
+        
+        Args:
+            song: Song string
+            video_id: The video it resolved to, or None
+            cache_hit: True if it was resolved without a search
+            status: 'added', 'insert_failed', 'not_found' or 'quota_exceeded'
+            item_id: The new playlist item, if it was added
+        """
+        if cache_hit:
+            self.cache_hits += 1
+        
+        if status == 'added':
+            self.added_count += 1
+            self.notify('added', song, video_id)
+            print(f"Added: {song}")
+        else:
+            self.failed_songs.append(song)
+            self.notify('failed', song, video_id)
+            if status == 'insert_failed':
+                print(f"Failed to add: {song}")
+            elif status == 'not_found':
+                print(f"Could not find: {song}")
+            else:
+                print(f"Skipped, out of quota: {song}")
+        
+        self.results.append({
+            'song': song,
+            'video_id': video_id,
+            'status': status,
+            'cache': 'hit' if cache_hit else 'miss',
+            'playlist_item_id': item_id
+        })
+    
+    def skip_remaining(self, songs):
+        """Record the songs not reached before the quota ran out"""
+        for song in songs:
+            self.total_songs += 1
+            if isinstance(song, dict):
+                song = song['query']
+            self.record(song, None, False, 'quota_exceeded')
+    
+    def to_dict(self):
+        """
+        Get the outcome as add_songs_to_playlist returns it
+        
+        Returns:
+            Dict with added_count, failed_songs, total_songs, cache_hits,
+            cache_misses, quota_exceeded and the per-song results list
+        """
+        return {
+            'added_count': self.added_count,
+            'failed_songs': self.failed_songs,
+            'total_songs': self.total_songs,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.total_songs - self.cache_hits,
+            'quota_exceeded': self.quota_exceeded,
+            'results': self.results
+        }
+
+
+def credentials_to_token(credentials):
+    """
+    Convert OAuth credentials to the token dict kept in a TokenStore
+    
+    Returns:
+        Dict with access_token, refresh_token, scopes and expires_at
+    """
+    expiry = credentials.expiry
+    return {
+        'access_token': credentials.token,
+        'refresh_token': credentials.refresh_token,
+        'scopes': list(credentials.scopes or Config.YOUTUBE_SCOPES),
+        # google-auth expiries are naive UTC datetimes
+        'expires_at': expiry.replace(tzinfo=timezone.utc).timestamp() if expiry else 0
+    }
+
+
+def _token_expiry(data):
+    """Get the naive UTC expiry google-auth expects from a token dict"""
+    if not data.get('expires_at'):
+        return None
+    return datetime.fromtimestamp(data['expires_at'], timezone.utc).replace(tzinfo=None)
+
+
+class StoredCredentials(Credentials):
+    """
+    Credentials of a session, refreshed through a TokenStore
+    
+    google-auth refreshes credentials shortly before they expire. Worker
+    threads sharing the credentials then wait for one refresh, and the new
+    token is saved for the session's other clients and processes.
+    """
+    
+    def __init__(self, store, sid, data):
+        """
+        Args:
+            store: TokenStore holding the session's token
+            sid: Session ID the token belongs to
+            data: The stored token dict
+        """
+        super().__init__(
+            token=data['access_token'],
+            refresh_token=data['refresh_token'],
+            token_uri=TOKEN_URI,
+            client_id=Config.YOUTUBE_CLIENT_ID,
+            client_secret=Config.YOUTUBE_CLIENT_SECRET,
+            scopes=data['scopes'],
+            expiry=_token_expiry(data)
+        )
+        self.store = store
+        self.sid = sid
+    
+    def refresh(self, request):
+        """Get a fresh token from the store, refreshing it there if needed"""
+        def refresh_stored(stored):
+            credentials = Credentials(
+                token=None,
+                refresh_token=stored['refresh_token'],
+                token_uri=TOKEN_URI,
+                client_id=Config.YOUTUBE_CLIENT_ID,
+                client_secret=Config.YOUTUBE_CLIENT_SECRET,
+                scopes=stored['scopes']
+            )
+            credentials.refresh(request)
+            return credentials_to_token(credentials)
+        
+        data = self.store.fresh(self.sid, YOUTUBE, refresh_stored, stale_token=self.token)
+        if data is None:
+            raise exceptions.RefreshError("Not authenticated with YouTube")
+        self.token = data['access_token']
+        self.expiry = _token_expiry(data)
 
 
 class YouTubeService:
@@ -15,9 +293,19 @@ class YouTubeService:
         """Initialize YouTube service"""
         self.credentials = None
         self.youtube = None
+        self.cache = get_default_cache()
+        self.index = get_default_index()
+        self.scheduler = get_default_scheduler()
+        self.flights = get_default_group(store=self.cache)
+        self.http_pool = get_default_http_pool()
+        self._channel_id = None
     
     def get_auth_flow(self, state=None):
         """Create and return OAuth flow for YouTube authentication"""
+        # Only the connect and callback routes need the flow, and importing it
+        # pulls in requests-oauthlib, so it isn't loaded with the module
+        from google_auth_oauthlib.flow import Flow
+        
         # Create credentials dict from config
         client_config = {
             "web": {
@@ -55,45 +343,215 @@ class YouTubeService:
         flow.fetch_token(code=code)
         return flow.credentials
     
+    def set_token_store(self, store, sid):
+        """
+        Authenticate the client with a session's token from a token store
+        
+        Args:
+            store: TokenStore holding the token
+            sid: Session ID the token belongs to
+        """
+        data = store.load(sid, YOUTUBE)
+        if data is None:
+            raise Exception("Not authenticated with YouTube")
+        self.set_credentials(StoredCredentials(store, sid, data))
+    
     def set_credentials(self, credentials):
         """Set credentials and build YouTube client"""
         self.credentials = credentials
-        self.youtube = build(
-            Config.YOUTUBE_API_SERVICE_NAME,
-            Config.YOUTUBE_API_VERSION,
+        self._channel_id = None
+        self.youtube = build_from_document(
+            get_discovery_document(),
             credentials=credentials
         )
     
-    def search_video(self, query, max_results=1):
+    def _authorized_http(self, http):
         """
-        Search for a video on YouTube
+        Wrap a pooled transport to send this service's credentials
+        
+        Transports are shared between users, so credentials are applied per
+        request rather than bound to a transport.
+        """
+        return AuthorizedHttp(self.credentials, http=http)
+    
+    def _execute(self, request, cost, calls=1, stage='youtube_request'):
+        """
+        Execute an API request over a pooled keep-alive transport
+        
+        The request goes through the quota scheduler, which charges its cost,
+        applies the rate limit and retries transient failures. Each attempt
+        checks out its own transport. Its latency is recorded under the given
+        metrics stage.
+        """
+        def attempt():
+            with self.http_pool.connection() as http:
+                return request.execute(http=self._authorized_http(http))
+        
+        with metrics.timed(stage):
+            return self.scheduler.call(cost, attempt, calls=calls)
+    
+    def predict_quota(self, song_count, unique_count=None, playlist_count=1):
+        """
+        Predict whether converting playlists fits in today's remaining quota
+        
+        The estimate is an upper bound: cached and indexed songs cost no
+        search units.
+        
+        Args:
+            song_count: Number of songs to insert
+            unique_count: Number of distinct songs to search for, defaults to
+                song_count
+            playlist_count: Number of playlists to create
+            
+        Returns:
+            Dict with estimated_units, remaining_units and fits
+        """
+        if unique_count is None:
+            unique_count = song_count
+        return self.scheduler.predict(
+            unique_count, song_count,
+            other_units=playlist_count * INSERT_COST + unique_count * LIST_COST
+        )
+    
+    def lookup_video(self, query, max_results=1):
+        """
+        Resolve a query to a video, reading the video index and cache first
+        
+        Concurrent lookups of the same query, from any user, share a single
+        upstream search.
         
         Args:
             query: Search query string (e.g., "Artist - Song Name")
             max_results: Maximum number of results to return
             
         Returns:
-            Video ID of the first result, or None if not found
+            Tuple of (video_id, cache_hit). video_id is None if not found.
         """
         if not self.youtube:
             raise Exception("Not authenticated with YouTube")
         
+        if self.index:
+            video_id = self.index.lookup(query)
+            if video_id:
+                return video_id, True
+        
+        if self.cache:
+            hit, video_id = self.cache.get(query)
+            if hit:
+                return video_id, True
+        
+        peek = None
+        if self.cache:
+            def peek():
+                hit, video_id = self.cache.get(query)
+                return hit, (video_id, True)
+        
+        lookup, _ = self.flights.do(
+            video_flight_key(query, max_results),
+            lambda: self._search(query, max_results),
+            peek
+        )
+        return lookup
+    
+    def _search(self, query, max_results):
+        """Run search.list for a query and cache the result"""
+        try:
+            request = self.youtube.search().list(**search_params(query, max_results))
+            response = self._execute(request, SEARCH_COST, stage='youtube_search')
+            video_id = first_video(response)
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            # Errors are not cached, the song is searched again next time
+            print(f"Error searching for '{query}': {str(e)}")
+            return None, False
+        
+        if self.cache:
+            self.cache.set(query, video_id)
+        return video_id, False
+    
+    def lookup_track(self, track):
+        """
+        Resolve a Spotify track record to its best-matching video
+        
+        Tracks in the video index, by ISRC or by artist and name, are
+        resolved without an API call. Otherwise fetches a small candidate set,
+        looks up their durations with one videos.list call and picks the
+        best-scored candidate.
+        
+        Args:
+            track: Track record from SpotifyService.iter_playlist_track_records
+            
+        Returns:
+            Tuple of (video_id, cache_hit). video_id is None if nothing matched.
+        """
+        if not self.youtube:
+            raise Exception("Not authenticated with YouTube")
+        
+        if self.index:
+            video_id = self.index.lookup_track(track)
+            if video_id:
+                return video_id, True
+        
+        cache_key = match_cache_key(track)
+        if self.cache:
+            hit, video_id = self.cache.get(cache_key)
+            if hit:
+                return video_id, True
+        
+        peek = None
+        if self.cache:
+            def peek():
+                hit, video_id = self.cache.get(cache_key)
+                return hit, (video_id, True)
+        
+        lookup, _ = self.flights.do(
+            match_flight_key(track),
+            lambda: self._match(track, cache_key),
+            peek
+        )
+        return lookup
+    
+    def _match(self, track, cache_key):
+        """Search candidates for a track, rank them and cache the winner"""
         try:
             request = self.youtube.search().list(
-                part="snippet",
-                maxResults=max_results,
-                q=query,
-                type="video"
+                **search_params(track['query'], Config.MATCH_CANDIDATES)
             )
-            response = request.execute()
+            response = self._execute(request, SEARCH_COST, stage='youtube_search')
             
-            if response['items']:
-                return response['items'][0]['id']['videoId']
-            else:
-                return None
+            candidates = search_candidates(response)
+            
+            if len(candidates) > 1:
+                request = self.youtube.videos().list(**duration_params(candidates))
+                details = self._execute(request, LIST_COST, stage='youtube_videos')
+                set_durations(candidates, details)
+            
+            video_id = pick_match(track, candidates)
+        except QuotaExceededError:
+            raise
         except Exception as e:
-            print(f"Error searching for '{query}': {str(e)}")
-            return None
+            # Errors are not cached, the song is searched again next time
+            print(f"Error matching '{track['query']}': {str(e)}")
+            return None, False
+        
+        if self.cache:
+            self.cache.set(cache_key, video_id)
+        return video_id, False
+    
+    def search_video(self, query, max_results=1):
+        """
+        Search for a video on YouTube
+        
+        Args:
+            query: Search query string (e.g., "Artist - Song Name")
+            max_results: Maximum number of results to return
+            
+        Returns:
+            Video ID of the first result, or None if not found
+        """
+        video_id, _ = self.lookup_video(query, max_results)
+        return video_id
     
     def create_playlist(self, title, description="", privacy_status="private"):
         """
@@ -122,9 +580,51 @@ class YouTubeService:
                 }
             }
         )
-        response = request.execute()
+        response = self._execute(request, INSERT_COST, stage='playlist_create')
         return response['id']
     
+    def _playlist_item_request(self, playlist_id, video_id, position=None):
+        """Build a playlistItems.insert request, optionally at a fixed position"""
+        snippet = {
+            "playlistId": playlist_id,
+            "resourceId": {
+                "kind": "youtube#video",
+                "videoId": video_id
+            }
+        }
+        if position is not None:
+            snippet["position"] = position
+        
+        return self.youtube.playlistItems().insert(
+            part="snippet",
+            body={"snippet": snippet}
+        )
+    
+    def insert_playlist_item(self, playlist_id, video_id, position=None):
+        """
+        Insert a video into a playlist
+        
+        Args:
+            playlist_id: YouTube playlist ID
+            video_id: YouTube video ID to add
+            position: Playlist position, or None to append
+            
+        Returns:
+            ID of the new playlist item, or None if the insert failed
+        """
+        if not self.youtube:
+            raise Exception("Not authenticated with YouTube")
+        
+        try:
+            request = self._playlist_item_request(playlist_id, video_id, position)
+            response = self._execute(request, INSERT_COST, stage='playlist_insert')
+            return response['id']
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            print(f"Error adding video {video_id} to playlist: {str(e)}")
+            return None
+    
     def add_video_to_playlist(self, playlist_id, video_id):
         """
         Add a video to a playlist
@@ -136,68 +636,359 @@ class YouTubeService:
         Returns:
             True if successful, False otherwise
         """
+        return self.insert_playlist_item(playlist_id, video_id) is not None
+    
+    def insert_playlist_items(self, playlist_id, video_ids, position=None):
+        """
+        Insert several videos into a playlist with one HTTP batch request
+        
+        The server may run batched calls in any order, so when position is
+        given each video is inserted at an explicit position to keep the
+        playlist in order. Items that fail with a transient error are retried
+        as single inserts at their own positions, and if the batch request
+        itself fails every video falls back to a single insert likewise.
+        
+        Args:
+            playlist_id: YouTube playlist ID
+            video_ids: YouTube video IDs to add, in playlist order
+            position: Playlist position of the first video, or None to append
+            
+        Returns:
+            List with the new playlist item ID per video, None where it failed
+        """
         if not self.youtube:
             raise Exception("Not authenticated with YouTube")
         
+        responses = [None] * len(video_ids)
+        errors = [None] * len(video_ids)
+        
+        def callback(request_id, response, exception):
+            responses[int(request_id)] = response
+            errors[int(request_id)] = exception
+        
+        batch = self.youtube.new_batch_http_request(callback=callback)
+        for index, video_id in enumerate(video_ids):
+            item_position = None if position is None else position + index
+            batch.add(self._playlist_item_request(playlist_id, video_id, item_position),
+                      request_id=str(index))
+        
+        batch_failed = False
         try:
-            request = self.youtube.playlistItems().insert(
-                part="snippet",
-                body={
-                    "snippet": {
-                        "playlistId": playlist_id,
-                        "resourceId": {
-                            "kind": "youtube#video",
-                            "videoId": video_id
-                        }
-                    }
-                }
-            )
-            request.execute()
-            return True
+            self._execute(batch, INSERT_COST * len(video_ids), calls=len(video_ids),
+                          stage='playlist_insert_batch')
+        except QuotaExceededError:
+            raise
         except Exception as e:
-            print(f"Error adding video {video_id} to playlist: {str(e)}")
+            print(f"Batch insert failed, falling back to single inserts: {str(e)}")
+            batch_failed = True
+        
+        item_ids = []
+        for video_id, response, error in zip(video_ids, responses, errors):
+            if not batch_failed and error is None:
+                item_ids.append(response['id'])
+            elif batch_failed or is_transient(error):
+                # Retried in place, after the videos inserted before it
+                item_position = None
+                if position is not None:
+                    item_position = position + sum(1 for item_id in item_ids if item_id)
+                item_ids.append(self.insert_playlist_item(playlist_id, video_id, item_position))
+            else:
+                print(f"Error adding video {video_id} to playlist: {str(error)}")
+                item_ids.append(None)
+        return item_ids
+    
+    def add_videos_to_playlist(self, playlist_id, video_ids, position=None):
+        """
+        Add several videos to a playlist with one HTTP batch request
+        
+        Args:
+            playlist_id: YouTube playlist ID
+            video_ids: YouTube video IDs to add, in playlist order
+            position: Playlist position of the first video, or None to append
+            
+        Returns:
+            List of booleans, one per video ID, True if it was added
+        """
+        item_ids = self.insert_playlist_items(playlist_id, video_ids, position)
+        return [item_id is not None for item_id in item_ids]
+    
+    def playlist_exists(self, playlist_id):
+        """Check whether a playlist still exists on the user's channel"""
+        if not self.youtube:
+            raise Exception("Not authenticated with YouTube")
+        
+        request = self.youtube.playlists().list(part="id", id=playlist_id)
+        response = self._execute(request, LIST_COST, stage='playlist_lookup')
+        return bool(response['items'])
+    
+    def remove_playlist_item(self, playlist_item_id):
+        """
+        Remove an item from a playlist
+        
+        Args:
+            playlist_item_id: ID of the playlist item, not the video
+            
+        Returns:
+            True if the item was removed or was already gone, False otherwise
+        """
+        if not self.youtube:
+            raise Exception("Not authenticated with YouTube")
+        
+        try:
+            request = self.youtube.playlistItems().delete(id=playlist_item_id)
+            self._execute(request, DELETE_COST, stage='playlist_delete')
+            return True
+        except QuotaExceededError:
+            raise
+        except HttpError as e:
+            if e.resp.status == 404:
+                return True
+            print(f"Error removing playlist item {playlist_item_id}: {str(e)}")
             return False
     
-    def create_playlist_from_songs(self, playlist_name, songs, description=""):
+    def list_playlist_items(self, playlist_id):
+        """
+        List the items of a playlist
+        
+        Args:
+            playlist_id: YouTube playlist ID
+            
+        Returns:
+            List of (playlist_item_id, video_id) in playlist order
+        """
+        if not self.youtube:
+            raise Exception("Not authenticated with YouTube")
+        
+        items = []
+        page_token = None
+        while True:
+            request = self.youtube.playlistItems().list(
+                part="contentDetails",
+                playlistId=playlist_id,
+                maxResults=50,
+                pageToken=page_token
+            )
+            response = self._execute(request, LIST_COST, stage='playlist_items_list')
+            items.extend((item['id'], item['contentDetails']['videoId'])
+                         for item in response['items'])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return items
+    
+    def get_channel_id(self):
+        """Get the ID of the authenticated user's channel, fetched once per client"""
+        if not self.youtube:
+            raise Exception("Not authenticated with YouTube")
+        
+        if self._channel_id is None:
+            request = self.youtube.channels().list(part="id", mine=True)
+            response = self._execute(request, LIST_COST, stage='channel_lookup')
+            if not response['items']:
+                raise Exception("No YouTube channel found for this account")
+            self._channel_id = response['items'][0]['id']
+        return self._channel_id
+    
+    def create_playlist_from_songs(self, playlist_name, songs, description="",
+                                   progress_callback=None, checkpoint=None,
+                                   executor=None, resolver=None):
         """
         Create a YouTube playlist and populate it with songs
         
         Args:
             playlist_name: Name for the new playlist
-            songs: List of song strings to search for and add
+            songs: Iterable of song strings or Spotify track records
             description: Playlist description
+            progress_callback: Optional callable(event, song, video_id), see
+                add_songs_to_playlist
+            checkpoint: Optional Checkpoint recording progress. If it already
+                has a playlist that still exists, the conversion continues in
+                that playlist instead of creating a new one.
+            executor: Optional shared executor for searches, see
+                add_songs_to_playlist
+            resolver: Optional callable replacing the search, see
+                add_songs_to_playlist
             
         Returns:
-            Dict with playlist_id, added_count, failed_songs
+            Dict with playlist_id, added_count, failed_songs, total_songs,
+            cache_hits, cache_misses, quota_exceeded and a per-song results list
         """
         if not self.youtube:
             raise Exception("Not authenticated with YouTube")
         
-        # Create the playlist
-        playlist_id = self.create_playlist(playlist_name, description)
+        playlist_id = checkpoint.youtube_playlist_id if checkpoint else None
+        if playlist_id and self.playlist_exists(playlist_id):
+            # Resuming: inserts that landed before a crash count as done
+            items = self.list_playlist_items(playlist_id)
+            checkpoint.reconcile(items)
+            start_position = len(items)
+        else:
+            # Create the playlist
+            playlist_id = self.create_playlist(playlist_name, description)
+            if checkpoint:
+                checkpoint.set_playlist_id(playlist_id)
+            # The playlist is new, so inserts can be placed from position 0
+            start_position = 0
         
-        added_count = 0
-        failed_songs = []
+        result = self.add_songs_to_playlist(playlist_id, songs, progress_callback,
+                                            start_position=start_position,
+                                            checkpoint=checkpoint,
+                                            executor=executor,
+                                            resolver=resolver)
+        result['playlist_id'] = playlist_id
+        return result
+    
+    def add_songs_to_playlist(self, playlist_id, songs, progress_callback=None,
+                              start_position=None, checkpoint=None,
+                              executor=None, resolver=None):
+        """
+        Search for songs and add them to an existing playlist
         
-        # Add each song
-        for song in songs:
-            video_id = self.search_video(song)
+        Searches run concurrently on a bounded worker pool while a single
+        writer inserts the found videos in the original song order, in HTTP
+        batches when Config.YOUTUBE_INSERT_BATCH_SIZE is above 1.
+        
+        Args:
+            playlist_id: YouTube playlist ID
+            songs: Iterable of song strings or Spotify track records. Records
+                are matched against ranked candidates, strings use the first
+                search result.
+            progress_callback: Optional callable(event, song, video_id) invoked
+                with 'resolved', 'added' or 'failed' as each song progresses
+            start_position: Playlist length before the first insert, used to
+                place batched inserts in order. None appends one insert at a
+                time, as batched inserts without positions may land in any
+                order.
+            checkpoint: Optional Checkpoint. Songs it has as added are skipped
+                and songs it has resolved are inserted without searching again;
+                new progress is recorded as it happens.
+            executor: Optional executor shared with other conversions to run
+                searches on, instead of a pool of this call's own
+            resolver: Optional callable(song, track) returning
+                (video_id, cache_hit), used instead of lookup_video and
+                lookup_track, e.g. to share lookups between playlists
             
-            if video_id:
-                success = self.add_video_to_playlist(playlist_id, video_id)
-                if success:
-                    added_count += 1
-                    print(f"Added: {song}")
-                else:
-                    failed_songs.append(song)
-                    print(f"Failed to add: {song}")
+        Returns:
+            Dict with added_count, failed_songs, total_songs, cache_hits,
+            cache_misses, quota_exceeded and a per-song results list that
+            includes each new playlist_item_id. If the daily quota runs out,
+            the remaining songs are reported as failed without further API
+            calls.
+        """
+        if not self.youtube:
+            raise Exception("Not authenticated with YouTube")
+        
+        outcome = SongResults(progress_callback)
+        # Inserts made by this call, which decide where the next one goes
+        inserted_count = 0
+        
+        workers = max(1, Config.YOUTUBE_SEARCH_WORKERS)
+        # Only keep a bounded window of searches in flight ahead of the writer
+        window = workers * 2
+        pending = deque()
+        batch_size = min(max(1, Config.YOUTUBE_INSERT_BATCH_SIZE), MAX_BATCH_SIZE)
+        # Resolved songs waiting to be written, as
+        # (index, song, video_id, cache_hit, playlist_item_id)
+        buffered = deque()
+        
+        def resolve(index, song, track):
+            if resolver is not None:
+                lookup = tuple(resolver(song, track))
+            elif track is None:
+                lookup = self.lookup_video(song)
             else:
-                failed_songs.append(song)
-                print(f"Could not find: {song}")
+                lookup = self.lookup_track(track)
+            if checkpoint:
+                checkpoint.record_resolved(index, song, lookup[0])
+            outcome.notify('resolved', song, lookup[0])
+            return lookup + (None,)
         
-        return {
-            'playlist_id': playlist_id,
-            'added_count': added_count,
-            'failed_songs': failed_songs,
-            'total_songs': len(songs)
-        }
+        def resume(song, state):
+            # Checkpointed songs skip the search, and the insert if it landed
+            outcome.notify('resolved', song, state['video_id'])
+            lookup = Future()
+            item_id = state['playlist_item_id'] if state['status'] == 'added' else None
+            lookup.set_result((state['video_id'], True, item_id))
+            return lookup
+        
+        def flush():
+            nonlocal inserted_count
+            video_ids = [video_id for _, _, video_id, _, item_id in buffered
+                         if video_id and not item_id]
+            if len(video_ids) > 1 and start_position is not None:
+                position = start_position + inserted_count
+                item_ids = iter(self.insert_playlist_items(playlist_id, video_ids, position))
+            else:
+                item_ids = (self.insert_playlist_item(playlist_id, video_id)
+                            for video_id in video_ids)
+            
+            # Songs leave the buffer only once written, so a quota error
+            # midway leaves the unwritten ones in place
+            while buffered:
+                index, song, video_id, cache_hit, item_id = buffered[0]
+                if item_id:
+                    status = 'added'
+                    index = None
+                elif video_id:
+                    item_id = next(item_ids)
+                    status = 'added' if item_id else 'insert_failed'
+                    if item_id:
+                        inserted_count += 1
+                else:
+                    status = 'not_found'
+                buffered.popleft()
+                if checkpoint and index is not None:
+                    checkpoint.record_written(index, status, item_id)
+                outcome.record(song, video_id, cache_hit, status, item_id)
+        
+        def write():
+            # A song leaves pending only once its lookup is buffered, so a
+            # quota error from the search leaves it to be reported with the rest
+            index, song, future = pending[0]
+            buffered.append((index, song) + tuple(future.result()))
+            pending.popleft()
+            if len(buffered) >= batch_size:
+                flush()
+        
+        songs = iter(songs)
+        if executor is None:
+            pool = ThreadPoolExecutor(max_workers=workers)
+        else:
+            pool = nullcontext(executor)
+        with pool as executor:
+            try:
+                for index, song in enumerate(songs):
+                    outcome.total_songs += 1
+                    if isinstance(song, dict):
+                        track, song = song, song['query']
+                    else:
+                        track = None
+                    state = checkpoint.get(index, song) if checkpoint else None
+                    if state:
+                        future = resume(song, state)
+                    else:
+                        future = metrics.submit(executor, resolve, index, song, track)
+                    pending.append((index, song, future))
+                    if len(pending) >= window:
+                        write()
+                
+                while pending:
+                    write()
+                flush()
+            except QuotaExceededError as e:
+                outcome.quota_exceeded = True
+                print(f"Stopping conversion: {str(e)}")
+                for _, _, future in pending:
+                    future.cancel()
+        
+        if outcome.quota_exceeded:
+            # Everything not written yet fails without spending more quota;
+            # the checkpoint keeps what was resolved for a later resume
+            for _, song, video_id, cache_hit, item_id in buffered:
+                # Songs resumed as already inserted stay added
+                status = 'added' if item_id else 'quota_exceeded'
+                outcome.record(song, video_id, cache_hit, status, item_id)
+            for _, song, _ in pending:
+                outcome.record(song, None, False, 'quota_exceeded')
+            outcome.skip_remaining(songs)
+        
+        return outcome.to_dict()